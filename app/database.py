@@ -1,21 +1,21 @@
-import os
-from pathlib import Path
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING, Optional
 
-# Load .env from the backend directory
-env_path = Path(__file__).resolve().parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
+from app.settings import get_settings
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+if TYPE_CHECKING:
+    from supabase import Client
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in environment variables")
+_supabase: Optional["Client"] = None
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
+def get_supabase() -> "Client":
+    """Get Supabase client instance (created on first use)"""
+    global _supabase
+    if _supabase is None:
+        settings = get_settings()
+        if not settings.supabase_url or not settings.supabase_service_role_key:
+            raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in environment variables")
 
-def get_supabase() -> Client:
-    """Get Supabase client instance"""
-    return supabase
+        from supabase import create_client
+        _supabase = create_client(settings.supabase_url, settings.supabase_service_role_key)
+    return _supabase
@@ -0,0 +1 @@
+# ASGI middleware, added to the app in main.py
@@ -0,0 +1,73 @@
+import json
+from typing import Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class _TooLarge(Exception):
+    pass
+
+
+class BodyLimitMiddleware:
+    """
+    Reject request bodies over `max_bytes` with 413 before the app reads them.
+
+    A declared Content-Length over the limit is refused without reading the
+    body; a chunked body is counted as it arrives and refused once it goes
+    over. Paths under `exempt` (batch uploads, limited per file) pass through.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int, exempt: Tuple[str, ...] = ()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.exempt = exempt
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        started = rejected = False
+
+        async def receive_limited() -> Message:
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # answer now: the app turns a failed body read into its own 400
+                    if not started and not rejected:
+                        rejected = True
+                        await self._reject(send)
+                    raise _TooLarge()
+            return message
+
+        async def send_tracked(message: Message) -> None:
+            nonlocal started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_limited, send_tracked)
+        except _TooLarge:
+            pass
+
+    @staticmethod
+    async def _reject(send: Send) -> None:
+        body = json.dumps({"detail": "Request body too large"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
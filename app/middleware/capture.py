@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+API_PREFIX = "/api/v1"
+
+_fields: ContextVar[Optional[dict]] = ContextVar("capture_fields", default=None)
+
+
+def annotate(**fields: Any) -> None:
+    """
+    Add shape details (sizes, counts, flags) to the captured record of the
+    current request. No-op when capture is off or the request is not sampled.
+    Never pass message text, audio or user identifiers; use `pseudonym()`.
+    """
+    current = _fields.get()
+    if current is not None:
+        current.update(fields)
+
+
+def pseudonym(value: Any) -> str:
+    """Stable, non-reversible stand-in for an identifier (thread id, audio hash)"""
+    key = get_settings().capture_salt[:64]
+    return hashlib.blake2b(str(value).encode(), key=key, digest_size=8).hexdigest()
+
+
+def route_template(scope: Scope) -> str:
+    """Full path template of the matched route, e.g. /api/v1/chat/threads/{thread_id}"""
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return "<unmatched>"
+    # routes of included routers may carry only their own prefix; take the
+    # outer prefix from the concrete path, which has the same segment count
+    segments = scope["path"].rstrip("/").split("/")
+    depth = len(template.rstrip("/").split("/")) - 1
+    return "/".join(segments[:len(segments) - depth]) + template
+
+
+class CaptureWriter:
+    """Append one JSON line per record; opened on first write"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+
+    def write(self, record: dict) -> None:
+        try:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            # one short write per line keeps records from several workers intact
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+        except OSError as e:
+            logger.warning("Request capture write failed: %s", repr(e))
+
+
+class RequestCaptureMiddleware:
+    """
+    Record anonymized request shapes for replay (bench/replay.py).
+
+    Each sampled API request becomes one JSONL record: arrival time, route
+    template, pseudonymized path parameters, request/response sizes, status
+    and timings, plus whatever the handler added with `annotate()` (message
+    length, history depth, audio size and duration). Bodies, headers, query
+    values and user ids are never recorded.
+    """
+
+    def __init__(self, app: ASGIApp, path: Path, sample_rate: float = 1.0):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.writer = CaptureWriter(path)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not scope["path"].startswith(API_PREFIX)
+            or random.random() >= self.sample_rate
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        fields: dict = {}
+        token = _fields.set(fields)
+        arrived_at = time.time()
+        start = time.perf_counter()
+        sizes = {"request": 0, "response": 0}
+        timings = {"first_byte": None}
+        status = {"code": 500}
+
+        async def receive_counted() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                if timings["first_byte"] is None:
+                    timings["first_byte"] = time.perf_counter() - start
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            _fields.reset(token)
+            self.writer.write({
+                "ts": round(arrived_at, 3),
+                "method": scope["method"],
+                "route": route_template(scope),
+                "params": {name: pseudonym(value) for name, value in scope.get("path_params", {}).items()},
+                "status": status["code"],
+                "request_bytes": sizes["request"],
+                "response_bytes": sizes["response"],
+                "ttfb_ms": round(timings["first_byte"] * 1000, 1) if timings["first_byte"] is not None else None,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                **fields,
+            })
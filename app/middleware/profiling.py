@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Handlers worth profiling: chat (send_message -> chat_stream) and STT
+DEFAULT_PROFILE_PATHS = ["/api/v1/chat/send", "/api/v1/stt/"]
+
+PROFILE_SUFFIX = ".speedscope.json"
+
+
+class ProfilingControl:
+    """
+    Profiling switch shared by all server workers.
+
+    The admin API writes `control.json` in the profile directory; every
+    worker re-reads it at most once per second, so a toggle reaches all
+    processes without restarts.
+    """
+
+    def __init__(self, profile_dir: Path, max_files: int):
+        self.profile_dir = profile_dir
+        self.max_files = max_files
+        self.path = profile_dir / "control.json"
+        self._state = self._default()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _default() -> dict:
+        return {"enabled": False, "sample_rate": 0.0, "paths": DEFAULT_PROFILE_PATHS, "until": None}
+
+    def current(self) -> dict:
+        now = time.monotonic()
+        if now - self._checked_at >= 1.0:
+            self._checked_at = now
+            try:
+                mtime = self.path.stat().st_mtime
+                if mtime != self._mtime:
+                    self._state = {**self._default(), **json.loads(self.path.read_text())}
+                    self._mtime = mtime
+            except (OSError, ValueError):
+                self._state, self._mtime = self._default(), None
+
+        until = self._state.get("until")
+        if self._state["enabled"] and until is not None and time.time() > until:
+            return {**self._state, "enabled": False}
+        return self._state
+
+    def update(
+        self,
+        enabled: bool,
+        sample_rate: float,
+        paths: Optional[List[str]] = None,
+        duration_s: Optional[float] = None,
+    ) -> dict:
+        state = {
+            "enabled": enabled,
+            "sample_rate": sample_rate,
+            "paths": paths or DEFAULT_PROFILE_PATHS,
+            "until": time.time() + duration_s if enabled and duration_s else None,
+        }
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(state))
+        os.replace(tmp_path, self.path)
+        self._checked_at = 0.0
+        return self.current()
+
+    def should_profile(self, path: str) -> bool:
+        state = self.current()
+        return (
+            state["enabled"]
+            and any(path.startswith(prefix) for prefix in state["paths"])
+            and random.random() < state["sample_rate"]
+        )
+
+    def list_profiles(self) -> List[dict]:
+        if not self.profile_dir.exists():
+            return []
+        files = sorted(self.profile_dir.glob(f"*{PROFILE_SUFFIX}"), key=lambda f: f.stat().st_mtime, reverse=True)
+        return [
+            {"name": f.name, "bytes": f.stat().st_size, "created_at": datetime.utcfromtimestamp(f.stat().st_mtime).isoformat()}
+            for f in files
+        ]
+
+    def profile_path(self, name: str) -> Optional[Path]:
+        path = self.profile_dir / name
+        if "/" in name or not name.endswith(PROFILE_SUFFIX) or not path.is_file():
+            return None
+        return path
+
+    def save(self, profiler, method: str, path: str, duration_ms: float) -> Path:
+        """Write a speedscope profile (open in speedscope.app) and prune old ones"""
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        slug = re.sub(r"[^a-zA-Z0-9]+", "-", path).strip("-")[:60]
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        target = self.profile_dir / f"{stamp}-{method.lower()}-{slug}-{duration_ms:.0f}ms{PROFILE_SUFFIX}"
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        target.write_text(profiler.output(renderer=SpeedscopeRenderer()))
+
+        for old in self.list_profiles()[self.max_files:]:
+            (self.profile_dir / old["name"]).unlink(missing_ok=True)
+        return target
+
+
+class ProfilingMiddleware:
+    """
+    Sample requests with pyinstrument while profiling is switched on.
+
+    The profiler runs in async mode, so time spent awaiting upstreams is
+    attributed to the awaiting code, and it covers the whole response
+    including streamed bodies. When off, a request costs one cached check.
+    """
+
+    def __init__(self, app: ASGIApp, control: "ProfilingControl"):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.control.should_profile(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("Profiling is on but pyinstrument is not installed")
+            await self.app(scope, receive, send)
+            return
+
+        profiler = Profiler(interval=0.001, async_mode="enabled")
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            duration_ms = (time.perf_counter() - start) * 1000
+            try:
+                # rendering walks the whole call tree, keep it off the loop
+                await asyncio.to_thread(self.control.save, profiler, scope["method"], scope["path"], duration_ms)
+            except Exception as e:
+                logger.warning("Saving profile failed: %s", repr(e))
+
+
+# Singleton instance
+settings = get_settings()
+profiling_control = ProfilingControl(settings.profile_dir, settings.profile_max_files)
+
+
+def get_profiling_control() -> ProfilingControl:
+    """Get profiling control instance"""
+    return profiling_control
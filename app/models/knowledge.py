@@ -0,0 +1,22 @@
+"""
+Knowledge base sections, for KNOWLEDGE_SOURCE=database.
+
+Supabase Tables:
+
+CREATE TABLE knowledge_sections (
+    name VARCHAR(100) PRIMARY KEY,  -- e.g. core, celengan, title
+    content TEXT NOT NULL,          -- markdown with front matter, as in app/knowledge/*.md
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Backend only: no user policies
+ALTER TABLE knowledge_sections ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access knowledge" ON knowledge_sections
+    FOR ALL USING (auth.role() = 'service_role');
+
+The table replaces the whole directory: it must hold a core section
+(`always: true`) and every required prompt, or the load is rejected and the
+running version stays in use. Edits take effect on each worker's next
+reload (KNOWLEDGE_RELOAD_INTERVAL) or via POST /api/v1/admin/knowledge/reload.
+"""
@@ -0,0 +1,63 @@
+"""
+Full-text search over messages, for SEARCH_BACKEND=postgres.
+
+Supabase Tables (additions to app/models/thread.py):
+
+-- 'indonesian' is a built-in Snowball configuration (check with \\dF).
+-- An expression index: adding a stored tsvector column would rewrite the
+-- whole table under an ACCESS EXCLUSIVE lock. CONCURRENTLY builds it while
+-- messages keep being written, but cannot run inside a transaction block:
+-- run this statement on its own (a separate SQL editor run or migration
+-- step without a transaction), before the function below.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_content_fts
+    ON messages USING GIN (to_tsvector('indonesian', content));
+
+-- Best `p_limit` messages of one user's threads matching a web-style query
+-- ("modal usaha", "celengan -lebaran", "\"tarik tunai\""); snippets are only
+-- built for the returned rows
+CREATE OR REPLACE FUNCTION search_messages(p_user_id UUID, p_query TEXT, p_limit INTEGER DEFAULT 50)
+RETURNS TABLE (
+    thread_id UUID,
+    thread_title VARCHAR,
+    message_id UUID,
+    role VARCHAR,
+    created_at TIMESTAMP WITH TIME ZONE,
+    rank REAL,
+    snippet TEXT
+)
+LANGUAGE SQL STABLE AS $$
+    WITH query AS (
+        SELECT websearch_to_tsquery('indonesian', p_query) AS q
+    ),
+    hits AS (
+        SELECT m.thread_id, t.title, m.id, m.role, m.created_at, m.content,
+            ts_rank_cd(to_tsvector('indonesian', m.content), query.q) AS rank
+        FROM messages m
+        JOIN threads t ON t.id = m.thread_id
+        CROSS JOIN query
+        -- the same expression as the index, so the planner can use it
+        WHERE t.user_id = p_user_id AND to_tsvector('indonesian', m.content) @@ query.q
+        ORDER BY rank DESC, m.created_at DESC
+        LIMIT p_limit
+    )
+    SELECT hits.thread_id, hits.title, hits.id, hits.role, hits.created_at, hits.rank,
+        ts_headline('indonesian', hits.content, query.q,
+            'StartSel=«, StopSel=», MaxWords=24, MinWords=8, MaxFragments=2, FragmentDelimiter=" … "')
+    FROM hits CROSS JOIN query
+    ORDER BY hits.rank DESC, hits.created_at DESC;
+$$;
+
+-- Databases that applied the earlier version: once the index above
+-- exists, drop the stored column and its index (a catalog change, no
+-- rewrite); the DROP INDEX CONCURRENTLY also runs on its own
+DROP INDEX CONCURRENTLY IF EXISTS idx_messages_content_tsv;
+ALTER TABLE messages DROP COLUMN IF EXISTS content_tsv;
+
+The function runs with the caller's rights, so the thread and message RLS
+policies still apply to end-user tokens. For a rare term the planner reads
+the GIN index; for a common one it starts from the user's threads
+(idx_threads_user_id, idx_messages_thread_id) and rechecks only their
+messages, so a query never scans every user's matches. Messages of
+archived threads (app/services/archive.py) are not in `messages` and are
+not found until the thread is opened and restored.
+"""
@@ -8,6 +8,14 @@ CREATE TABLE threads (
     user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
     title VARCHAR(255),
     system_instruction TEXT NOT NULL,
+    generation_profile VARCHAR(20),  -- NULL: the endpoint's default (app/services/generation.py)
+    -- Tombstone of an archived thread: messages moved to storage (app/services/archive.py)
+    archived_at TIMESTAMP WITH TIME ZONE,
+    archive_path TEXT,
+    archived_messages INTEGER,
+    restored_at TIMESTAMP WITH TIME ZONE,
+    -- Last time the GC removed expired audio from its messages (part of the ETag)
+    audio_expired_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -22,8 +30,12 @@ CREATE TABLE messages (
 );
 
 CREATE INDEX idx_threads_user_id ON threads(user_id);
+CREATE INDEX idx_threads_archive_candidates ON threads(updated_at) WHERE archived_at IS NULL;
 CREATE INDEX idx_messages_thread_id ON messages(thread_id);
 CREATE INDEX idx_messages_created_at ON messages(created_at);
+-- Keyset pagination of the data export (app/services/export.py)
+CREATE INDEX idx_threads_user_created ON threads(user_id, created_at, id);
+CREATE INDEX idx_messages_thread_created ON messages(thread_id, created_at, id);
 
 -- Enable RLS
 ALTER TABLE threads ENABLE ROW LEVEL SECURITY;
@@ -63,6 +75,47 @@ CREATE POLICY "Service role full access threads" ON threads
 
 CREATE POLICY "Service role full access messages" ON messages
     FOR ALL USING (auth.role() = 'service_role');
+
+-- Existing databases: columns and indexes added since the tables above.
+-- Run these first: the function below refers to the new columns.
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS generation_profile VARCHAR(20);
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS archive_path TEXT;
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS archived_messages INTEGER;
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS restored_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS audio_expired_at TIMESTAMP WITH TIME ZONE;
+CREATE INDEX IF NOT EXISTS idx_threads_archive_candidates ON threads(updated_at) WHERE archived_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_threads_user_created ON threads(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_messages_thread_created ON messages(thread_id, created_at, id);
+
+-- Garbage collection (app/services/gc.py): delete up to p_limit threads
+-- without messages, not archived and untouched since p_before (only untitled
+-- ones, as left by a failed /chat/send, with p_untitled_only); returns their ids.
+-- Replaces the earlier two-argument version.
+DROP FUNCTION IF EXISTS delete_empty_threads(TIMESTAMP WITH TIME ZONE, INTEGER);
+CREATE OR REPLACE FUNCTION delete_empty_threads(
+    p_before TIMESTAMP WITH TIME ZONE,
+    p_limit INTEGER DEFAULT 100,
+    p_untitled_only BOOLEAN DEFAULT TRUE
+)
+RETURNS SETOF UUID
+LANGUAGE SQL VOLATILE AS $$
+    DELETE FROM threads
+    WHERE id IN (
+        SELECT t.id FROM threads t
+        WHERE t.archived_at IS NULL AND t.updated_at < p_before
+            AND (t.title IS NULL OR NOT p_untitled_only)
+            AND NOT EXISTS (SELECT 1 FROM messages m WHERE m.thread_id = t.id)
+        ORDER BY t.updated_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id;
+$$;
+
+-- Archived threads: private bucket, backend access only
+INSERT INTO storage.buckets (id, name, public) VALUES ('archive', 'archive', false)
+ON CONFLICT (id) DO NOTHING;
 """
 
 from dataclasses import dataclass
@@ -79,6 +132,8 @@ class Thread:
     system_instruction: str
     created_at: datetime
     updated_at: datetime
+    generation_profile: Optional[str] = None
+    archived_at: Optional[datetime] = None
 
 
 @dataclass
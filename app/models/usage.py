@@ -0,0 +1,70 @@
+"""
+Token usage and cost accounting.
+
+Supabase Tables:
+
+CREATE TABLE usage_daily (
+    day DATE NOT NULL,
+    user_id UUID,
+    thread_id UUID,
+    provider VARCHAR(20) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    requests BIGINT NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    cached_tokens BIGINT NOT NULL DEFAULT 0,
+    audio_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    cost_usd NUMERIC(14, 6) NOT NULL DEFAULT 0,
+    max_prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE NULLS NOT DISTINCT (day, user_id, thread_id, provider, model, kind)
+);
+
+CREATE INDEX idx_usage_daily_day ON usage_daily(day);
+CREATE INDEX idx_usage_daily_user_day ON usage_daily(user_id, day);
+
+-- Backend only: no user policies
+ALTER TABLE usage_daily ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access usage" ON usage_daily
+    FOR ALL USING (auth.role() = 'service_role');
+
+-- Adds a batch of per-process aggregates onto the daily rows
+CREATE OR REPLACE FUNCTION record_usage(rows JSONB) RETURNS VOID
+LANGUAGE SQL AS $$
+    INSERT INTO usage_daily AS u (
+        day, user_id, thread_id, provider, model, kind, requests, prompt_tokens,
+        completion_tokens, cached_tokens, audio_seconds, cost_usd, max_prompt_tokens
+    )
+    SELECT day, user_id, thread_id, provider, model, kind, requests, prompt_tokens,
+        completion_tokens, cached_tokens, audio_seconds, cost_usd, max_prompt_tokens
+    FROM jsonb_to_recordset(rows) AS r(
+        day DATE, user_id UUID, thread_id UUID, provider VARCHAR, model VARCHAR, kind VARCHAR,
+        requests BIGINT, prompt_tokens BIGINT, completion_tokens BIGINT, cached_tokens BIGINT,
+        audio_seconds DOUBLE PRECISION, cost_usd NUMERIC, max_prompt_tokens INTEGER
+    )
+    ON CONFLICT (day, user_id, thread_id, provider, model, kind) DO UPDATE SET
+        requests = u.requests + EXCLUDED.requests,
+        prompt_tokens = u.prompt_tokens + EXCLUDED.prompt_tokens,
+        completion_tokens = u.completion_tokens + EXCLUDED.completion_tokens,
+        cached_tokens = u.cached_tokens + EXCLUDED.cached_tokens,
+        audio_seconds = u.audio_seconds + EXCLUDED.audio_seconds,
+        cost_usd = u.cost_usd + EXCLUDED.cost_usd,
+        max_prompt_tokens = GREATEST(u.max_prompt_tokens, EXCLUDED.max_prompt_tokens),
+        updated_at = NOW();
+$$;
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass
+class TokenUsage:
+    """Usage reported by a provider for one model call"""
+    provider: str  # "gemini" | "groq"
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    audio_seconds: float = 0.0  # speech-to-text input
@@ -0,0 +1,165 @@
+import hmac
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse, Response
+
+from app.middleware.profiling import ProfilingControl, get_profiling_control
+from app.schemas.admin import ArchiveRun, GcRun, KnowledgeStatus, ProfileFile, ProfilingStatus, ProfilingUpdate, UsageSummary
+from app.services.archive import ArchiveService, get_archive_service
+from app.services.gc import GarbageCollector, get_garbage_collector
+from app.services.knowledge import KnowledgeRegistry, get_knowledge_registry
+from app.services.loop_lag import get_loop_lag_monitor
+from app.services.metrics import render_metrics
+from app.services.usage import GROUP_FIELDS, UsageService, get_usage_service
+from app.settings import get_settings
+
+
+async def require_admin(
+    x_admin_token: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+) -> None:
+    """
+    Admin endpoints need ADMIN_TOKEN, as X-Admin-Token or as a Bearer token
+    (what Prometheus scrapers send); disabled when unset
+    """
+    admin_token = get_settings().admin_token
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin API is disabled (ADMIN_TOKEN not set)")
+    token = x_admin_token
+    if not token and authorization and authorization.startswith("Bearer "):
+        token = authorization.replace("Bearer ", "")
+    if not token or not hmac.compare_digest(token, admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+def profiling_status(control: ProfilingControl) -> dict:
+    return {
+        **control.current(),
+        "worker_pid": os.getpid(),
+        "loop_lag": get_loop_lag_monitor().report(),
+    }
+
+
+@router.get("/profiling", response_model=ProfilingStatus)
+async def get_profiling(control: ProfilingControl = Depends(get_profiling_control)):
+    """Profiling switch, plus event loop lag stats of the worker that answered"""
+    return profiling_status(control)
+
+
+@router.put("/profiling", response_model=ProfilingStatus)
+async def update_profiling(
+    update: ProfilingUpdate,
+    control: ProfilingControl = Depends(get_profiling_control),
+):
+    """
+    Switch request profiling on or off for all workers.
+
+    A `sample_rate` fraction of requests under `paths` is profiled; each
+    profile is saved as speedscope JSON (flamegraph view at speedscope.app).
+    """
+    control.update(
+        enabled=update.enabled,
+        sample_rate=update.sample_rate,
+        paths=update.paths,
+        duration_s=update.duration_s,
+    )
+    return profiling_status(control)
+
+
+@router.get("/profiles", response_model=list[ProfileFile])
+async def get_profiles(control: ProfilingControl = Depends(get_profiling_control)):
+    """Saved profiles, newest first"""
+    return control.list_profiles()
+
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str, control: ProfilingControl = Depends(get_profiling_control)):
+    """Download a profile"""
+    path = control.profile_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=name)
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus metrics (token usage, estimated cost) of all workers"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@router.get("/usage", response_model=list[UsageSummary], response_model_exclude_unset=True)
+async def get_usage(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    group_by: str = Query("day", description=f"Comma-separated: {', '.join(GROUP_FIELDS)}"),
+    user_id: Optional[UUID] = None,
+    thread_id: Optional[UUID] = None,
+    provider: Optional[str] = None,
+    usage: UsageService = Depends(get_usage_service),
+):
+    """
+    Token usage and estimated cost between `start` and `end` (UTC days,
+    inclusive; default the last 7 days), summed per `group_by`.
+
+    Other workers' usage shows up after their next flush (USAGE_FLUSH_INTERVAL).
+    """
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=6)
+    fields = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in fields if name not in GROUP_FIELDS]
+    if not fields or unknown:
+        raise HTTPException(status_code=422, detail=f"group_by must name some of: {', '.join(GROUP_FIELDS)}")
+
+    return await usage.query(
+        start=start,
+        end=end,
+        group_by=fields,
+        user_id=user_id,
+        thread_id=thread_id,
+        provider=provider,
+    )
+
+
+@router.get("/knowledge", response_model=KnowledgeStatus)
+async def get_knowledge(registry: KnowledgeRegistry = Depends(get_knowledge_registry)):
+    """Knowledge base version served by the worker that answered"""
+    return {**registry.report(), "worker_pid": os.getpid()}
+
+
+@router.post("/knowledge/reload", response_model=KnowledgeStatus)
+async def reload_knowledge(registry: KnowledgeRegistry = Depends(get_knowledge_registry)):
+    """
+    Reload the knowledge base now in the worker that answered; the other
+    workers follow within KNOWLEDGE_RELOAD_INTERVAL. A source that fails to
+    load keeps the current version (see `last_error`).
+    """
+    reloaded = await registry.reload()
+    return {**registry.report(), "worker_pid": os.getpid(), "reloaded": reloaded}
+
+
+@router.post("/archive/run", response_model=ArchiveRun)
+async def run_archive(
+    older_than_days: Optional[float] = Query(None, gt=0, description="Default ARCHIVE_AFTER_DAYS"),
+    archive: ArchiveService = Depends(get_archive_service),
+):
+    """Archive one batch (ARCHIVE_BATCH_SIZE) of idle threads now"""
+    if not (older_than_days or archive.after_days > 0):
+        raise HTTPException(status_code=400, detail="Archival is off (ARCHIVE_AFTER_DAYS=0); pass older_than_days")
+    return await archive.run_once(older_than_days)
+
+
+@router.post("/gc/run", response_model=GcRun)
+async def run_gc(gc: GarbageCollector = Depends(get_garbage_collector)):
+    """
+    Run one garbage collection cycle now: empty threads, then the next
+    GC_BATCH_SIZE user folders of the audio and archive buckets
+    """
+    return await gc.run_once()
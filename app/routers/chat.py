@@ -1,12 +1,11 @@
+import asyncio
 import json
-from typing import Optional
+from datetime import date
+from typing import Literal, Optional
 from uuid import UUID
-import base64
-from fastapi import APIRouter, HTTPException, Depends, Header
-from fastapi.responses import StreamingResponse
-from supabase import Client
+from fastapi import APIRouter, HTTPException, Depends, Header, Path, Query
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
-from app.database import get_supabase
 from app.schemas.chat import (
     ThreadCreate,
     ThreadUpdate,
@@ -14,30 +13,40 @@ from app.schemas.chat import (
     MessageResponse,
     ThreadWithMessages,
     ChatRequest,
+    SearchResponse,
 )
+from app.services.audio import decode_base64_audio, preprocess_audio
+from app.services.audio_cache import content_type, get_audio_cache
+from app.services.auth import get_current_user_id
 from app.services.thread import get_thread_service, ThreadService
+from app.middleware.capture import annotate, pseudonym
 from app.services.gemini import get_gemini_service, GeminiService
+from app.services.health import require_accepting_streams
+from app.services.generation import get_profile
+from app.services.idempotency import fingerprint, get_idempotency_store
+from app.services.search import get_search_service
+from app.services.etag import etag_matches, thread_etag, threads_etag
+from app.services.events import CLOSED, HEARTBEAT, get_event_bus
+from app.services.export import decode_cursor, get_export_service
+from app.services.knowledge import DEFAULT_INSTRUCTION, get_knowledge_base
+from app.services.titles import get_title_service
+from app.services.streaming import ResponseAccumulator
+from app.services.usage import get_usage_service
+from app.settings import get_settings
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+# Thread reads: clients may keep them but must revalidate (If-None-Match)
+REVALIDATE = "private, no-cache"
 
-async def get_current_user_id(
-    authorization: str = Header(..., description="Bearer token")
-) -> UUID:
-    """Extract and verify user from JWT token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization header")
-
-    token = authorization.replace("Bearer ", "")
-
-    try:
-        supabase: Client = get_supabase()
-        user = supabase.auth.get_user(token)
-        if not user or not user.user:
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
-        return UUID(user.user.id)
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
+# Recordings are content-addressed, so the bytes behind a name never change;
+# with AUDIO_RETENTION_DAYS set they can be deleted, so clients revalidate
+_settings = get_settings()
+AUDIO_CACHE_CONTROL = (
+    f"private, max-age={int(_settings.audio_cache_revalidate)}"
+    if _settings.audio_retention_days > 0
+    else "private, max-age=31536000, immutable"
+)
 
 
 # Thread endpoints
@@ -52,33 +61,151 @@ async def create_thread(
         user_id=user_id,
         system_instruction=thread_data.system_instruction,
         title=thread_data.title,
+        generation_profile=thread_data.generation_profile,
     )
     if not thread:
         raise HTTPException(status_code=500, detail="Failed to create thread")
+    annotate(thread=pseudonym(thread["id"]))
     return thread
 
 
+@router.get("/search", response_model=SearchResponse)
+async def search_messages(
+    q: str = Query(..., min_length=2, max_length=200, description="Words to find; quotes for phrases, -word to exclude"),
+    limit: int = Query(50, ge=1, le=200, description="Maximum matching messages considered"),
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """Search the current user's messages; threads best match first, with snippets"""
+    threads = await get_search_service().search(user_id, q, limit)
+    annotate(search_terms=len(q.split()), search_threads=len(threads))
+    return {"query": q, "threads": threads}
+
+
+@router.get("/export")
+async def export_threads(
+    format: Literal["ndjson", "gzip"] = Query("ndjson", description="gzip: the same NDJSON, gzip-compressed"),
+    cursor: Optional[str] = Query(None, description="`cursor` of the last line received, to resume"),
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """
+    Stream all of the current user's threads and messages as NDJSON: a
+    `thread` line, then its `message` lines, oldest first, and a final `end`
+    line. A download cut short resumes with the last line's `cursor`.
+    """
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid export cursor")
+
+    filename = f"chat-export-{date.today().isoformat()}.ndjson"
+    if format == "gzip":
+        filename += ".gz"
+    return StreamingResponse(
+        get_export_service().stream(user_id, position, compress=format == "gzip"),
+        media_type="application/gzip" if format == "gzip" else "application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@router.api_route("/audio/{name}", methods=["GET", "HEAD"])
+async def get_audio(
+    name: str = Path(..., pattern=r"^[A-Za-z0-9_-]+\.[A-Za-z0-9]+$", description="File name from `playback_url`"),
+    if_none_match: Optional[str] = Header(None),
+    user_id: UUID = Depends(get_current_user_id),
+):
+    """
+    Play one of the current user's recordings: Range requests for seeking
+    and resuming, a strong ETag (If-None-Match, If-Range) and private
+    caching (long unless audio retention is on), served from the local
+    audio cache.
+    """
+    path = f"{user_id}/{name}"
+    local = await get_audio_cache().get(path)
+    if local is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    headers = {
+        "ETag": get_audio_cache().etag(path, local),
+        "Cache-Control": AUDIO_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(local, media_type=content_type(name), headers=headers)
+
+
+@router.get("/events", dependencies=[Depends(require_accepting_streams)])
+async def thread_events(user_id: UUID = Depends(get_current_user_id)):
+    """
+    Server-sent events for the current user's threads, instead of polling
+    GET /threads: `thread_created`, `thread_updated` (new message),
+    `thread_title` and `thread_deleted`, each with the thread's id, title
+    and updated_at. `resync` means events may have been missed: refetch the
+    list. `reconnect` comes before the server closes the stream.
+    """
+    async def stream():
+        async with get_event_bus().subscribe(user_id) as queue:
+            yield "retry: 3000\n\n"
+            yield f"data: {json.dumps({'type': 'subscribed'})}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {json.dumps(event, default=str)}\n\n"
+                if event is CLOSED:
+                    return
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @router.get("/threads", response_model=list[ThreadResponse])
 async def get_threads(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     user_id: UUID = Depends(get_current_user_id),
     thread_service: ThreadService = Depends(get_thread_service),
 ):
-    """Get all threads for the current user"""
-    return await thread_service.get_user_threads(user_id)
+    """Get all threads for the current user; 304 if If-None-Match has the list's ETag"""
+    threads = await thread_service.get_user_threads(user_id)
+    etag = threads_etag(threads)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": REVALIDATE})
+    response.headers.update({"ETag": etag, "Cache-Control": REVALIDATE})
+    return threads
 
 
 @router.get("/threads/{thread_id}", response_model=ThreadWithMessages)
 async def get_thread(
     thread_id: UUID,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     user_id: UUID = Depends(get_current_user_id),
     thread_service: ThreadService = Depends(get_thread_service),
 ):
-    """Get a thread with all its messages"""
+    """Get a thread with all its messages; 304 without reading them if the thread's ETag matches"""
     thread = await thread_service.get_thread(thread_id, user_id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
+    if etag_matches(if_none_match, thread_etag(thread)):
+        return Response(status_code=304, headers={"ETag": thread_etag(thread), "Cache-Control": REVALIDATE})
 
-    messages = await thread_service.get_thread_messages(thread_id)
+    messages = await thread_service.get_thread_messages(thread_id, thread)
+    # after a restore: the tag the next request will see
+    response.headers.update({"ETag": thread_etag(thread), "Cache-Control": REVALIDATE})
     return {"thread": thread, "messages": messages}
 
 
@@ -89,12 +216,13 @@ async def update_thread(
     user_id: UUID = Depends(get_current_user_id),
     thread_service: ThreadService = Depends(get_thread_service),
 ):
-    """Update a thread's title or system instruction"""
+    """Update a thread's title, system instruction or generation profile"""
     thread = await thread_service.update_thread(
         thread_id=thread_id,
         user_id=user_id,
         title=thread_data.title,
         system_instruction=thread_data.system_instruction,
+        generation_profile=thread_data.generation_profile,
     )
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
@@ -115,9 +243,10 @@ async def delete_thread(
 
 
 # Chat endpoint with streaming
-@router.post("/send")
+@router.post("/send", dependencies=[Depends(require_accepting_streams)])
 async def send_message(
     request: ChatRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="Same key to retry a turn without running it again"),
     user_id: UUID = Depends(get_current_user_id),
     thread_service: ThreadService = Depends(get_thread_service),
     gemini_service: GeminiService = Depends(get_gemini_service),
@@ -130,62 +259,102 @@ async def send_message(
 
     Supports both text and audio input (audio as base64).
     Thread title is auto-generated for new threads.
+
+    A retry with the same Idempotency-Key replays the first request's
+    events instead of running the turn again.
     """
-    import logging
-    logging.info(f"[DEBUG] Received request: message={request.message[:50] if request.message else None}..., thread_id={request.thread_id}, has_audio={request.audio_base64 is not None}")
-
-    from app.config import SYSTEM_INSTRUCTION
-
-    is_new_thread = request.thread_id is None
-    history = []
-    thread = None
-
-    if request.thread_id:
-        # Existing thread - get context
-        thread_uuid = request.thread_id
-        thread = await thread_service.get_thread(thread_uuid, user_id)
-        if not thread:
-            raise HTTPException(status_code=404, detail="Thread not found")
-
-        # Get conversation history
-        messages = await thread_service.get_thread_messages(thread_uuid)
-        history = [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in messages
-        ]
-        system_instruction = thread["system_instruction"]
-    else:
-        # New thread - create it
-        thread = await thread_service.create_thread(
-            user_id=user_id,
-            system_instruction=SYSTEM_INSTRUCTION,
-            title=None,
+    # before anything is recorded: an oversized upload is never a turn
+    raw_audio = decode_base64_audio(request.audio_base64) if request.audio_base64 else None
+
+    knowledge = get_knowledge_base()
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+        "X-Knowledge-Version": knowledge.version,
+    }
+    idempotency = get_idempotency_store()
+    turn, replayed = idempotency.begin(
+        user_id, "chat.send", idempotency_key, fingerprint(request.model_dump_json()),
+    )
+    if replayed:
+        return StreamingResponse(
+            turn.replay(),
+            media_type="text/event-stream",
+            headers={**headers, "Idempotent-Replayed": "true"},
         )
-        if not thread:
-            raise HTTPException(status_code=500, detail="Failed to create thread")
-        thread_uuid = UUID(thread["id"])
-        system_instruction = SYSTEM_INSTRUCTION
-
-    # Process audio if provided (decode from base64)
-    audio_data = None
-    audio_url = None
-    if request.audio_base64:
-        audio_data = base64.b64decode(request.audio_base64)
-        audio_url = await thread_service.upload_audio(
-            user_id=user_id,
-            thread_id=thread_uuid,
-            audio_data=audio_data,
-            filename="audio.wav"
+
+    with idempotency.preparing(turn):
+        is_new_thread = request.thread_id is None
+        history = []
+        thread = None
+
+        if request.thread_id:
+            # Existing thread - get context
+            thread_uuid = request.thread_id
+            thread = await thread_service.get_thread(thread_uuid, user_id)
+            if not thread:
+                raise HTTPException(status_code=404, detail="Thread not found")
+
+            # Get conversation history
+            messages = await thread_service.get_thread_messages(thread_uuid, thread)
+            history = [
+                {"role": msg["role"], "content": msg["content"]}
+                for msg in messages
+            ]
+            system_instruction = thread["system_instruction"]
+        else:
+            # New thread - create it
+            thread = await thread_service.create_thread(
+                user_id=user_id,
+                system_instruction=DEFAULT_INSTRUCTION,
+                title=None,
+            )
+            if not thread:
+                raise HTTPException(status_code=500, detail="Failed to create thread")
+            thread_uuid = UUID(thread["id"])
+            system_instruction = DEFAULT_INSTRUCTION
+
+        # Core rules plus only the knowledge sections this message needs
+        system_instruction = knowledge.system_instruction(system_instruction, request.message, history)
+
+        # Process audio if provided (decoded above)
+        audio_data = None
+        audio_mime_type = "audio/wav"
+        audio_url = None
+        annotate(
+            thread=pseudonym(thread_uuid),
+            new_thread=is_new_thread,
+            history_depth=len(history),
+            message_chars=len(request.message),
+            include_full_response=request.include_full_response,
         )
 
-    # Save user message
-    user_message_content = request.message if request.message else "[Audio message]"
-    await thread_service.add_message(
-        thread_id=thread_uuid,
-        role="user",
-        content=user_message_content,
-        audio_url=audio_url,
-    )
+        if raw_audio is not None:
+            audio = await preprocess_audio(raw_audio)
+            annotate(
+                audio=pseudonym(audio.content_hash),
+                audio_bytes=len(raw_audio),
+                audio_seconds=round(audio.duration, 2) if audio.duration else None,
+            )
+            audio_data = audio.data
+            audio_mime_type = audio.content_type
+            audio_url = await thread_service.upload_audio(
+                user_id=user_id,
+                audio_data=audio_data,
+                filename=audio.filename,
+                content_type=audio.content_type,
+                content_hash=audio.content_hash,
+            )
+
+        # Save user message
+        user_message_content = request.message if request.message else "[Audio message]"
+        await thread_service.add_message(
+            thread_id=thread_uuid,
+            role="user",
+            content=user_message_content,
+            audio_url=audio_url,
+        )
 
     async def generate_stream():
         """Generate SSE stream of AI response"""
@@ -193,63 +362,78 @@ async def send_message(
         if is_new_thread:
             yield f"data: {json.dumps({'type': 'thread_created', 'thread_id': str(thread_uuid)})}\n\n"
 
-        full_response = ""
+        response = ResponseAccumulator(thread_service, thread_uuid)
+        usage = get_usage_service()
         try:
             async for chunk in gemini_service.chat_stream(
                 message=request.message,
                 history=history,
                 system_instruction=system_instruction,
                 audio_data=audio_data,
+                audio_mime_type=audio_mime_type,
+                on_usage=usage.tracker(user_id, thread_uuid, "chat"),
+                profile=get_profile("chat", thread),
             ):
-                full_response += chunk
+                response.append(chunk)
                 yield f"data: {json.dumps({'type': 'chunk', 'content': chunk})}\n\n"
+                await response.maybe_persist()
 
             # Save assistant response to database
-            await thread_service.add_message(
-                thread_id=thread_uuid,
-                role="assistant",
-                content=full_response,
-            )
+            await response.finalize()
+            full_response = response.text
 
             # Generate title for new threads only
             if is_new_thread:
                 try:
-                    title = await gemini_service.generate_title(user_message_content, full_response)
-                    await thread_service.update_thread(
-                        thread_id=thread_uuid,
-                        user_id=user_id,
-                        title=title,
+                    title = await get_title_service().title_thread(
+                        thread_service,
+                        thread_uuid,
+                        user_id,
+                        user_message_content,
+                        full_response,
+                        on_usage=usage.tracker(user_id, thread_uuid, "title"),
                     )
                     yield f"data: {json.dumps({'type': 'title_generated', 'title': title})}\n\n"
                 except Exception:
                     pass  # Title generation is optional
 
-            yield f"data: {json.dumps({'type': 'done', 'content': full_response})}\n\n"
+            done_event = {"type": "done"}
+            if request.include_full_response:
+                done_event["content"] = full_response
+            yield f"data: {json.dumps(done_event)}\n\n"
 
         except Exception as e:
+            # Keep whatever was already streamed when progressive saving is on
+            if response.save_interval > 0 and response.has_content:
+                try:
+                    await response.finalize()
+                except Exception:
+                    pass
             yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
 
     return StreamingResponse(
-        generate_stream(),
+        idempotency.run(turn, generate_stream()),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
+        headers=headers,
     )
 
 
 @router.get("/threads/{thread_id}/messages", response_model=list[MessageResponse])
 async def get_messages(
     thread_id: UUID,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     user_id: UUID = Depends(get_current_user_id),
     thread_service: ThreadService = Depends(get_thread_service),
 ):
-    """Get all messages in a thread"""
+    """Get all messages in a thread; 304 without reading them if the thread's ETag matches"""
     # Verify thread belongs to user
     thread = await thread_service.get_thread(thread_id, user_id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
+    if etag_matches(if_none_match, thread_etag(thread)):
+        return Response(status_code=304, headers={"ETag": thread_etag(thread), "Cache-Control": REVALIDATE})
 
-    return await thread_service.get_thread_messages(thread_id)
+    messages = await thread_service.get_thread_messages(thread_id, thread)
+    response.headers.update({"ETag": thread_etag(thread), "Cache-Control": REVALIDATE})
+    return messages
@@ -0,0 +1,71 @@
+from typing import List, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
+
+from app.services.auth import get_current_user_id
+from app.schemas.jobs import BatchItemResult, BatchJobResponse
+from app.services.jobs import BatchJobService, get_batch_job_service
+
+router = APIRouter(prefix="/jobs", tags=["batch-jobs"])
+
+
+@router.post("/transcriptions", response_model=BatchJobResponse, status_code=202)
+async def create_transcription_job(
+    files: List[UploadFile] = File(...),
+    stt_model: Optional[str] = Form(None),
+    llm_model: Optional[str] = Form(None),
+    language: Optional[str] = Form(None),
+    user_id: UUID = Depends(get_current_user_id),
+    job_service: BatchJobService = Depends(get_batch_job_service),
+):
+    """
+    Submit many audio files for offline STT + LLM processing.
+
+    Files are processed in the background by a bounded worker pool;
+    poll the job for progress and fetch results in bulk.
+    """
+    return await job_service.create_job(
+        user_id=user_id,
+        files=files,
+        stt_model=stt_model,
+        llm_model=llm_model,
+        language=language,
+    )
+
+
+@router.get("", response_model=list[BatchJobResponse])
+async def get_jobs(
+    user_id: UUID = Depends(get_current_user_id),
+    job_service: BatchJobService = Depends(get_batch_job_service),
+):
+    """Get all batch jobs for the current user"""
+    return await job_service.get_user_jobs(user_id)
+
+
+@router.get("/{job_id}", response_model=BatchJobResponse)
+async def get_job(
+    job_id: UUID,
+    user_id: UUID = Depends(get_current_user_id),
+    job_service: BatchJobService = Depends(get_batch_job_service),
+):
+    """Get progress of a batch job"""
+    job = await job_service.get_job(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/{job_id}/results", response_model=list[BatchItemResult])
+async def get_job_results(
+    job_id: UUID,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    user_id: UUID = Depends(get_current_user_id),
+    job_service: BatchJobService = Depends(get_batch_job_service),
+):
+    """Get per-file results of a batch job (unfinished files are reported as pending)"""
+    results = await job_service.get_results(job_id, user_id, offset=offset, limit=limit)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return results
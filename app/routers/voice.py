@@ -0,0 +1,331 @@
+import asyncio
+import json
+import logging
+from typing import List, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from app.services.audio import preprocess_audio
+from app.services.auth import verify_token
+from app.services.generation import get_profile
+from app.services.health import get_dependency_monitor
+from app.services.knowledge import DEFAULT_INSTRUCTION, get_knowledge_base
+from app.services.stt import stream_llm_completion, transcribe_audio
+from app.services.streaming import ResponseAccumulator
+from app.services.usage import get_usage_service
+from app.services.thread import get_thread_service, ThreadService
+from app.services.titles import get_title_service
+from app.services.vad import VoiceActivitySegmenter, pcm_to_wav
+from app.settings import get_settings
+
+router = APIRouter(prefix="/voice", tags=["voice"])
+
+# PCM sample rates accepted from clients (Hz)
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+
+logger = logging.getLogger("uvicorn.error")
+
+
+async def verify_ws_token(websocket: WebSocket) -> Optional[UUID]:
+    """Resolve the user from a `token` query param or Authorization header"""
+    token = websocket.query_params.get("token")
+    if not token:
+        authorization = websocket.headers.get("authorization", "")
+        if authorization.startswith("Bearer "):
+            token = authorization.replace("Bearer ", "")
+    if not token:
+        return None
+
+    try:
+        return await verify_token(token)
+    except Exception:
+        return None
+
+
+class VoiceSession:
+    """State of one duplex voice conversation bound to a thread"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: UUID,
+        thread_service: ThreadService,
+        sample_rate: int,
+        stt_model: Optional[str],
+        llm_model: Optional[str],
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.thread_service = thread_service
+        self.sample_rate = sample_rate
+        self.stt_model = stt_model
+        self.llm_model = llm_model
+
+        self.thread_uuid: Optional[UUID] = None
+        self.system_instruction = DEFAULT_INSTRUCTION
+        self.profile = get_profile("voice")
+        self.history: List[dict] = []
+        self.has_title = True
+
+        # Segments of the utterance being spoken, transcribed as they close
+        self.segment_tasks: List[asyncio.Task] = []
+        self.segment_pcm: List[bytes] = []
+        self.turn_lock = asyncio.Lock()
+
+    async def send(self, payload: dict) -> None:
+        await self.websocket.send_text(json.dumps(payload))
+
+    async def load_thread(self, thread_id: str) -> None:
+        thread_uuid = UUID(thread_id)
+        thread = await self.thread_service.get_thread(thread_uuid, self.user_id)
+        if not thread:
+            raise HTTPException(status_code=404, detail="Thread not found")
+
+        messages = await self.thread_service.get_thread_messages(thread_uuid, thread)
+        self.history = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in messages
+        ]
+        self.thread_uuid = thread_uuid
+        self.system_instruction = thread["system_instruction"]
+        self.profile = get_profile("voice", thread)
+        self.has_title = bool(thread.get("title"))
+
+    def add_segment(self, pcm: bytes) -> None:
+        """Start transcribing a closed speech segment in the background"""
+        wav = pcm_to_wav(pcm, self.sample_rate)
+        self.segment_pcm.append(pcm)
+        # the first utterance of a new thread is transcribed before the thread exists
+        on_usage = get_usage_service().tracker(self.user_id, self.thread_uuid, "stt")
+        seconds = len(pcm) / 2 / self.sample_rate  # 16-bit mono
+        self.segment_tasks.append(
+            asyncio.create_task(transcribe_audio(
+                wav, "segment.wav", "audio/wav", self.stt_model,
+                on_usage=on_usage, audio_seconds=seconds,
+            ))
+        )
+
+    def take_utterance(self):
+        """Detach the segments of the finished utterance"""
+        tasks, pcm = self.segment_tasks, self.segment_pcm
+        self.segment_tasks, self.segment_pcm = [], []
+        return tasks, b"".join(pcm)
+
+    async def run_turn(self, tasks: List[asyncio.Task], pcm: bytes) -> None:
+        """Finish transcription of an utterance and stream the LLM reply"""
+        async with self.turn_lock:
+            try:
+                await self._run_turn(tasks, pcm)
+            except WebSocketDisconnect:
+                raise
+            except HTTPException as http_err:
+                await self.send({"type": "error", "content": http_err.detail})
+            except Exception as e:
+                logger.exception("Voice turn failed")
+                await self.send({"type": "error", "content": f"Voice turn failed: {repr(e)}"})
+
+    async def _run_turn(self, tasks: List[asyncio.Task], pcm: bytes) -> None:
+        pieces = await asyncio.gather(*tasks)
+        transcript = " ".join(piece.strip() for piece in pieces if piece and piece.strip())
+        if not transcript:
+            # the client waits for `done` or `error` before it listens again
+            await self.send({"type": "error", "content": "No speech detected"})
+            return
+
+        await self.send({"type": "transcript", "content": transcript})
+
+        is_new_thread = self.thread_uuid is None
+        if is_new_thread:
+            thread = await self.thread_service.create_thread(
+                user_id=self.user_id,
+                system_instruction=self.system_instruction,
+                title=None,
+            )
+            if not thread:
+                raise HTTPException(status_code=500, detail="Failed to create thread")
+            self.thread_uuid = UUID(thread["id"])
+            self.has_title = False
+            await self.send({"type": "thread_created", "thread_id": str(self.thread_uuid)})
+
+        audio = await preprocess_audio(pcm_to_wav(pcm, self.sample_rate))
+        audio_url = await self.thread_service.upload_audio(
+            user_id=self.user_id,
+            audio_data=audio.data,
+            filename=audio.filename,
+            content_type=audio.content_type,
+            content_hash=audio.content_hash,
+        )
+        await self.thread_service.add_message(
+            thread_id=self.thread_uuid,
+            role="user",
+            content=transcript,
+            audio_url=audio_url,
+        )
+
+        # looked up per turn: long sessions pick up knowledge base reloads
+        system_instruction = get_knowledge_base().system_instruction(
+            self.system_instruction, transcript, self.history,
+        )
+        messages = [{"role": "system", "content": system_instruction}]
+        messages.extend(self.history)
+        messages.append({"role": "user", "content": transcript})
+
+        response = ResponseAccumulator(self.thread_service, self.thread_uuid)
+        usage = get_usage_service()
+        async for content in stream_llm_completion(
+            messages, self.llm_model, on_usage=usage.tracker(self.user_id, self.thread_uuid, "chat"),
+            profile=self.profile,
+        ):
+            response.append(content)
+            await self.send({"type": "chunk", "content": content})
+            await response.maybe_persist()
+
+        await response.finalize()
+        full_response = response.text
+        self.history.append({"role": "user", "content": transcript})
+        self.history.append({"role": "assistant", "content": full_response})
+
+        if not self.has_title:
+            try:
+                title = await get_title_service().title_thread(
+                    self.thread_service, self.thread_uuid, self.user_id, transcript, full_response,
+                    on_usage=usage.tracker(self.user_id, self.thread_uuid, "title"),
+                )
+                self.has_title = True
+                await self.send({"type": "title_generated", "title": title})
+            except WebSocketDisconnect:
+                raise
+            except Exception:
+                pass  # Title generation is optional
+
+        await self.send({"type": "done"})
+
+
+@router.websocket("/ws")
+async def voice_session(
+    websocket: WebSocket,
+    thread_id: Optional[str] = None,
+    sample_rate: int = 16000,
+    stt_model: Optional[str] = None,
+    llm_model: Optional[str] = None,
+):
+    """
+    Duplex voice conversation over WebSocket.
+
+    Client -> server:
+      - binary frames: raw 16-bit little-endian mono PCM at `sample_rate`
+      - {"type": "end"}: force end of the current utterance
+      - {"type": "close"}: finish pending work and close
+
+    Speech is segmented server-side; each segment is transcribed as soon as
+    it closes, and the LLM starts as soon as end-of-utterance is detected.
+
+    Server -> client (JSON text frames):
+      - type: 'ready' - Session accepted
+      - type: 'segment_transcribing' - A speech segment closed and was sent to STT
+      - type: 'transcript' - Full transcript of the utterance
+      - type: 'thread_created' - New thread ID (first turn of a new thread)
+      - type: 'chunk' - Streaming chunks of LLM response
+      - type: 'title_generated' - Auto-generated title (new thread)
+      - type: 'done' - Turn finished
+      - type: 'error' - Error occurred
+    """
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        await websocket.close(
+            code=1008, reason=f"sample_rate must be between {MIN_SAMPLE_RATE} and {MAX_SAMPLE_RATE}",
+        )
+        return
+    user_id = await verify_ws_token(websocket)
+    if user_id is None:
+        await websocket.close(code=1008, reason="Authentication failed")
+        return
+    if not get_settings().groq_api_key:
+        await websocket.close(code=1011, reason="GROQ_API_KEY not configured in environment")
+        return
+    monitor = get_dependency_monitor()
+    if monitor.draining:
+        await websocket.close(code=1013, reason="Server is shutting down, please retry")
+        return
+
+    await websocket.accept()
+    monitor.stream_started()
+    try:
+        await run_voice_session(websocket, user_id, thread_id, sample_rate, stt_model, llm_model)
+    finally:
+        monitor.stream_finished()
+
+
+async def run_voice_session(
+    websocket: WebSocket,
+    user_id: UUID,
+    thread_id: Optional[str],
+    sample_rate: int,
+    stt_model: Optional[str],
+    llm_model: Optional[str],
+) -> None:
+    """Receive loop of an accepted voice session"""
+
+    session = VoiceSession(
+        websocket=websocket,
+        user_id=user_id,
+        thread_service=get_thread_service(),
+        sample_rate=sample_rate,
+        stt_model=stt_model,
+        llm_model=llm_model,
+    )
+    if thread_id:
+        try:
+            await session.load_thread(thread_id)
+        except (HTTPException, ValueError):
+            await websocket.close(code=1008, reason="Thread not found")
+            return
+
+    await session.send({
+        "type": "ready",
+        "thread_id": str(session.thread_uuid) if session.thread_uuid else None,
+    })
+
+    segmenter = VoiceActivitySegmenter(sample_rate=sample_rate)
+    turns: List[asyncio.Task] = []
+
+    async def handle_events(events) -> None:
+        for event in events:
+            if event.type == "segment":
+                session.add_segment(event.pcm)
+                await session.send({"type": "segment_transcribing"})
+            elif event.type == "end_of_utterance":
+                tasks, pcm = session.take_utterance()
+                if tasks:
+                    turns.append(asyncio.create_task(session.run_turn(tasks, pcm)))
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            if message.get("bytes"):
+                await handle_events(segmenter.feed(message["bytes"]))
+                continue
+
+            try:
+                control = json.loads(message.get("text") or "{}")
+            except json.JSONDecodeError:
+                continue
+
+            if control.get("type") == "end":
+                await handle_events(segmenter.flush())
+            elif control.get("type") == "close":
+                await handle_events(segmenter.flush())
+                if turns:
+                    await asyncio.gather(*turns, return_exceptions=True)
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in session.segment_tasks + turns:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,80 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import date, datetime
+
+
+# Profiling Schemas
+class ProfilingUpdate(BaseModel):
+    enabled: bool
+    sample_rate: float = Field(0.05, ge=0.0, le=1.0)
+    paths: Optional[List[str]] = None  # path prefixes, default: chat send + STT
+    duration_s: Optional[float] = Field(None, gt=0)  # switch off again after this long
+
+
+class ProfilingStatus(BaseModel):
+    enabled: bool
+    sample_rate: float
+    paths: List[str]
+    until: Optional[float] = None
+    worker_pid: int
+    loop_lag: dict
+
+
+class ProfileFile(BaseModel):
+    name: str
+    bytes: int
+    created_at: datetime
+
+
+# Usage Schemas
+class UsageSummary(BaseModel):
+    # grouping fields; only those in `group_by` are set
+    day: Optional[date] = None
+    user_id: Optional[str] = None
+    thread_id: Optional[str] = None
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    kind: Optional[str] = None
+
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    audio_seconds: float
+    cost_usd: float
+    max_prompt_tokens: int
+    avg_prompt_tokens: float
+
+
+# Knowledge Base Schemas
+class KnowledgeSection(BaseModel):
+    name: str
+    title: str
+    chars: int
+
+
+class ArchiveRun(BaseModel):
+    candidates: int
+    archived: int
+    messages: int
+    skipped: int  # empty, or written to since selected
+
+
+class GcRun(BaseModel):
+    empty_threads: int
+    folders: int  # user folders scanned in the audio and archive buckets
+    audio_orphans: int
+    audio_expired: int
+    archive_orphans: int
+
+
+class KnowledgeStatus(BaseModel):
+    version: str
+    source: str
+    loaded_at: float
+    last_error: Optional[str] = None
+    core_chars: int
+    sections: List[KnowledgeSection]
+    prompts: List[str]
+    worker_pid: int
+    reloaded: Optional[bool] = None  # set by the reload endpoint
@@ -1,18 +1,33 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, computed_field, field_validator
 from typing import Optional, List
 from datetime import datetime
 from uuid import UUID
 
+from app.services.generation import PROFILES
+from app.services.thread import audio_path
+
+
+def _known_profile(name: Optional[str]) -> Optional[str]:
+    if name is not None and name not in PROFILES:
+        raise ValueError(f"generation_profile must be one of: {', '.join(PROFILES)}")
+    return name
+
 
 # Thread Schemas
 class ThreadCreate(BaseModel):
     title: Optional[str] = None
     system_instruction: str = Field(..., min_length=1)
+    generation_profile: Optional[str] = Field(None, description="Output limits for replies; endpoint default if unset")
+
+    _check_profile = field_validator("generation_profile")(_known_profile)
 
 
 class ThreadUpdate(BaseModel):
     title: Optional[str] = None
     system_instruction: Optional[str] = None
+    generation_profile: Optional[str] = None
+
+    _check_profile = field_validator("generation_profile")(_known_profile)
 
 
 class ThreadResponse(BaseModel):
@@ -20,6 +35,8 @@ class ThreadResponse(BaseModel):
     user_id: UUID
     title: Optional[str]
     system_instruction: str
+    generation_profile: Optional[str] = None
+    archived_at: Optional[datetime] = Field(None, description="Set while the messages are in archive storage")
     created_at: datetime
     updated_at: datetime
 
@@ -40,6 +57,14 @@ class MessageResponse(BaseModel):
     audio_url: Optional[str] = None
     created_at: datetime
 
+    @computed_field
+    @property
+    def playback_url(self) -> Optional[str]:
+        """`audio_url` through the authenticated, seekable GET /chat/audio/{name}"""
+        parts = (audio_path(self.audio_url) or "").split("/")
+        # {user_id}/{hash}.{ext}; older nested paths have no playback URL
+        return f"/api/v1/chat/audio/{parts[1]}" if len(parts) == 2 else None
+
     class Config:
         from_attributes = True
 
@@ -49,9 +74,31 @@ class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1)
     thread_id: Optional[UUID] = None
     audio_base64: Optional[str] = Field(None, description="Base64 encoded audio data")
+    include_full_response: bool = Field(True, description="Repeat the full response in the 'done' event")
 
 
 # Thread with Messages
 class ThreadWithMessages(BaseModel):
     thread: ThreadResponse
     messages: List[MessageResponse]
+
+
+# Search Schemas
+class MessageHit(BaseModel):
+    message_id: UUID
+    role: str
+    snippet: str = Field(..., description="Text around the match, matched words marked «like this»")
+    created_at: datetime
+    score: float
+
+
+class ThreadHit(BaseModel):
+    thread_id: UUID
+    title: Optional[str]
+    score: float
+    hits: List[MessageHit]
+
+
+class SearchResponse(BaseModel):
+    query: str
+    threads: List[ThreadHit]
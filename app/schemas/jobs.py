@@ -0,0 +1,25 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+from uuid import UUID
+
+
+# Batch Job Schemas
+class BatchJobResponse(BaseModel):
+    id: UUID
+    status: str  # 'processing' or 'completed'
+    created_at: datetime
+    total: int
+    completed: int
+    failed: int
+    pending: int
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    status: str  # 'pending', 'completed' or 'failed'
+    transcript: Optional[str] = None
+    llm_text: Optional[str] = None
+    error: Optional[str] = None
+    finished_at: Optional[datetime] = None
@@ -1,3 +1 @@
-from . import gemini, thread
-
-__all__ = ["gemini", "thread"]
+# Services are imported directly where needed so importing one does not load every SDK
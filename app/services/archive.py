@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from uuid import UUID
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server only
+    fcntl = None
+
+from app.database import get_supabase
+from app.services import metrics
+from app.settings import PROJECT_ROOT, get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Private storage bucket holding one blob per archived thread
+ARCHIVE_BUCKET = "archive"
+ARCHIVE_FORMAT = 1
+ZSTD_LEVEL = 10  # cold data: written once, read rarely
+
+# Rows per insert/delete request
+WRITE_CHUNK = 500
+
+LOCK_PATH = PROJECT_ROOT / "data" / "archive.lock"
+
+
+def _compress(data: bytes) -> bytes:
+    import zstandard
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def _decompress(blob: bytes) -> bytes:
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(blob)
+
+
+def _chunks(items: List, size: int = WRITE_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class ArchiveService:
+    """
+    Moves idle threads out of the `messages` table.
+
+    Every ARCHIVE_INTERVAL seconds, threads not updated for
+    ARCHIVE_AFTER_DAYS days are archived ARCHIVE_BATCH_SIZE at a time: their
+    messages are written as one zstd-compressed JSON blob to the `archive`
+    bucket, the thread row becomes a tombstone (`archived_at`,
+    `archive_path`) and the messages are deleted. The thread row itself
+    stays, so thread lists and titles are unaffected.
+
+    ThreadService.get_thread_messages restores an archived thread before
+    reading it; a restored thread is archived again only after another
+    ARCHIVE_AFTER_DAYS days. Each step is idempotent, so a crash between
+    them is repaired by the next cycle or restore. With several server
+    processes only the one holding data/archive.lock runs the cycle.
+    """
+
+    def __init__(self, after_days: float, interval: float, batch_size: int):
+        self.after_days = after_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._lock_file = None
+        self._restoring: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.after_days > 0 and self.interval > 0
+
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _is_leader(self) -> bool:
+        if fcntl is None:
+            return True
+        if self._lock_file is None:
+            LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+            self._lock_file = open(LOCK_PATH, "a")
+        try:
+            # held for the life of the process; the OS releases it if we die
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._is_leader():
+                continue
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Thread archival cycle failed")
+
+    # -------------------- Archive --------------------
+
+    async def run_once(self, after_days: Optional[float] = None) -> dict:
+        """Archive one batch of idle threads; returns counts for logs and the admin API"""
+        idle = timedelta(days=after_days or self.after_days)
+        cutoff = (datetime.now(timezone.utc) - idle).isoformat()
+        candidates = await asyncio.to_thread(self._candidates, cutoff)
+        archived = skipped = messages = 0
+        for thread in candidates:
+            try:
+                count = await asyncio.to_thread(self._archive_thread, thread)
+            except Exception as e:
+                logger.warning("Archiving thread %s failed: %s", thread["id"], repr(e))
+                count = None
+            if count:
+                archived += 1
+                messages += count
+            else:
+                skipped += 1
+        if archived:
+            logger.info("Archived %d threads (%d messages), skipped %d", archived, messages, skipped)
+        return {"candidates": len(candidates), "archived": archived, "messages": messages, "skipped": skipped}
+
+    def _candidates(self, cutoff: str) -> List[dict]:
+        return (
+            get_supabase().table("threads")
+            .select("id, user_id, updated_at")
+            .is_("archived_at", "null")
+            .lt("updated_at", cutoff)
+            .or_(f"restored_at.is.null,restored_at.lt.{cutoff}")
+            .order("updated_at")
+            .limit(self.batch_size)
+            .execute().data or []
+        )
+
+    @staticmethod
+    def _archive_thread(thread: dict) -> int:
+        """Archive one thread; returns the messages moved (0: nothing to do or thread changed)"""
+        supabase = get_supabase()
+        messages = (
+            supabase.table("messages").select("*")
+            .eq("thread_id", thread["id"])
+            .order("created_at")
+            .execute().data or []
+        )
+        if not messages:
+            return 0  # empty threads are left to the garbage collector
+
+        raw = json.dumps({
+            "format": ARCHIVE_FORMAT,
+            "thread_id": thread["id"],
+            "messages": messages,
+        }, ensure_ascii=False).encode("utf-8")
+        blob = _compress(raw)
+        # unique per attempt: a concurrent run (admin API) never touches this blob
+        path = f"{thread['user_id']}/{thread['id']}-{uuid.uuid4().hex[:8]}.json.zst"
+        supabase.storage.from_(ARCHIVE_BUCKET).upload(
+            path=path,
+            file=blob,
+            file_options={"content-type": "application/zstd", "upsert": "true"},
+        )
+
+        # tombstone only if nobody wrote to the thread since it was selected
+        marked = (
+            supabase.table("threads")
+            .update({
+                "archived_at": datetime.now(timezone.utc).isoformat(),
+                "archive_path": path,
+                "archived_messages": len(messages),
+            })
+            .eq("id", thread["id"])
+            .eq("updated_at", thread["updated_at"])
+            .is_("archived_at", "null")
+            .execute().data
+        )
+        if not marked:
+            supabase.storage.from_(ARCHIVE_BUCKET).remove([path])
+            return 0
+
+        # only the archived ids: a message added meanwhile stays live
+        for ids in _chunks([message["id"] for message in messages]):
+            supabase.table("messages").delete().in_("id", ids).execute()
+
+        metrics.THREAD_ARCHIVE.labels("archived").inc()
+        metrics.THREAD_ARCHIVE_BYTES.labels("raw").inc(len(raw))
+        metrics.THREAD_ARCHIVE_BYTES.labels("compressed").inc(len(blob))
+        return len(messages)
+
+    # -------------------- Restore --------------------
+
+    @staticmethod
+    def read_messages(path: str) -> List[dict]:
+        """Messages stored in an archive blob, without restoring them"""
+        blob = get_supabase().storage.from_(ARCHIVE_BUCKET).download(path)
+        return json.loads(_decompress(blob))["messages"]
+
+    async def restore(self, thread_id: UUID) -> None:
+        """Move an archived thread's messages back into `messages`; no-op if it is not archived"""
+        key = str(thread_id)
+        lock = self._restoring.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                await asyncio.to_thread(self._restore_thread, key)
+        finally:
+            if not lock.locked():
+                self._restoring.pop(key, None)
+
+    @staticmethod
+    def _restore_thread(thread_id: str) -> None:
+        supabase = get_supabase()
+        rows = (
+            supabase.table("threads").select("archive_path")
+            .eq("id", thread_id)
+            .not_.is_("archived_at", "null")
+            .execute().data
+        )
+        if not rows:
+            return  # restored meanwhile by another request or process
+        path = rows[0]["archive_path"]
+        archived = ArchiveService.read_messages(path)
+
+        # upsert by id: a half-finished archival left some rows in place
+        for messages in _chunks(archived):
+            supabase.table("messages").upsert(messages, on_conflict="id").execute()
+        supabase.table("threads").update({
+            "archived_at": None,
+            "archive_path": None,
+            "archived_messages": None,
+            "restored_at": datetime.now(timezone.utc).isoformat(),
+        }).eq("id", thread_id).execute()
+        try:
+            supabase.storage.from_(ARCHIVE_BUCKET).remove([path])
+        except Exception as e:
+            logger.warning("Removing archive %s failed: %s", path, repr(e))
+        metrics.THREAD_ARCHIVE.labels("restored").inc()
+        logger.info("Restored thread %s (%d messages)", thread_id, len(archived))
+
+
+# Singleton instance
+settings = get_settings()
+archive_service = ArchiveService(
+    settings.archive_after_days, settings.archive_interval, settings.archive_batch_size,
+)
+
+
+def get_archive_service() -> ArchiveService:
+    """Get archive service instance"""
+    return archive_service
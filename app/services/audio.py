@@ -0,0 +1,295 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import math
+import shutil
+import subprocess
+import wave
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Audio preprocessing configuration
+settings = get_settings()
+AUDIO_PREPROCESS = settings.audio_preprocess
+AUDIO_SAMPLE_RATE = settings.audio_sample_rate
+AUDIO_TRIM_SILENCE = settings.audio_trim_silence
+AUDIO_TRIM_THRESHOLD = settings.audio_trim_threshold
+AUDIO_TRIM_PADDING_MS = settings.audio_trim_padding_ms
+AUDIO_ENCODE = settings.audio_encode  # wav | flac | opus
+AUDIO_OPUS_BITRATE = settings.audio_opus_bitrate
+AUDIO_WORKERS = settings.audio_workers
+MAX_UPLOAD_BYTES = int(settings.max_upload_mb * 1024 * 1024)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+FFMPEG = shutil.which("ffmpeg")
+
+ENCODINGS = {
+    "wav": ("audio/wav", "wav"),
+    "flac": ("audio/flac", "flac"),
+    "opus": ("audio/ogg", "ogg"),
+}
+
+
+@dataclass
+class ProcessedAudio:
+    data: bytes
+    content_type: str
+    extension: str
+    pcm: Optional[bytes] = None  # normalized 16-bit mono PCM (None if passed through)
+    sample_rate: Optional[int] = None
+    duration: Optional[float] = None
+
+    @property
+    def filename(self) -> str:
+        return f"audio.{self.extension}"
+
+    @property
+    def content_hash(self) -> str:
+        """BLAKE2 digest of the normalized PCM (or the raw bytes if not decoded)"""
+        return hashlib.blake2b(self.pcm or self.data, digest_size=16).hexdigest()
+
+
+# -------------------- Uploads --------------------
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Audio is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+
+
+async def read_upload(upload: UploadFile, max_bytes: Optional[int] = None) -> bytes:
+    """Read an uploaded file into memory, rejecting it (413) before reading if it is over the limit"""
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    if upload.size is not None and upload.size > max_bytes:
+        await upload.close()
+        raise _too_large()
+    # size is unknown for some clients: stop reading one chunk past the limit
+    chunks = []
+    total = 0
+    try:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            total += len(chunk)
+            if total > max_bytes:
+                raise _too_large()
+            chunks.append(chunk)
+    finally:
+        await upload.close()
+    return b"".join(chunks)
+
+
+def decode_base64_audio(data: str, max_bytes: Optional[int] = None) -> bytes:
+    """Decode base64 audio, rejecting it (413) before decoding if the result would be over the limit"""
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    if len(data) * 3 // 4 > max_bytes:
+        raise _too_large()
+    try:
+        return base64.b64decode(data)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="audio_base64 is not valid base64")
+
+
+# -------------------- PCM helpers (run inside worker processes) --------------------
+
+def _to_int16(frames: bytes, sampwidth: int) -> array:
+    """Convert little-endian PCM of any common width to 16-bit samples"""
+    if sampwidth == 2:
+        samples = array("h")
+        samples.frombytes(frames)
+        return samples
+    if sampwidth == 1:
+        # 8-bit WAV is unsigned
+        return array("h", ((b - 128) << 8 for b in frames))
+    if sampwidth == 3:
+        return array("h", (
+            int.from_bytes(frames[i:i + 3], "little", signed=True) >> 8
+            for i in range(0, len(frames) - 2, 3)
+        ))
+    if sampwidth == 4:
+        wide = array("i")
+        wide.frombytes(frames)
+        return array("h", (s >> 16 for s in wide))
+    raise ValueError(f"Unsupported sample width: {sampwidth}")
+
+
+def _downmix(samples: array, channels: int) -> array:
+    if channels == 1:
+        return samples
+    return array("h", (
+        sum(samples[i:i + channels]) // channels
+        for i in range(0, len(samples) - channels + 1, channels)
+    ))
+
+
+def _resample(samples: array, src_rate: int, dst_rate: int) -> array:
+    """Linear-interpolation resampler (sufficient for speech recognition)"""
+    if src_rate == dst_rate or not samples:
+        return samples
+    out_len = int(len(samples) * dst_rate / src_rate)
+    step = src_rate / dst_rate
+    last = len(samples) - 1
+    out = array("h", bytes(out_len * 2))
+    for i in range(out_len):
+        pos = i * step
+        idx = int(pos)
+        if idx >= last:
+            out[i] = samples[last]
+            continue
+        frac = pos - idx
+        out[i] = int(samples[idx] + (samples[idx + 1] - samples[idx]) * frac)
+    return out
+
+
+def _trim_silence(samples: array, sample_rate: int) -> array:
+    """Drop leading/trailing frames quieter than the trim threshold"""
+    frame = max(1, sample_rate // 50)  # 20 ms
+    n_frames = len(samples) // frame
+    voiced = []
+    for f in range(n_frames):
+        chunk = samples[f * frame:(f + 1) * frame]
+        rms = math.sqrt(sum(s * s for s in chunk) / len(chunk))
+        voiced.append(rms >= AUDIO_TRIM_THRESHOLD)
+
+    if not any(voiced):
+        return samples
+
+    pad = AUDIO_TRIM_PADDING_MS * sample_rate // 1000
+    start = max(0, voiced.index(True) * frame - pad)
+    end = min(len(samples), (n_frames - voiced[::-1].index(True)) * frame + pad)
+    return samples[start:end]
+
+
+def _decode_wav(data: bytes) -> Optional[array]:
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        if wav.getcomptype() != "NONE":
+            return None
+        channels, sampwidth, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    samples = _downmix(_to_int16(frames, sampwidth), channels)
+    return _resample(samples, rate, AUDIO_SAMPLE_RATE)
+
+
+def _decode_ffmpeg(data: bytes) -> Optional[array]:
+    if not FFMPEG:
+        return None
+    proc = subprocess.run(
+        [FFMPEG, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-ac", "1", "-ar", str(AUDIO_SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        input=data, capture_output=True, check=True,
+    )
+    samples = array("h")
+    samples.frombytes(proc.stdout[: len(proc.stdout) - len(proc.stdout) % 2])
+    return samples
+
+
+def _encode(pcm: bytes, encoding: str) -> bytes:
+    if encoding == "wav" or not FFMPEG:
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(AUDIO_SAMPLE_RATE)
+            wav.writeframes(pcm)
+        return buf.getvalue()
+
+    codec = ["-c:a", "flac", "-f", "flac"] if encoding == "flac" else \
+        ["-c:a", "libopus", "-b:a", AUDIO_OPUS_BITRATE, "-application", "voip", "-f", "ogg"]
+    proc = subprocess.run(
+        [FFMPEG, "-hide_banner", "-loglevel", "error",
+         "-f", "s16le", "-ac", "1", "-ar", str(AUDIO_SAMPLE_RATE), "-i", "pipe:0",
+         *codec, "pipe:1"],
+        input=pcm, capture_output=True, check=True,
+    )
+    return proc.stdout
+
+
+def preprocess_audio_sync(data: bytes, encoding: str = AUDIO_ENCODE) -> Optional[ProcessedAudio]:
+    """
+    Decode, downmix to mono, resample, trim silence and re-encode audio.
+    Returns None when the input cannot be decoded (caller keeps the original).
+    """
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        samples = _decode_wav(data)
+    else:
+        samples = None
+    if samples is None:
+        samples = _decode_ffmpeg(data)
+    if samples is None:
+        return None
+
+    if AUDIO_TRIM_SILENCE:
+        samples = _trim_silence(samples, AUDIO_SAMPLE_RATE)
+
+    pcm = samples.tobytes()
+    if encoding not in ENCODINGS or (encoding != "wav" and not FFMPEG):
+        encoding = "wav"
+    content_type, extension = ENCODINGS[encoding]
+    return ProcessedAudio(
+        data=_encode(pcm, encoding),
+        content_type=content_type,
+        extension=extension,
+        pcm=pcm,
+        sample_rate=AUDIO_SAMPLE_RATE,
+        duration=len(samples) / AUDIO_SAMPLE_RATE,
+    )
+
+
+# -------------------- Async entry point --------------------
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_audio_executor() -> ProcessPoolExecutor:
+    """Process pool used for CPU-bound audio work"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=AUDIO_WORKERS)
+    return _executor
+
+
+def shutdown_audio_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def preprocess_audio(
+    data: bytes,
+    content_type: str = "audio/wav",
+    filename: str = "audio.wav",
+) -> ProcessedAudio:
+    """
+    Normalize audio for STT and storage without blocking the event loop.
+    Falls back to the original bytes if preprocessing is disabled or fails.
+    """
+    extension = filename.rsplit(".", 1)[1] if "." in filename else "wav"
+    original = ProcessedAudio(data=data, content_type=content_type or "audio/wav", extension=extension)
+    if not AUDIO_PREPROCESS or not data:
+        return original
+
+    loop = asyncio.get_running_loop()
+    try:
+        processed = await loop.run_in_executor(get_audio_executor(), preprocess_audio_sync, data)
+    except Exception as e:
+        logger.warning("Audio preprocessing failed, using original audio: %s", repr(e))
+        return original
+
+    if processed is None:
+        return original
+    if len(processed.data) >= len(data):
+        # e.g. an already compressed upload: keep its bytes, but expose the normalized PCM
+        original.pcm = processed.pcm
+        original.sample_rate = processed.sample_rate
+        original.duration = processed.duration
+        return original
+    return processed
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.database import get_supabase
+from app.services import metrics
+from app.services.cache import TTLCache
+from app.services.thread import AUDIO_BUCKET
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Evict down to this share of the budget, so a full cache does not rescan on every write
+LOW_WATERMARK = 0.9
+
+CONTENT_TYPES = {
+    "wav": "audio/wav",
+    "ogg": "audio/ogg",
+    "opus": "audio/ogg",
+    "webm": "audio/webm",
+    "mp3": "audio/mpeg",
+    "m4a": "audio/mp4",
+    "flac": "audio/flac",
+}
+
+_CONTENT_HASH = re.compile(r"[0-9a-f]{32}")
+
+
+def content_type(path: str) -> str:
+    return CONTENT_TYPES.get(path.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+
+
+class AudioCache:
+    """
+    Bounded on-disk LRU cache of `audio` bucket blobs, shared by the server
+    processes of a host.
+
+    A miss downloads the blob once (concurrent requests for it wait for the
+    same download) and writes it atomically under AUDIO_CACHE_DIR; a hit
+    only bumps the file's mtime, which is the LRU order. When the files
+    exceed AUDIO_CACHE_MAX_MB the least recently used are deleted. Blobs are
+    content-addressed, so a cached file never changes, but the garbage
+    collector may delete its blob: it discards the files on its own host,
+    and a hit on a file not checked for AUDIO_CACHE_REVALIDATE seconds asks
+    storage whether the blob still exists.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, revalidate_after: float = 0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self._size: Optional[int] = None  # this process's estimate; rescanned on eviction
+        self._fetching: Dict[str, asyncio.Lock] = {}
+        self._etags = TTLCache(maxsize=4096, ttl=24 * 3600)
+        # paths confirmed to exist in storage within revalidate_after
+        self._verified = TTLCache(maxsize=4096, ttl=revalidate_after)
+
+    def _file(self, path: str) -> Path:
+        return self.directory / hashlib.sha256(path.encode("utf-8")).hexdigest()
+
+    async def get(self, path: str) -> Optional[Path]:
+        """Local copy of a stored blob, or None if storage does not have it"""
+        local = self._file(path)
+        if self._touch(local):
+            if not await self._still_stored(path, local):
+                return None
+            metrics.AUDIO_CACHE.labels("hit").inc()
+            return local
+
+        lock = self._fetching.setdefault(path, asyncio.Lock())
+        try:
+            async with lock:
+                if self._touch(local):  # fetched while we waited
+                    metrics.AUDIO_CACHE.labels("hit").inc()
+                    return local
+                return await asyncio.to_thread(self._fetch, path, local)
+        finally:
+            if not lock.locked():
+                self._fetching.pop(path, None)
+
+    async def _still_stored(self, path: str, local: Path) -> bool:
+        """False (and the file dropped) if the blob was deleted from storage since it was cached"""
+        if self.revalidate_after <= 0 or path in self._verified:
+            return True
+        try:
+            exists = await asyncio.to_thread(get_supabase().storage.from_(AUDIO_BUCKET).exists, path)
+        except Exception as e:
+            # storage unreachable: keep serving, check again on the next hit
+            logger.warning("Revalidating cached audio %s failed: %s", path, repr(e))
+            return True
+        if not exists:
+            metrics.AUDIO_CACHE.labels("missing").inc()
+            self.discard([path])
+            return False
+        self._verified.set(path, True)
+        return True
+
+    @staticmethod
+    def _touch(local: Path) -> bool:
+        try:
+            os.utime(local)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _fetch(self, path: str, local: Path) -> Optional[Path]:
+        from storage3.utils import StorageException
+
+        try:
+            data = get_supabase().storage.from_(AUDIO_BUCKET).download(path)
+        except StorageException as e:
+            if "not_found" in str(e) or "404" in str(e):
+                metrics.AUDIO_CACHE.labels("missing").inc()
+                return None
+            raise
+        metrics.AUDIO_CACHE.labels("miss").inc()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, local)
+        self._verified.set(path, True)
+
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += len(data)
+        if self._size > self.max_bytes:
+            self._evict(keep=local)
+        return local
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def _evict(self, keep: Path) -> None:
+        # other processes write here too: rescan instead of trusting the estimate
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith(".tmp-"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(file_size for _, file_size, _ in files)
+        target = self.max_bytes * LOW_WATERMARK
+        evicted = 0
+        for _, file_size, file_path in sorted(files):
+            if size <= target:
+                break
+            if file_path == str(keep):
+                continue
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+            evicted += 1
+        self._size = size
+        metrics.AUDIO_CACHE.labels("evicted").inc(evicted)
+
+    def etag(self, path: str, local: Path) -> str:
+        """Strong ETag: the content hash the blob is stored under, else a hash of the file"""
+        stem = path.rsplit("/", 1)[-1].split(".", 1)[0]
+        if _CONTENT_HASH.fullmatch(stem):
+            return f'"{stem}"'
+        etag = self._etags.get(path)
+        if etag is None:
+            etag = f'"{hashlib.blake2b(local.read_bytes(), digest_size=16).hexdigest()}"'
+            self._etags.set(path, etag)
+        return etag
+
+    def discard(self, paths: List[str]) -> None:
+        """Forget blobs deleted from storage"""
+        for path in paths:
+            try:
+                os.remove(self._file(path))
+            except FileNotFoundError:
+                pass
+
+
+# Singleton instance
+settings = get_settings()
+audio_cache = AudioCache(
+    settings.audio_cache_dir,
+    int(settings.audio_cache_max_mb * 1024 * 1024),
+    settings.audio_cache_revalidate,
+)
+
+
+def get_audio_cache() -> AudioCache:
+    """Get audio cache instance"""
+    return audio_cache
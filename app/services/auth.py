@@ -0,0 +1,48 @@
+import hashlib
+from typing import TYPE_CHECKING, Optional
+from uuid import UUID
+
+from fastapi import Header, HTTPException
+
+from app.database import get_supabase
+from app.services.singleflight import get_single_flight
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+
+def _verify(token: str) -> Optional[UUID]:
+    supabase: "Client" = get_supabase()
+    user = supabase.auth.get_user(token)
+    if not user or not user.user:
+        return None
+    return UUID(user.user.id)
+
+
+async def verify_token(token: str) -> Optional[UUID]:
+    """
+    User of a Supabase access token, None if it is not valid.
+
+    Requests sent together with the same token (a client opening a thread)
+    share one verification; raises if Supabase could not be asked.
+    """
+    key = (hashlib.sha256(token.encode("utf-8")).hexdigest(),)
+    return await get_single_flight().call("verify_token", key, _verify, token)
+
+
+async def get_current_user_id(
+    authorization: str = Header(..., description="Bearer token")
+) -> UUID:
+    """Extract and verify user from JWT token"""
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+
+    token = authorization.replace("Bearer ", "")
+
+    try:
+        user_id = await verify_token(token)
+    except Exception as e:
+        raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return user_id
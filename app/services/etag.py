@@ -0,0 +1,34 @@
+import hashlib
+from typing import Iterable, Optional
+
+
+def weak_etag(*parts: object) -> str:
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode("utf-8"), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def thread_etag(thread: dict) -> str:
+    """
+    Version of a thread and its messages from the thread row alone: every
+    change to the thread or its messages bumps `updated_at`; archiving and
+    restoring set `archived_at`. Audio expired by the garbage collector sets
+    `audio_expired_at` instead, so the thread does not move up the list.
+    """
+    return weak_etag(
+        thread["id"], thread.get("updated_at"), thread.get("archived_at"), thread.get("audio_expired_at"),
+    )
+
+
+def threads_etag(threads: Iterable[dict]) -> str:
+    """Version of a thread list: changes when a thread is added, removed or changed"""
+    return weak_etag(*(thread_etag(thread) for thread in threads))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check with weak comparison (RFC 9110 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
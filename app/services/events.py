@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional, Set
+from uuid import UUID
+
+from app.services import metrics
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Redis channel / Postgres NOTIFY channel carrying every user's events
+CHANNEL = "thread_events"
+
+# Events buffered per subscriber; a slower client gets a `resync` instead
+QUEUE_SIZE = 100
+
+# Seconds between reconnection attempts of the relay
+RECONNECT_DELAY = 2.0
+
+# Seconds between keep-alive comments on an idle event stream (proxies close silent connections)
+HEARTBEAT = 15.0
+
+# Put in a subscriber's queue when the server stops streaming events
+CLOSED = {"type": "reconnect"}
+RESYNC = {"type": "resync"}
+
+
+class RedisRelay:
+    """Relays events between workers over one Redis pub/sub channel (`pip install redis`)"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+
+    async def publish(self, message: str) -> None:
+        await self._client.publish(CHANNEL, message)
+
+    async def listen(self, on_message: Callable[[str], None], connected: Callable[[], None]) -> None:
+        pubsub = self._client.pubsub()
+        try:
+            await pubsub.subscribe(CHANNEL)
+            connected()
+            async for item in pubsub.listen():
+                if item["type"] == "message":
+                    on_message(item["data"].decode("utf-8"))
+        finally:
+            await pubsub.aclose()
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class PostgresRelay:
+    """Relays events between workers with LISTEN/NOTIFY (`pip install asyncpg`, EVENT_BUS_URL=postgresql://...)"""
+
+    def __init__(self, url: str):
+        import asyncpg
+
+        self._asyncpg = asyncpg
+        self._url = url
+        self._pool = None
+
+    async def publish(self, message: str) -> None:
+        if self._pool is None:
+            self._pool = await self._asyncpg.create_pool(self._url, min_size=1, max_size=2)
+        await self._pool.execute("SELECT pg_notify($1, $2)", CHANNEL, message)
+
+    async def listen(self, on_message: Callable[[str], None], connected: Callable[[], None]) -> None:
+        connection = await self._asyncpg.connect(self._url)
+        lost = asyncio.get_running_loop().create_future()
+        try:
+            connection.add_termination_listener(lambda _: lost.done() or lost.set_result(None))
+            await connection.add_listener(CHANNEL, lambda _conn, _pid, _channel, payload: on_message(payload))
+            connected()
+            await lost
+            raise ConnectionError("LISTEN connection closed")
+        finally:
+            if not connection.is_closed():
+                await connection.close()
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+
+
+class EventBus:
+    """
+    Per-user thread events (created, updated, title, deleted) for the
+    GET /chat/events stream.
+
+    Subscribers are local queues. With EVENT_BUS_BACKEND=memory (default) an
+    event reaches the subscribers of the process that published it, which
+    is enough with a single worker. With `redis` or `postgres` every event
+    goes through the relay (EVENT_BUS_URL) and each worker delivers it to
+    its own subscribers. While the relay is reconnecting, events can be
+    lost, so subscribers get a `resync` event once it is back: refetch the
+    thread list then.
+    """
+
+    def __init__(self, backend: str, url: str):
+        if backend not in ("memory", "redis", "postgres"):
+            raise ValueError(f"EVENT_BUS_BACKEND must be memory, redis or postgres, not {backend!r}")
+        if backend != "memory" and not url:
+            raise ValueError(f"EVENT_BUS_BACKEND={backend} needs EVENT_BUS_URL")
+        self.backend = backend
+        self.url = url
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._relay = None
+        self._task: Optional[asyncio.Task] = None
+        self._connected_once = False
+
+    async def start(self) -> None:
+        if self.backend == "memory" or self._task is not None:
+            return
+        self._relay = RedisRelay(self.url) if self.backend == "redis" else PostgresRelay(self.url)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self.close_streams()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._relay is not None:
+            await self._relay.close()
+            self._relay = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._relay.listen(self._on_message, self._on_connected)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Event relay (%s) disconnected: %s", self.backend, repr(e))
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _on_connected(self) -> None:
+        if self._connected_once:
+            # events published while we were away are lost
+            for user_id in list(self._subscribers):
+                self._deliver(user_id, RESYNC)
+        self._connected_once = True
+
+    def _on_message(self, message: str) -> None:
+        try:
+            envelope = json.loads(message)
+            self._deliver(envelope["user_id"], envelope["event"])
+        except (ValueError, KeyError) as e:
+            logger.warning("Ignoring malformed thread event: %s", repr(e))
+
+    # -------------------- Publishing --------------------
+
+    async def publish(self, user_id: UUID, event: dict) -> None:
+        """Send an event to the user's subscribers in every worker; never raises"""
+        metrics.EVENTS_PUBLISHED.labels(event["type"]).inc()
+        if self._relay is None:
+            self._deliver(str(user_id), event)
+            return
+        try:
+            await self._relay.publish(json.dumps({"user_id": str(user_id), "event": event}, default=str))
+        except Exception as e:
+            # clients still see the change on their next resync or fetch
+            logger.warning("Publishing thread event failed: %s", repr(e))
+
+    def _deliver(self, user_id: str, event: dict) -> None:
+        for queue in self._subscribers.get(user_id, ()):
+            _offer(queue, event)
+
+    # -------------------- Subscribing --------------------
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: UUID) -> AsyncIterator[asyncio.Queue]:
+        """Queue of the user's events while the context is open"""
+        key = str(user_id)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subscribers.setdefault(key, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(key)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[key]
+
+    def close_streams(self) -> None:
+        """Ask every open event stream to end (on shutdown); clients reconnect elsewhere"""
+        for queues in self._subscribers.values():
+            for queue in queues:
+                _offer(queue, CLOSED)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+def _offer(queue: asyncio.Queue, event: dict) -> None:
+    if queue.full():
+        # the client fell behind: drop its backlog, it refetches instead
+        while not queue.empty():
+            queue.get_nowait()
+        event = CLOSED if event is CLOSED else RESYNC
+    queue.put_nowait(event)
+
+
+async def publish_thread_event(user_id: UUID, event_type: str, thread: dict, **fields) -> None:
+    """Publish a thread event with the fields clients need to update their list"""
+    await get_event_bus().publish(user_id, {
+        "type": event_type,
+        "thread_id": str(thread["id"]),
+        "title": thread.get("title"),
+        "updated_at": thread.get("updated_at"),
+        **fields,
+    })
+
+
+# Singleton instance
+settings = get_settings()
+event_bus = EventBus(settings.event_bus_backend, settings.event_bus_url)
+
+
+def get_event_bus() -> EventBus:
+    """Get event bus instance"""
+    return event_bus
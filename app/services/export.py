@@ -0,0 +1,166 @@
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+from uuid import UUID
+
+from app.schemas.chat import MessageResponse, ThreadResponse
+from app.services import metrics
+from app.services.archive import get_archive_service
+from app.services.thread import ThreadService, get_thread_service
+
+logger = logging.getLogger("uvicorn.error")
+
+# Rows per database request
+THREAD_PAGE = 100
+MESSAGE_PAGE = 500
+
+# Bytes of NDJSON collected before a chunk is sent (and compressed)
+CHUNK_BYTES = 64 * 1024
+
+# (thread created_at, thread id, message created_at, message id); the
+# message half is None right after a thread line
+Position = Tuple[str, str, Optional[str], Optional[str]]
+
+
+def encode_cursor(position: Position) -> str:
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Position:
+    """Position from an export cursor; ValueError if it is not one"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid export cursor") from e
+    if (
+        not isinstance(position, list) or len(position) != 4
+        or not all(isinstance(value, str) for value in position[:2])
+        or not all(value is None or isinstance(value, str) for value in position[2:])
+        or (position[2] is None) != (position[3] is None)
+    ):
+        raise ValueError("Invalid export cursor")
+    # the values end up in PostgREST filters: only timestamps and canonical ids
+    for timestamp in (position[0], position[2]):
+        if timestamp is not None:
+            datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    for row_id in (position[1], position[3]):
+        if row_id is not None and str(UUID(row_id)) != row_id:
+            raise ValueError("Invalid export cursor")
+    return tuple(position)
+
+
+def _line(record: dict) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class ExportService:
+    """
+    Streams all of a user's threads and messages as NDJSON.
+
+    One line per thread, followed by one line per message of that thread,
+    oldest first; a final `end` line with the counts marks a complete
+    export. Threads and messages are read page by page with keyset
+    pagination on (created_at, id), so memory does not grow with the
+    history. Every thread and message line carries a `cursor`: passing it
+    back resumes right after that line. Archived threads are read from
+    their archive blob and stay archived.
+    """
+
+    def __init__(self, thread_service: ThreadService):
+        self.thread_service = thread_service
+
+    async def stream(
+        self,
+        user_id: UUID,
+        position: Optional[Position] = None,
+        compress: bool = False,
+    ) -> AsyncIterator[bytes]:
+        """NDJSON in chunks of about CHUNK_BYTES, gzip-compressed if `compress`"""
+        gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        buffer = bytearray()
+        async for line in self.lines(user_id, position):
+            buffer += line
+            if len(buffer) >= CHUNK_BYTES:
+                chunk = gzip.compress(bytes(buffer)) + gzip.flush(zlib.Z_SYNC_FLUSH) if gzip else bytes(buffer)
+                buffer.clear()
+                yield chunk
+        yield gzip.compress(bytes(buffer)) + gzip.flush() if gzip else bytes(buffer)
+
+    async def lines(self, user_id: UUID, position: Optional[Position] = None) -> AsyncIterator[bytes]:
+        threads = messages = 0
+        # the thread the cursor points into: its line was already sent
+        resumed = position[1] if position else None
+        after = (position[0], position[1]) if position else None
+        try:
+            while True:
+                page = await self.thread_service.get_threads_page(
+                    user_id, after, THREAD_PAGE, inclusive=resumed is not None,
+                )
+                if not page:
+                    break
+                for thread in page:
+                    key = (thread["created_at"], thread["id"])
+                    message_after = None
+                    if thread["id"] == resumed:
+                        if position[2] is not None:
+                            message_after = (position[2], position[3])
+                    else:
+                        yield _line({
+                            "type": "thread",
+                            "cursor": encode_cursor((*key, None, None)),
+                            "thread": ThreadResponse.model_validate(thread).model_dump(mode="json"),
+                        })
+                        threads += 1
+                    async for message in self._messages(thread, message_after):
+                        yield _line({
+                            "type": "message",
+                            "cursor": encode_cursor((*key, message["created_at"], message["id"])),
+                            "message": MessageResponse.model_validate(message).model_dump(mode="json"),
+                        })
+                        messages += 1
+                    resumed = None
+                after = (page[-1]["created_at"], page[-1]["id"])
+        except Exception as e:
+            # no `end` line: the client resumes from the last cursor it got
+            logger.warning("Export for user %s interrupted: %s", user_id, repr(e))
+            yield _line({"type": "error", "detail": "Export interrupted; resume from the last cursor"})
+            return
+        finally:
+            metrics.EXPORT_ROWS.labels("thread").inc(threads)
+            metrics.EXPORT_ROWS.labels("message").inc(messages)
+        yield _line({"type": "end", "threads": threads, "messages": messages})
+
+    async def _messages(self, thread: dict, after: Optional[Tuple[str, str]]) -> AsyncIterator[dict]:
+        if thread.get("archived_at"):
+            archived: List[dict] = await asyncio.to_thread(
+                get_archive_service().read_messages, thread["archive_path"],
+            )
+            archived.sort(key=lambda message: (message["created_at"], message["id"]))
+            for message in archived:
+                if after is None or (message["created_at"], message["id"]) > after:
+                    yield message
+            return
+
+        while True:
+            page = await self.thread_service.get_messages_page(thread["id"], after, MESSAGE_PAGE)
+            for message in page:
+                yield message
+            if len(page) < MESSAGE_PAGE:
+                return
+            after = (page[-1]["created_at"], page[-1]["id"])
+
+
+# Singleton instance
+export_service = ExportService(get_thread_service())
+
+
+def get_export_service() -> ExportService:
+    """Get export service instance"""
+    return export_service
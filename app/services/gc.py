@@ -0,0 +1,345 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server only
+    fcntl = None
+
+from postgrest.exceptions import APIError
+
+from app.database import get_supabase
+from app.services import metrics
+from app.services.archive import ARCHIVE_BUCKET, get_archive_service
+from app.services.audio_cache import get_audio_cache
+from app.services.health import get_dependency_monitor
+from app.services.thread import AUDIO_BUCKET, audio_path
+from app.settings import PROJECT_ROOT, get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# ThreadService skips re-uploading audio it wrote in the last 24 hours, so a
+# younger blob may be referenced by a message that is being saved right now
+MIN_GRACE_HOURS = 24
+
+# GC_EMPTY_THREADS: which threads without messages are deleted
+EMPTY_THREAD_POLICIES = ("untitled", "all", "off")
+
+# Rows per read of the references to a user's audio: PostgREST cuts longer
+# responses to its max-rows (1000 on Supabase) without an error
+PAGE_SIZE = 1000
+
+# PostgREST's error for a function the database does not have
+UNDEFINED_FUNCTION = "PGRST202"
+
+LOCK_PATH = PROJECT_ROOT / "data" / "gc.lock"
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _chunks(items: List, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class GarbageCollector:
+    """
+    Removes what nothing refers to any more, in small rate-limited batches.
+
+    Every GC_INTERVAL seconds:
+      - with GC_EMPTY_THREADS set, threads without messages older than
+        GC_GRACE_HOURS (at least 24) are deleted, GC_BATCH_SIZE at a time,
+        by the `delete_empty_threads` function. `untitled` deletes only
+        untitled ones (a /chat/send that failed after creating its thread
+        leaves it without a title), `all` includes threads created empty on
+        purpose with a title. Off by default: the function comes with the
+        migration, and the cycle goes on without it;
+      - GC_BATCH_SIZE user folders of the `audio` and `archive` buckets are
+        listed (the next folders on the next cycle) and blobs older than
+        GC_GRACE_HOURS that no message or thread refers to are removed.
+        Audio referenced from an archived thread's blob counts as
+        referenced. With AUDIO_RETENTION_DAYS set, audio older than that is
+        removed too and the live messages lose their `audio_url`; audio of
+        archived threads is kept. The references are read in full, page by
+        page: a reference missed would delete audio still in use.
+
+    Audio blobs are content-addressed and may be shared between messages
+    and threads, so `delete_thread` leaves them to the collector. Every
+    Supabase request waits its turn at GC_REQUESTS_PER_SECOND, cycles are
+    skipped while the server drains, and with several server processes only
+    the one holding data/gc.lock collects.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        grace_hours: float,
+        empty_threads: str,
+        audio_retention_days: float,
+        batch_size: int,
+        requests_per_second: float,
+    ):
+        self.interval = interval
+        if empty_threads not in EMPTY_THREAD_POLICIES:
+            raise ValueError(f"GC_EMPTY_THREADS must be one of {', '.join(EMPTY_THREAD_POLICIES)}, not {empty_threads!r}")
+        self.grace_hours = max(grace_hours, MIN_GRACE_HOURS)
+        self.empty_threads = empty_threads
+        self.audio_retention_days = audio_retention_days
+        self.batch_size = batch_size
+        self.requests_per_second = requests_per_second
+        self._task: Optional[asyncio.Task] = None
+        self._lock_file = None
+        self._next_request = 0.0
+        # where the folder listing of each bucket continues
+        self._folder_offsets: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _is_leader(self) -> bool:
+        if fcntl is None:
+            return True
+        if self._lock_file is None:
+            LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+            self._lock_file = open(LOCK_PATH, "a")
+        try:
+            # held for the life of the process; the OS releases it if we die
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if get_dependency_monitor().draining or not self._is_leader():
+                continue
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Garbage collection cycle failed")
+
+    async def _call(self, fn, *args, **kwargs):
+        """Run one blocking Supabase request, paced to GC_REQUESTS_PER_SECOND"""
+        if self.requests_per_second > 0:
+            now = time.monotonic()
+            if self._next_request > now:
+                await asyncio.sleep(self._next_request - now)
+            self._next_request = max(self._next_request, now) + 1 / self.requests_per_second
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    # -------------------- Cycle --------------------
+
+    async def run_once(self) -> dict:
+        """One collection cycle; returns counts for logs and the admin API"""
+        now = datetime.now(timezone.utc)
+        grace_cutoff = now - timedelta(hours=self.grace_hours)
+        retention_cutoff = (
+            now - timedelta(days=self.audio_retention_days) if self.audio_retention_days > 0 else None
+        )
+        counts = {
+            "empty_threads": await self._delete_empty_threads(grace_cutoff),
+            "folders": 0,
+            "audio_orphans": 0,
+            "audio_expired": 0,
+            "archive_orphans": 0,
+        }
+        for folder in await self._folders(AUDIO_BUCKET):
+            orphans, expired = await self._collect_audio(folder, grace_cutoff, retention_cutoff)
+            counts["folders"] += 1
+            counts["audio_orphans"] += orphans
+            counts["audio_expired"] += expired
+        for folder in await self._folders(ARCHIVE_BUCKET):
+            counts["folders"] += 1
+            counts["archive_orphans"] += await self._collect_archives(folder, grace_cutoff)
+
+        if any(value for key, value in counts.items() if key != "folders"):
+            logger.info("Garbage collection: %s", counts)
+        return counts
+
+    async def _delete_empty_threads(self, before: datetime) -> int:
+        if self.empty_threads == "off":
+            return 0
+        rpc = get_supabase().rpc("delete_empty_threads", {
+            "p_before": before.isoformat(),
+            "p_limit": self.batch_size,
+            "p_untitled_only": self.empty_threads == "untitled",
+        })
+        try:
+            deleted = (await self._call(rpc.execute)).data or []
+        except APIError as e:
+            if e.code != UNDEFINED_FUNCTION:
+                raise
+            logger.warning(
+                "GC_EMPTY_THREADS=%s needs delete_empty_threads from app/models/thread.py; skipping empty threads",
+                self.empty_threads,
+            )
+            return 0
+        metrics.GC_DELETED.labels("empty_thread").inc(len(deleted))
+        return len(deleted)
+
+    async def _all_rows(self, build: Callable[[], Any]) -> List[dict]:
+        """Every row of a query (built afresh per page), until a page comes back empty"""
+        rows: List[dict] = []
+        while True:
+            # a short page is not the end: max-rows may be below PAGE_SIZE
+            query = build().range(len(rows), len(rows) + PAGE_SIZE - 1)
+            page = (await self._call(query.execute)).data or []
+            if not page:
+                return rows
+            rows.extend(page)
+
+    # -------------------- Storage --------------------
+
+    async def _folders(self, bucket: str) -> List[str]:
+        """The next GC_BATCH_SIZE top-level folders (one per user) of a bucket"""
+        offset = self._folder_offsets.get(bucket, 0)
+        items = await self._call(get_supabase().storage.from_(bucket).list, "", {
+            "limit": self.batch_size,
+            "offset": offset,
+            "sortBy": {"column": "name", "order": "asc"},
+        })
+        # start over once the end is reached
+        self._folder_offsets[bucket] = offset + len(items) if len(items) == self.batch_size else 0
+        return [item["name"] for item in items if item.get("id") is None]
+
+    async def _old_files(self, bucket: str, folder: str, cutoff: datetime) -> List[Tuple[str, datetime]]:
+        """Files of a folder last written before `cutoff`, with that time"""
+        files: List[Tuple[str, datetime]] = []
+        offset = 0
+        while True:
+            items = await self._call(get_supabase().storage.from_(bucket).list, folder, {
+                "limit": self.batch_size,
+                "offset": offset,
+                "sortBy": {"column": "name", "order": "asc"},
+            })
+            for item in items:
+                # a re-upload refreshes updated_at, so a reused blob is young again
+                written = _timestamp(item.get("updated_at") or item.get("created_at"))
+                if item.get("id") is not None and written is not None and written < cutoff:
+                    files.append((f"{folder}/{item['name']}", written))
+            if len(items) < self.batch_size:
+                return files
+            offset += len(items)
+
+    async def _remove(self, bucket: str, paths: List[str]) -> None:
+        for chunk in _chunks(paths, self.batch_size):
+            await self._call(get_supabase().storage.from_(bucket).remove, chunk)
+
+    async def _collect_archives(self, user_id: str, cutoff: datetime) -> int:
+        """Archive blobs no thread points to (an archival or restore cut short)"""
+        files = await self._old_files(ARCHIVE_BUCKET, user_id, cutoff)
+        if not files:
+            return 0
+        referenced: Set[str] = set()
+        for chunk in _chunks([path for path, _ in files], self.batch_size):
+            query = (
+                get_supabase().table("threads").select("archive_path")
+                .eq("user_id", user_id)
+                .in_("archive_path", chunk)
+            )
+            referenced.update(row["archive_path"] for row in (await self._call(query.execute)).data or [])
+        orphans = [path for path, _ in files if path not in referenced]
+        await self._remove(ARCHIVE_BUCKET, orphans)
+        metrics.GC_DELETED.labels("archive_orphan").inc(len(orphans))
+        return len(orphans)
+
+    async def _collect_audio(
+        self,
+        user_id: str,
+        grace_cutoff: datetime,
+        retention_cutoff: Optional[datetime],
+    ) -> Tuple[int, int]:
+        """Remove a user's unreferenced and expired audio; returns (orphans, expired)"""
+        files = await self._old_files(AUDIO_BUCKET, user_id, grace_cutoff)
+        if not files:
+            return 0, 0
+        supabase = get_supabase()
+        threads = await self._all_rows(
+            lambda: supabase.table("threads").select("id, archive_path").eq("user_id", user_id).order("id")
+        )
+
+        # path -> ids of the live messages playing it
+        live: Dict[str, List[str]] = {}
+        thread_of: Dict[str, str] = {}
+        for chunk in _chunks([thread["id"] for thread in threads], self.batch_size):
+            messages = await self._all_rows(
+                lambda: supabase.table("messages").select("id, thread_id, audio_url")
+                .in_("thread_id", chunk)
+                .not_.is_("audio_url", "null")
+                .order("id")
+            )
+            for message in messages:
+                path = audio_path(message["audio_url"])
+                if path:
+                    live.setdefault(path, []).append(message["id"])
+                    thread_of[message["id"]] = message["thread_id"]
+
+        expiring = [
+            path for path, written in files
+            if path in live and retention_cutoff is not None and written < retention_cutoff
+        ]
+        unreferenced = [path for path, _ in files if path not in live]
+        archived: Set[str] = set()
+        if unreferenced or expiring:
+            # only read archive blobs when something could be removed
+            for thread in threads:
+                if thread.get("archive_path"):
+                    messages = await self._call(get_archive_service().read_messages, thread["archive_path"])
+                    archived.update(filter(None, (audio_path(m.get("audio_url")) for m in messages)))
+
+        orphans = [path for path in unreferenced if path not in archived]
+        expired = [path for path in expiring if path not in archived]
+        message_ids = [message_id for path in expired for message_id in live[path]]
+        for chunk in _chunks(message_ids, self.batch_size):
+            query = supabase.table("messages").update({"audio_url": None}).in_("id", chunk)
+            await self._call(query.execute)
+        # new ETag for the affected threads, without bumping updated_at
+        expired_at = datetime.now(timezone.utc).isoformat()
+        for chunk in _chunks(sorted({thread_of[message_id] for message_id in message_ids}), self.batch_size):
+            query = supabase.table("threads").update({"audio_expired_at": expired_at}).in_("id", chunk)
+            await self._call(query.execute)
+        await self._remove(AUDIO_BUCKET, orphans + expired)
+        get_audio_cache().discard(orphans + expired)
+        metrics.GC_DELETED.labels("audio_orphan").inc(len(orphans))
+        metrics.GC_DELETED.labels("audio_expired").inc(len(expired))
+        return len(orphans), len(expired)
+
+
+# Singleton instance
+settings = get_settings()
+garbage_collector = GarbageCollector(
+    settings.gc_interval,
+    settings.gc_grace_hours,
+    settings.gc_empty_threads,
+    settings.audio_retention_days,
+    settings.gc_batch_size,
+    settings.gc_requests_per_second,
+)
+
+
+def get_garbage_collector() -> GarbageCollector:
+    """Get garbage collector instance"""
+    return garbage_collector
@@ -1,27 +1,47 @@
-import os
 import base64
-from pathlib import Path
-from typing import AsyncGenerator, List, Optional
-from dotenv import load_dotenv
-import google.generativeai as genai
-from google.generativeai.types import ContentDict, PartDict
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Callable, List, Optional, Tuple
 
-# Load .env from the backend directory
-env_path = Path(__file__).resolve().parent.parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
+from app.models.usage import TokenUsage
+from app.services import metrics
+from app.services.generation import CHARS_PER_TOKEN, GenerationProfile, gemini_config, get_profile
+from app.services.knowledge import get_knowledge_base
+from app.settings import get_settings
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+if TYPE_CHECKING:
+    from google.generativeai.types import ContentDict, PartDict
 
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY must be set in environment variables")
 
-genai.configure(api_key=GEMINI_API_KEY)
+OnUsage = Callable[[TokenUsage], None]
+
+
+def _cut_at_word(text: str, chars: int) -> str:
+    """At most `chars` characters of `text`, without a word cut in half"""
+    if chars >= len(text):
+        return text
+    cut = text[:max(chars, 0)]
+    if not text[len(cut)].isspace():
+        # drop the partial last word
+        cut = cut[:max(cut.rfind(" "), cut.rfind("\n")) + 1]
+    return cut.rstrip()
 
 
 class GeminiService:
     MODEL_NAME = "gemini-2.5-flash"
 
     def __init__(self):
+        settings = get_settings()
+        if not settings.gemini_api_key:
+            raise ValueError("GEMINI_API_KEY must be set in environment variables")
+
+        # Imported here: the SDK is slow to import and only needed once the service is used
+        import google.generativeai as genai
+
+        client_options = None
+        if settings.gemini_api_endpoint:
+            # e.g. a regional endpoint, a proxy or the local stand-in in bench/fakes.py
+            client_options = {"api_endpoint": settings.gemini_api_endpoint}
+        genai.configure(api_key=settings.gemini_api_key, client_options=client_options)
+        self.genai = genai
         self.model = genai.GenerativeModel(
             model_name=self.MODEL_NAME,
         )
@@ -30,7 +50,7 @@ class GeminiService:
         self,
         messages: List[dict],
         system_instruction: str
-    ) -> List[ContentDict]:
+    ) -> List["ContentDict"]:
         """Build chat history from messages for Gemini API"""
         history = []
 
@@ -43,13 +63,29 @@ class GeminiService:
 
         return history
 
+    def _token_usage(self, usage_metadata) -> TokenUsage:
+        """Convert Gemini usage metadata; thinking tokens count (and bill) as output"""
+        prompt_tokens = usage_metadata.prompt_token_count
+        return TokenUsage(
+            provider="gemini",
+            model=self.MODEL_NAME,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=max(
+                usage_metadata.candidates_token_count,
+                usage_metadata.total_token_count - prompt_tokens,
+            ),
+            cached_tokens=usage_metadata.cached_content_token_count,
+        )
+
     async def chat_stream(
         self,
         message: str,
         history: List[dict],
         system_instruction: str,
         audio_data: Optional[bytes] = None,
-        audio_mime_type: str = "audio/wav"
+        audio_mime_type: str = "audio/wav",
+        on_usage: Optional[OnUsage] = None,
+        profile: Optional[GenerationProfile] = None,
     ) -> AsyncGenerator[str, None]:
         """
         Stream chat response from Gemini.
@@ -60,24 +96,30 @@ class GeminiService:
             system_instruction: System instruction for the model
             audio_data: Optional audio file bytes
             audio_mime_type: MIME type of the audio file
+            on_usage: Called with the token usage once the stream completes
+            profile: Output limits and sampling, the chat endpoint's by default
 
         Yields:
-            Chunks of the response text
+            Chunks of the response text, at most the profile's
+            `max_output_tokens` of them. The request's own cap has room for
+            thinking (see gemini_config), so the answer is cut here at a word
+            boundary and the call is cancelled: generation (and billing)
+            stops at the profile's cap plus the thinking allowance.
         """
+        profile = profile or get_profile("chat")
+
         # Create model with system instruction
-        model = genai.GenerativeModel(
+        model = self.genai.GenerativeModel(
             model_name=self.MODEL_NAME,
-            system_instruction=system_instruction
+            system_instruction=system_instruction,
+            generation_config=gemini_config(profile),
         )
 
         # Build conversation history
-        chat_history = self._build_history(history, system_instruction)
-
-        # Start chat with history
-        chat = model.start_chat(history=chat_history)
+        contents = self._build_history(history, system_instruction)
 
         # Build the message parts
-        parts: List[PartDict] = []
+        parts: List["PartDict"] = []
 
         # Add audio if provided
         if audio_data:
@@ -95,20 +137,66 @@ class GeminiService:
                 parts.append({"text": "Please process this audio and respond appropriately."})
         else:
             parts.append({"text": message})
+        contents.append({"role": "user", "parts": parts})
 
         # Send message and stream response
-        import logging
-        logging.info("[DEBUG] Sending message to Gemini with stream=True")
-        response = await chat.send_message_async(parts, stream=True)
+        response, call = await self._stream(model, contents)
+
+        usage_metadata = None
+        truncated = False
+        answer_chars = answer_tokens = 0
+        try:
+            async for chunk in response:
+                # running totals; the last chunk carries the final counts
+                if chunk.usage_metadata.total_token_count:
+                    usage_metadata = chunk.usage_metadata
+                if chunk.candidates and chunk.candidates[0].finish_reason.name == "MAX_TOKENS":
+                    truncated = True
+                # a chunk without parts (e.g. cut off at the cap) has no `text`
+                text = "".join(part.text for part in chunk.parts) if chunk.candidates else ""
+                if not text:
+                    continue
+
+                answer_chars += len(text)
+                tokens = chunk.usage_metadata.candidates_token_count or answer_chars // CHARS_PER_TOKEN
+                if tokens > profile.max_output_tokens:
+                    # keep the share of this chunk that fits under the profile's cap
+                    fits = profile.max_output_tokens - answer_tokens
+                    text = _cut_at_word(text, len(text) * fits // max(tokens - answer_tokens, 1))
+                    truncated = True
+                    # stop the model: it would keep generating (and billing) up to the request's cap
+                    call.cancel()
+                    if text:
+                        yield text
+                    break
+                answer_tokens = tokens
+
+                yield text
+        finally:
+            # also when the client went away mid-answer
+            if not call.done():
+                call.cancel()
+            if truncated:
+                metrics.LLM_TRUNCATED.labels("gemini", profile.name).inc()
+            if on_usage and usage_metadata is not None:
+                on_usage(self._token_usage(usage_metadata))
+
+    @staticmethod
+    async def _stream(model, contents: List["ContentDict"]) -> Tuple[Any, Any]:
+        """
+        Start a streaming call; returns the response and the gRPC call.
 
-        chunk_count = 0
-        async for chunk in response:
-            if chunk.text:
-                chunk_count += 1
-                logging.info(f"[DEBUG] Gemini chunk #{chunk_count}, length={len(chunk.text)}: {chunk.text[:50]}...")
-                yield chunk.text
+        GenerativeModel.generate_content_async(stream=True) does the same
+        but keeps the call to itself, and a stream that is only abandoned
+        keeps generating until the call is garbage collected.
+        """
+        from google.generativeai import client
+        from google.generativeai.types import generation_types
 
-        logging.info(f"[DEBUG] Total chunks from Gemini: {chunk_count}")
+        request = model._prepare_request(contents=contents, tools=None, tool_config=None)
+        with generation_types.rewrite_stream_error():
+            call = await client.get_default_generative_async_client().stream_generate_content(request)
+        return await generation_types.AsyncGenerateContentResponse.from_aiterator(call), call
 
     async def chat(
         self,
@@ -116,7 +204,9 @@ class GeminiService:
         history: List[dict],
         system_instruction: str,
         audio_data: Optional[bytes] = None,
-        audio_mime_type: str = "audio/wav"
+        audio_mime_type: str = "audio/wav",
+        on_usage: Optional[OnUsage] = None,
+        profile: Optional[GenerationProfile] = None,
     ) -> str:
         """
         Get complete chat response from Gemini (non-streaming).
@@ -127,40 +217,52 @@ class GeminiService:
             system_instruction: System instruction for the model
             audio_data: Optional audio file bytes
             audio_mime_type: MIME type of the audio file
+            on_usage: Called with the token usage once the response completes
+            profile: Output limits and sampling, the chat endpoint's by default
 
         Returns:
             Complete response text
         """
-        full_response = ""
+        chunks = []
         async for chunk in self.chat_stream(
             message=message,
             history=history,
             system_instruction=system_instruction,
             audio_data=audio_data,
-            audio_mime_type=audio_mime_type
+            audio_mime_type=audio_mime_type,
+            on_usage=on_usage,
+            profile=profile,
         ):
-            full_response += chunk
-        return full_response
+            chunks.append(chunk)
+        return "".join(chunks)
 
-    async def generate_title(self, user_message: str, assistant_response: str) -> str:
+    async def generate_title(
+        self,
+        user_message: str,
+        assistant_response: str,
+        on_usage: Optional[OnUsage] = None,
+    ) -> str:
         """
         Generate a short title for the conversation thread.
 
         Args:
             user_message: The user's first message
             assistant_response: The assistant's response
+            on_usage: Called with the token usage of the title request
 
         Returns:
             A short title (max 5 words)
         """
-        from app.config import TITLE_GENERATION_PROMPT
-
-        prompt = TITLE_GENERATION_PROMPT.format(
+        prompt = get_knowledge_base().prompt("title").format(
             message=user_message[:500],  # Limit message length
             response=assistant_response[:500]  # Limit response length
         )
 
-        response = await self.model.generate_content_async(prompt)
+        response = await self.model.generate_content_async(
+            prompt, generation_config=gemini_config(get_profile("title")),
+        )
+        if on_usage and response.usage_metadata.total_token_count:
+            on_usage(self._token_usage(response.usage_metadata))
         title = response.text.strip()
 
         # Ensure title is not too long
@@ -171,10 +273,13 @@ class GeminiService:
         return title[:100]  # Max 100 characters
 
 
-# Singleton instance
-gemini_service = GeminiService()
+# Singleton instance (created on first use)
+gemini_service: Optional[GeminiService] = None
 
 
 def get_gemini_service() -> GeminiService:
     """Get Gemini service instance"""
+    global gemini_service
+    if gemini_service is None:
+        gemini_service = GeminiService()
     return gemini_service
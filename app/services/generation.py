@@ -0,0 +1,106 @@
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger("uvicorn.error")
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """Output limits and sampling for one kind of model call, shared by Gemini and Groq"""
+    name: str
+    max_output_tokens: int
+    temperature: float
+    stop_sequences: Tuple[str, ...] = ()
+    # gemini-2.5-flash only; counts towards the Gemini output cap, see gemini_config()
+    thinking_budget: int = 0
+
+
+PROFILES: Dict[str, GenerationProfile] = {
+    profile.name: profile
+    for profile in (
+        # the system rules ask for 1-3 sentences; the cap only stops run-away answers
+        GenerationProfile("concise", max_output_tokens=300, temperature=0.0),
+        GenerationProfile("detailed", max_output_tokens=1024, temperature=0.3, thinking_budget=512),
+        # spoken replies: shorter, so text-to-speech starts and ends sooner
+        GenerationProfile("voice", max_output_tokens=200, temperature=0.0),
+        GenerationProfile("title", max_output_tokens=24, temperature=0.2, stop_sequences=("\n",)),
+    )
+}
+
+# Output tokens left for thinking when the budget cannot be sent (see gemini_config)
+THINKING_ALLOWANCE = 1024
+
+# Rough size of an answer token, for streams that report no running token count
+CHARS_PER_TOKEN = 4
+
+# Profile per endpoint, used unless the thread sets `generation_profile`
+ENDPOINT_PROFILES: Dict[str, str] = {
+    "chat": "concise",
+    "groq_stream": "concise",
+    "groq_simple": "concise",
+    "voice": "voice",
+    "batch": "concise",
+    "title": "title",
+}
+
+
+def get_profile(endpoint: str, thread: Optional[dict] = None) -> GenerationProfile:
+    """Profile for a call from `endpoint`, overridden by the thread's own profile"""
+    name = (thread or {}).get("generation_profile")
+    if name and name in PROFILES:
+        return PROFILES[name]
+    if name:
+        logger.warning("Unknown generation profile %r, using the %s default", name, endpoint)
+    return PROFILES[ENDPOINT_PROFILES[endpoint]]
+
+
+@lru_cache(maxsize=None)
+def _supports_thinking_config() -> bool:
+    # google-generativeai 0.8.x predates thinking_config; newer protos carry it
+    from google.ai.generativelanguage import GenerationConfig
+    supported = "thinking_config" in GenerationConfig.meta.fields
+    if not supported:
+        logger.warning(
+            "Gemini SDK cannot send thinking budgets: gemini-2.5-flash thinks up to %d tokens per call "
+            "and answers are capped while streaming", THINKING_ALLOWANCE,
+        )
+    return supported
+
+
+def gemini_config(profile: GenerationProfile) -> dict:
+    """
+    `generation_config` for a Gemini call.
+
+    gemini-2.5-flash spends thinking tokens out of `max_output_tokens`, so the
+    thinking budget is added on top of the answer's own cap. The budget is only
+    sent when the installed SDK knows `thinking_config`. The pinned
+    google-generativeai 0.8.x does not: the model thinks dynamically and gets
+    THINKING_ALLOWANCE instead (otherwise a short cap such as the title's
+    could be used up before any text is produced), so this cap does not
+    bound the answer; GeminiService.chat_stream cuts the answer at the
+    profile's `max_output_tokens` itself.
+    """
+    thinking = _supports_thinking_config()
+    allowance = profile.thinking_budget if thinking else max(profile.thinking_budget, THINKING_ALLOWANCE)
+    config = {
+        "max_output_tokens": profile.max_output_tokens + allowance,
+        "temperature": profile.temperature,
+    }
+    if profile.stop_sequences:
+        config["stop_sequences"] = list(profile.stop_sequences)
+    if thinking:
+        config["thinking_config"] = {"thinking_budget": profile.thinking_budget}
+    return config
+
+
+def groq_params(profile: GenerationProfile) -> dict:
+    """Chat completion parameters for a Groq call; Groq models do not think"""
+    params = {
+        "max_tokens": profile.max_output_tokens,
+        "temperature": profile.temperature,
+    }
+    if profile.stop_sequences:
+        params["stop"] = list(profile.stop_sequences)
+    return params
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import AsyncGenerator, Awaitable, Callable, Dict, Optional, Set
+
+import httpx
+from fastapi import HTTPException
+
+from app.database import get_supabase
+from app.services.http import get_http_client
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+GEMINI_API_ENDPOINT = "generativelanguage.googleapis.com"
+
+
+# -------------------- Dependency probes --------------------
+
+async def check_supabase() -> None:
+    def query():
+        get_supabase().table("threads").select("id").limit(1).execute()
+
+    # the Supabase client is synchronous, keep it off the event loop
+    await asyncio.to_thread(query)
+
+
+async def check_gemini() -> None:
+    settings = get_settings()
+    endpoint = settings.gemini_api_endpoint or GEMINI_API_ENDPOINT
+    # in a header: a query parameter would end up in error messages with the URL
+    resp = await get_http_client().get(
+        f"https://{endpoint}/v1beta/models/gemini-2.5-flash",
+        headers={"x-goog-api-key": settings.gemini_api_key},
+    )
+    resp.raise_for_status()
+
+
+async def check_groq() -> None:
+    settings = get_settings()
+    resp = await get_http_client().get(
+        f"{settings.groq_api_base.rstrip('/')}/models",
+        headers={"Authorization": f"Bearer {settings.groq_api_key}"},
+    )
+    resp.raise_for_status()
+
+
+def describe_error(error: Exception) -> str:
+    """What went wrong, without the message: upstream errors can quote URLs and keys"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"{type(error).__name__}: {error.response.status_code}"
+    return type(error).__name__
+
+
+class DependencyMonitor:
+    """
+    Probe upstream dependencies on an interval and cache the results.
+
+    `/ready` serves the cached status instantly instead of calling Supabase,
+    Gemini and Groq on every probe. The monitor also tracks in-flight
+    streaming responses so the server can drain: once draining, new streams
+    are refused and shutdown waits for the running ones to finish.
+
+    Only critical dependencies (the database) decide readiness: every
+    replica shares the model providers, so one of them failing would take
+    all replicas out of rotation at once. Their status is still reported.
+    """
+
+    def __init__(self, interval: float, timeout: float):
+        self.interval = interval
+        self.timeout = timeout
+        self.checks: Dict[str, Callable[[], Awaitable[None]]] = {}
+        self.critical: Set[str] = set()
+        self.status: Dict[str, dict] = {}
+        self.draining = False
+        self.active_streams = 0
+        self._streams_done = asyncio.Event()
+        self._streams_done.set()
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, check: Callable[[], Awaitable[None]], critical: bool = False) -> None:
+        self.checks[name] = check
+        if critical:
+            self.critical.add(name)
+
+    # -------------------- Probing --------------------
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(self.interval)
+
+    async def probe_all(self) -> None:
+        await asyncio.gather(*(self._probe(name, check) for name, check in self.checks.items()))
+
+    async def _probe(self, name: str, check: Callable[[], Awaitable[None]]) -> None:
+        start = time.perf_counter()
+        error = None
+        try:
+            await asyncio.wait_for(check(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            error = f"timed out after {self.timeout}s"
+        except Exception as e:
+            error = describe_error(e)
+
+        if error and self.status.get(name, {}).get("ok", True):
+            logger.warning("Dependency %s is unhealthy: %s", name, error)
+        self.status[name] = {
+            "ok": error is None,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "checked_at": datetime.utcnow().isoformat(),
+            "error": error,
+        }
+
+    @property
+    def healthy(self) -> bool:
+        """All critical dependencies passed their last probe"""
+        return all(self.status.get(name, {}).get("ok", False) for name in self.critical)
+
+    @property
+    def degraded(self) -> bool:
+        """A non-critical dependency failed its last probe"""
+        return not all(self.status.get(name, {}).get("ok", False) for name in self.checks)
+
+    def report(self) -> dict:
+        return {
+            "dependencies": {
+                name: {**self.status.get(name, {"ok": False, "error": "not checked yet"}), "critical": name in self.critical}
+                for name in self.checks
+            },
+            "draining": self.draining,
+            "active_streams": self.active_streams,
+        }
+
+    # -------------------- Draining --------------------
+
+    def start_draining(self) -> None:
+        if not self.draining:
+            logger.info("Draining: refusing new streams, %d in flight", self.active_streams)
+        self.draining = True
+
+    def ensure_accepting_streams(self) -> None:
+        """Raise 503 once the server is draining"""
+        if self.draining:
+            raise HTTPException(status_code=503, detail="Server is shutting down, please retry")
+
+    def stream_started(self) -> None:
+        self.active_streams += 1
+        self._streams_done.clear()
+
+    def stream_finished(self) -> None:
+        self.active_streams -= 1
+        if self.active_streams <= 0:
+            self.active_streams = 0
+            self._streams_done.set()
+
+    async def track_stream(self, stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        """Wrap a streaming body so shutdown can wait for it"""
+        self.stream_started()
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            self.stream_finished()
+
+    async def wait_for_streams(self, timeout: float) -> bool:
+        """Wait until in-flight streams finish; False if the timeout was hit"""
+        try:
+            await asyncio.wait_for(self._streams_done.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("Drain timeout: %d streams still active", self.active_streams)
+            return False
+
+
+def _build_monitor() -> DependencyMonitor:
+    settings = get_settings()
+    monitor = DependencyMonitor(
+        interval=settings.health_check_interval,
+        timeout=settings.health_check_timeout,
+    )
+    monitor.register("supabase", check_supabase, critical=True)
+    monitor.register("gemini", check_gemini)
+    if settings.groq_api_key:
+        monitor.register("groq", check_groq)
+    return monitor
+
+
+# Singleton instance
+dependency_monitor = _build_monitor()
+
+
+def get_dependency_monitor() -> DependencyMonitor:
+    """Get dependency monitor instance"""
+    return dependency_monitor
+
+
+def require_accepting_streams() -> None:
+    """Dependency for streaming endpoints: 503 while draining"""
+    dependency_monitor.ensure_accepting_streams()
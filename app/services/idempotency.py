@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import json
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException
+
+from app.services import metrics
+from app.services.cache import TTLCache
+from app.services.health import get_dependency_monitor
+from app.settings import get_settings
+
+
+def fingerprint(*parts: object) -> str:
+    """Hash of what a request asks for; a key may only be reused for the same request"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else repr(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class Turn:
+    """The SSE events of one chat turn, kept so retries of its request can replay them"""
+
+    def __init__(self, scope: Tuple[str, str, str], fingerprint: str):
+        self.scope = scope
+        self.fingerprint = fingerprint
+        self.events: List[str] = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def append(self, event: str) -> None:
+        self.events.append(event)
+        self._notify()
+
+    def finish(self) -> None:
+        self.done = True
+        self._notify()
+
+    def _notify(self) -> None:
+        # waiters hold the old event; the next ones wait on a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def replay(self) -> AsyncIterator[str]:
+        """Every event from the first, then the new ones as they come, until the turn ends"""
+        sent = 0
+        while True:
+            while sent < len(self.events):
+                yield self.events[sent]
+                sent += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class IdempotencyStore:
+    """
+    Bounded in-process store of chat turns by `Idempotency-Key`.
+
+    The first request with a key runs the turn: the model's answer is
+    generated in a background task that records every SSE event, so it
+    keeps going when the client's connection drops. A retry with the same
+    key (same user and endpoint) does not create a thread, save a message,
+    upload audio or call the model again: it gets the recorded events from
+    the start and follows the running turn until it ends. Running turns are
+    never evicted; finished ones are kept IDEMPOTENCY_TTL seconds, at most
+    IDEMPOTENCY_MAX_ENTRIES of them. A key reused for a different request is
+    rejected with 422. A turn that fails before streaming (e.g. 404) is
+    forgotten, so retrying it runs it again.
+
+    Turns live in the process that ran them: with several workers a retry
+    is only recognized when it reaches the same one.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        # finished turns; running ones stay in _running (bounded by open requests) until they end
+        self._turns = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._running: Dict[Tuple[str, str, str], Turn] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def begin(
+        self,
+        user_id: UUID,
+        endpoint: str,
+        key: Optional[str],
+        request_fingerprint: str,
+    ) -> Tuple[Optional[Turn], bool]:
+        """The turn for a key and whether the request is a retry; (None, False) without a key"""
+        if not key:
+            return None, False
+        scope = (str(user_id), endpoint, key)
+        turn = self._running.get(scope) or self._turns.get(scope)
+        if turn is not None:
+            if turn.fingerprint != request_fingerprint:
+                metrics.IDEMPOTENCY.labels("conflict").inc()
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+            metrics.IDEMPOTENCY.labels("replayed").inc()
+            return turn, True
+        turn = Turn(scope, request_fingerprint)
+        self._running[scope] = turn
+        metrics.IDEMPOTENCY.labels("new").inc()
+        return turn, False
+
+    @contextmanager
+    def preparing(self, turn: Optional[Turn]) -> Iterator[None]:
+        """Forget the turn if its request fails before streaming; retries waiting on it get the error"""
+        try:
+            yield
+        except BaseException as e:
+            if turn is not None:
+                if self._running.get(turn.scope) is turn:
+                    del self._running[turn.scope]
+                detail = e.detail if isinstance(e, HTTPException) else "Request failed"
+                turn.append(f"data: {json.dumps({'type': 'error', 'content': detail})}\n\n")
+                turn.finish()
+            raise
+
+    def run(self, turn: Optional[Turn], stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Response body for a turn's SSE stream; with a key the turn outlives the connection"""
+        tracked = get_dependency_monitor().track_stream(stream)
+        if turn is None:
+            return tracked
+        task = asyncio.create_task(self._record(turn, tracked))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return turn.replay()
+
+    async def _record(self, turn: Turn, stream: AsyncIterator[str]) -> None:
+        try:
+            async for event in stream:
+                turn.append(event)
+        finally:
+            turn.finish()
+            # retries within the TTL replay the finished turn
+            if self._running.get(turn.scope) is turn:
+                del self._running[turn.scope]
+                self._turns.set(turn.scope, turn)
+
+    async def stop(self) -> None:
+        """Cancel turns still generating after the drain"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# Singleton instance
+settings = get_settings()
+idempotency_store = IdempotencyStore(settings.idempotency_max_entries, settings.idempotency_ttl)
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Get idempotency store instance"""
+    return idempotency_store
@@ -0,0 +1,396 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, UploadFile
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server only
+    fcntl = None
+
+from app.services.audio import MAX_UPLOAD_BYTES, preprocess_audio
+from app.services.generation import get_profile
+from app.services.knowledge import get_knowledge_base
+from app.services.stt import stream_llm_completion, transcribe_cached
+from app.services.usage import get_usage_service
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Batch transcription configuration
+settings = get_settings()
+BATCH_JOBS_DIR = settings.batch_jobs_dir
+BATCH_CONCURRENCY = settings.batch_concurrency
+BATCH_MAX_FILES = settings.batch_max_files
+BATCH_RETENTION_DAYS = settings.batch_retention_days
+
+# Seconds between sweeps for expired jobs
+CLEANUP_INTERVAL = 3600
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _write_json(path: Path, data: dict) -> None:
+    """Write JSON atomically so a crash never leaves a half-written file"""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _claim(path: Path):
+    """
+    Take an exclusive lock on an item so only one server worker processes it.
+
+    Returns the open lock file (keep it open while working) or None when
+    another process holds it. The OS drops the lock if the holder dies, so a
+    crashed item is picked up again on the next resume.
+    """
+    lock_file = open(path, "a")
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _read_json(path: Path) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class BatchJobService:
+    """
+    Offline STT + LLM processing of many audio files.
+
+    Each job lives in its own directory: `job.json` (manifest), the uploaded
+    audio files and one `<index>.result.json` per finished item. An item is
+    done iff its result file exists, so unfinished work is simply re-queued
+    after a restart. A fixed pool of worker tasks bounds concurrency across
+    all jobs. With several server processes every process resumes pending
+    items, and a per-item file lock ensures each is processed only once.
+    Jobs are deleted BATCH_RETENTION_DAYS after submission.
+    """
+
+    def __init__(
+        self,
+        jobs_dir: Path = BATCH_JOBS_DIR,
+        concurrency: int = BATCH_CONCURRENCY,
+        retention_days: float = BATCH_RETENTION_DAYS,
+    ):
+        self.jobs_dir = jobs_dir
+        self.concurrency = concurrency
+        self.retention_days = retention_days
+        self._queue: "asyncio.Queue[Tuple[str, int]]" = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    # -------------------- Lifecycle --------------------
+
+    async def start(self) -> None:
+        """Start the worker pool and resume unfinished jobs"""
+        if self._workers:
+            return
+        await asyncio.to_thread(self.cleanup)
+        pending = await asyncio.to_thread(self._pending_items)
+        for job_id, index in pending:
+            self._queue.put_nowait((job_id, index))
+        if pending:
+            logger.info("Resumed %d pending batch items", len(pending))
+
+        self._workers = [
+            asyncio.create_task(self._worker(n)) for n in range(self.concurrency)
+        ]
+        if self.retention_days > 0:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self) -> None:
+        tasks = self._workers + ([self._cleanup_task] if self._cleanup_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._cleanup_task = None
+
+    def _pending_items(self) -> List[Tuple[str, int]]:
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        pending = []
+        for job_dir in sorted(self.jobs_dir.iterdir()):
+            manifest = _read_json(job_dir / "job.json")
+            if not manifest:
+                continue
+            for item in manifest["items"]:
+                if not (job_dir / f"{item['index']}.result.json").exists():
+                    pending.append((manifest["id"], item["index"]))
+        return pending
+
+    # -------------------- Retention --------------------
+
+    def cleanup(self) -> int:
+        """Delete jobs submitted more than retention_days ago; returns how many"""
+        if self.retention_days <= 0 or not self.jobs_dir.exists():
+            return 0
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        removed = 0
+        for job_dir in self.jobs_dir.iterdir():
+            if not job_dir.is_dir():
+                continue
+            manifest = _read_json(job_dir / "job.json")
+            if manifest:
+                expired = datetime.fromisoformat(manifest["created_at"]) < cutoff
+            else:
+                # upload interrupted before the manifest was written
+                expired = job_dir.stat().st_mtime < time.time() - self.retention_days * 86400
+            if expired:
+                # another server process may be sweeping the same directory
+                shutil.rmtree(job_dir, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info("Deleted %d expired batch jobs", removed)
+        return removed
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            await asyncio.sleep(CLEANUP_INTERVAL)
+            try:
+                await asyncio.to_thread(self.cleanup)
+            except Exception:
+                logger.exception("Batch job cleanup failed")
+
+    # -------------------- Jobs --------------------
+
+    async def create_job(
+        self,
+        user_id: UUID,
+        files: List[UploadFile],
+        stt_model: Optional[str] = None,
+        llm_model: Optional[str] = None,
+        language: Optional[str] = None,
+    ) -> dict:
+        """Spool uploads to disk and queue them for processing"""
+        if not files:
+            raise HTTPException(status_code=400, detail="No files uploaded")
+        if len(files) > BATCH_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_FILES} files per job")
+
+        for upload in files:
+            ct = upload.content_type or ""
+            if not (ct.startswith("audio/") or ct.startswith("video/")):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{upload.filename}: upload an audio/video file (Content-Type audio/* or video/*)"
+                )
+            if upload.size is not None and upload.size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"{upload.filename}: file is too large")
+
+        job_id = str(uuid.uuid4())
+        job_dir = self.jobs_dir / job_id
+        job_dir.mkdir(parents=True)
+
+        items = []
+        for index, upload in enumerate(files):
+            ct = upload.content_type
+            suffix = ""
+            if upload.filename and "." in upload.filename:
+                suffix = "." + upload.filename.rsplit(".", 1)[1]
+            audio_path = job_dir / f"{index}{suffix}"
+            written = 0
+            with open(audio_path, "wb") as f:
+                while True:
+                    chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > MAX_UPLOAD_BYTES:
+                        break
+                    f.write(chunk)
+            await upload.close()
+            if written > MAX_UPLOAD_BYTES:
+                # no manifest yet: nothing refers to the partial job
+                shutil.rmtree(job_dir, ignore_errors=True)
+                raise HTTPException(status_code=413, detail=f"{upload.filename}: file is too large")
+            items.append({
+                "index": index,
+                "filename": upload.filename,
+                "content_type": ct,
+                "path": audio_path.name,
+            })
+
+        manifest = {
+            "id": job_id,
+            "user_id": str(user_id),
+            "created_at": datetime.utcnow().isoformat(),
+            "stt_model": stt_model,
+            "llm_model": llm_model,
+            "language": language,
+            "items": items,
+        }
+        _write_json(job_dir / "job.json", manifest)
+
+        for item in items:
+            self._queue.put_nowait((job_id, item["index"]))
+
+        return await asyncio.to_thread(self._job_status, manifest)
+
+    def get_manifest(self, job_id: UUID, user_id: UUID) -> Optional[dict]:
+        manifest = _read_json(self.jobs_dir / str(job_id) / "job.json")
+        if not manifest or manifest["user_id"] != str(user_id):
+            return None
+        return manifest
+
+    async def get_job(self, job_id: UUID, user_id: UUID) -> Optional[dict]:
+        """Get job progress"""
+        return await asyncio.to_thread(self._get_job, job_id, user_id)
+
+    async def get_user_jobs(self, user_id: UUID) -> List[dict]:
+        """Get progress of all jobs submitted by a user"""
+        return await asyncio.to_thread(self._get_user_jobs, user_id)
+
+    async def get_results(
+        self, job_id: UUID, user_id: UUID, offset: int = 0, limit: int = 100,
+    ) -> Optional[List[dict]]:
+        """Get finished item results of a job, in submission order"""
+        return await asyncio.to_thread(self._get_results, job_id, user_id, offset, limit)
+
+    # Blocking: these read one file per job or item, so they run in a thread
+
+    def _get_job(self, job_id: UUID, user_id: UUID) -> Optional[dict]:
+        manifest = self.get_manifest(job_id, user_id)
+        return self._job_status(manifest) if manifest else None
+
+    def _get_user_jobs(self, user_id: UUID) -> List[dict]:
+        if not self.jobs_dir.exists():
+            return []
+        jobs = []
+        for job_dir in self.jobs_dir.iterdir():
+            manifest = _read_json(job_dir / "job.json")
+            if manifest and manifest["user_id"] == str(user_id):
+                jobs.append(self._job_status(manifest))
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+    def _get_results(self, job_id: UUID, user_id: UUID, offset: int, limit: int) -> Optional[List[dict]]:
+        manifest = self.get_manifest(job_id, user_id)
+        if not manifest:
+            return None
+        job_dir = self.jobs_dir / str(job_id)
+        results = []
+        for item in manifest["items"][offset:offset + limit]:
+            result = _read_json(job_dir / f"{item['index']}.result.json")
+            results.append(result or {
+                "index": item["index"],
+                "filename": item["filename"],
+                "status": "pending",
+            })
+        return results
+
+    def _job_status(self, manifest: dict) -> dict:
+        job_dir = self.jobs_dir / manifest["id"]
+        completed = failed = 0
+        for item in manifest["items"]:
+            result = _read_json(job_dir / f"{item['index']}.result.json")
+            if result:
+                completed += 1
+                if result["status"] == "failed":
+                    failed += 1
+
+        total = len(manifest["items"])
+        return {
+            "id": manifest["id"],
+            "status": "completed" if completed == total else "processing",
+            "created_at": manifest["created_at"],
+            "total": total,
+            "completed": completed,
+            "failed": failed,
+            "pending": total - completed,
+        }
+
+    # -------------------- Workers --------------------
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            job_id, index = await self._queue.get()
+            try:
+                await self._process_item(job_id, index)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Batch worker %d failed on %s/%d", n, job_id, index)
+            finally:
+                self._queue.task_done()
+
+    async def _process_item(self, job_id: str, index: int) -> None:
+        job_dir = self.jobs_dir / job_id
+        result_path = job_dir / f"{index}.result.json"
+        manifest = _read_json(job_dir / "job.json")
+        if not manifest or result_path.exists():
+            return
+        lock_file = _claim(job_dir / f"{index}.lock")
+        if lock_file is None:
+            return
+        try:
+            # re-check: another process may have finished it before we got the lock
+            if not result_path.exists():
+                await self._run_item(job_dir, manifest, index, result_path)
+        finally:
+            lock_file.close()
+
+    async def _run_item(self, job_dir: Path, manifest: dict, index: int, result_path: Path) -> None:
+        job_id = manifest["id"]
+        item = manifest["items"][index]
+
+        result = {"index": index, "filename": item["filename"]}
+        try:
+            raw_audio = (job_dir / item["path"]).read_bytes()
+            processed = await preprocess_audio(raw_audio, item["content_type"], item["path"])
+            user_id = UUID(manifest["user_id"])
+            usage = get_usage_service()
+            transcript = await transcribe_cached(
+                processed, manifest["stt_model"], manifest["language"],
+                on_usage=usage.tracker(user_id, None, "batch"),
+            )
+
+            user_prompt = f"Transcript:\n{transcript}\n\nPlease reply concisely according to the system rules."
+            messages = [
+                {"role": "system", "content": get_knowledge_base().system_instruction(None, transcript)},
+                {"role": "user", "content": user_prompt},
+            ]
+            chunks = []
+            async for content in stream_llm_completion(
+                messages, manifest["llm_model"], on_usage=usage.tracker(user_id, None, "batch"),
+                profile=get_profile("batch"),
+            ):
+                chunks.append(content)
+
+            result.update({"status": "completed", "transcript": transcript, "llm_text": "".join(chunks)})
+        except HTTPException as http_err:
+            result.update({"status": "failed", "error": http_err.detail})
+        except Exception as e:
+            logger.exception("Batch item %s/%d failed", job_id, index)
+            result.update({"status": "failed", "error": repr(e)})
+
+        result["finished_at"] = datetime.utcnow().isoformat()
+        _write_json(result_path, result)
+
+
+# Singleton instance
+batch_job_service = BatchJobService()
+
+
+def get_batch_job_service() -> BatchJobService:
+    """Get batch job service instance"""
+    return batch_job_service
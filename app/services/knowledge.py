@@ -0,0 +1,348 @@
+import asyncio
+import hashlib
+import logging
+import math
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from app.database import get_supabase
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Stored as a thread's system_instruction: "use the current knowledge base",
+# so hot-reloaded rules reach existing threads too
+DEFAULT_INSTRUCTION = "@knowledge-base"
+
+# sha256 of built-in instructions that older threads stored verbatim: the
+# full product document (chat and STT copies) and the first split core rules
+LEGACY_INSTRUCTION_HASHES = frozenset({
+    "6fda34df100b355926ec169996d281b4b9dbecc6b37efd13fd0bfe4e879432e6",
+    "d4b87e8fa99737ec3218e8e121af1c4dced7933b171dea5f3e54b5fb8568aae8",
+    "da2fe91dfbe5a55d357c78521a32888d90fc0f546f3699b10c71ca68fd86bba1",
+})
+
+# Prompts the app cannot run without; a source missing any of them is rejected
+REQUIRED_PROMPTS = ("title",)
+
+STOPWORDS = frozenset("""
+    yang dan di ke dari untuk dengan atau ini itu saya aku anda kamu kami kita apa apakah
+    bagaimana gimana berapa kapan mana siapa bisa boleh mau ingin ada adalah akan sudah
+    belum tidak ga gak nggak juga lagi saja aja dong deh ya yah halo hai mohon tolong kak
+    kakak min terima kasih the
+""".split())
+
+# Common Indonesian clitics, so "bunganya" matches "bunga"
+SUFFIXES = ("nya", "lah", "kah", "ku", "mu")
+
+# A section must score at least this fraction of the best match to be included
+RELATIVE_MIN_SCORE = 0.3
+
+# Weight of the previous user turn, so follow-ups ("berapa bunganya?") keep their topic
+PREVIOUS_TURN_WEIGHT = 0.5
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        for suffix in SUFFIXES:
+            if len(word) > len(suffix) + 3 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        if word not in STOPWORDS:
+            tokens.append(word)
+    return tokens
+
+
+@dataclass(frozen=True)
+class Section:
+    name: str
+    title: str
+    body: str
+    keywords: str = ""
+    order: int = 0
+    always: bool = False
+    kind: str = "knowledge"  # or "prompt": a template looked up by name, never retrieved
+
+    @classmethod
+    def parse(cls, name: str, text: str) -> "Section":
+        """Markdown with a `key: value` front matter block between `---` lines"""
+        meta = {}
+        body = text
+        if text.startswith("---\n"):
+            header, _, body = text[4:].partition("\n---\n")
+            for line in header.splitlines():
+                key, _, value = line.partition(":")
+                meta[key.strip()] = value.strip()
+        return cls(
+            name=name,
+            title=meta.get("title", name),
+            body=body.strip(),
+            keywords=meta.get("keywords", ""),
+            order=int(meta.get("order", 0)),
+            always=meta.get("always", "false").lower() == "true",
+            kind=meta.get("kind", "knowledge"),
+        )
+
+
+class BM25Index:
+    """Okapi BM25 over a handful of short documents"""
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.avg_length = (sum(self.lengths) / len(documents)) if documents else 1.0
+        doc_freqs = Counter(term for document in documents for term in set(document))
+        n = len(documents)
+        self.idf = {term: math.log((n - df + 0.5) / (df + 0.5) + 1) for term, df in doc_freqs.items()}
+
+    def scores(self, query: List[str]) -> List[float]:
+        terms = set(query)
+        scores = []
+        for term_freqs, length in zip(self.term_freqs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+            score = 0.0
+            for term in terms:
+                tf = term_freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+
+class KnowledgeBase:
+    """
+    One version of the product knowledge, split into sections, and the
+    prompt templates (app/knowledge/*.md or the knowledge_sections table).
+    Immutable: a reload builds a new instance.
+
+    The core rules (`always: true`) go into every prompt; the other sections
+    are ranked per turn with BM25 over their title, keywords and text, and
+    only the best `top_k` matches are added. Questions the core answers best
+    (company, OJK, locations) get no sections. When nothing matches
+    (greetings, vague questions) all sections are added, so answers never
+    lose facts.
+    """
+
+    def __init__(self, sources: Dict[str, str], top_k: int, min_score: float, source: str = "files"):
+        """`sources` maps section names to their markdown (with front matter)"""
+        self.top_k = top_k
+        self.min_score = min_score
+        self.source = source
+        self.loaded_at = time.time()
+        # content hash: identical sources give the same version in every worker
+        digest = hashlib.sha256()
+        for name in sorted(sources):
+            digest.update(f"{name}\0{sources[name]}\0".encode())
+        self.version = digest.hexdigest()[:12]
+
+        parsed = [Section.parse(name, text) for name, text in sources.items()]
+        self.prompts = {section.name: section.body for section in parsed if section.kind == "prompt"}
+        sections = sorted(
+            (section for section in parsed if section.kind != "prompt"),
+            key=lambda section: (section.order, section.name),
+        )
+        core = [section for section in sections if section.always]
+        if not core:
+            raise ValueError("Knowledge base has no core section (always: true)")
+        missing = [name for name in REQUIRED_PROMPTS if name not in self.prompts]
+        if missing:
+            raise ValueError(f"Knowledge base is missing prompts: {', '.join(missing)}")
+        self.core = "\n\n".join(section.body for section in core)
+        self.sections = [section for section in sections if not section.always]
+        # the core is indexed as the last document, to recognize questions it answers
+        self.index = BM25Index([
+            tokenize(f"{section.title} {section.keywords} {section.body}") for section in self.sections
+        ] + [tokenize(" ".join(f"{section.keywords} {section.body}" for section in core))])
+
+    @property
+    def full_text(self) -> str:
+        """Core rules plus every section: what each prompt carried before retrieval"""
+        return self.compose(self.sections)
+
+    def compose(self, sections: List[Section]) -> str:
+        return "\n\n".join([self.core] + [section.body for section in sections])
+
+    @classmethod
+    def from_dir(cls, directory: Path, top_k: int, min_score: float) -> "KnowledgeBase":
+        sources = {path.stem: path.read_text(encoding="utf-8") for path in directory.glob("*.md")}
+        return cls(sources, top_k, min_score, source="files")
+
+    def prompt(self, name: str) -> str:
+        return self.prompts[name]
+
+    def is_default(self, instruction: str) -> bool:
+        """Whether a stored thread instruction means the built-in one (marker, current core or legacy copy)"""
+        return (
+            instruction == DEFAULT_INSTRUCTION
+            or instruction.strip() == self.core.strip()
+            or hashlib.sha256(instruction.encode()).hexdigest() in LEGACY_INSTRUCTION_HASHES
+        )
+
+    def retrieve(self, query: str, history: Optional[List[dict]] = None) -> List[Section]:
+        """Sections relevant to the user's message, in document order"""
+        scores = self.index.scores(tokenize(query))
+        previous = next((msg["content"] for msg in reversed(history or []) if msg["role"] == "user"), None)
+        if previous:
+            previous_scores = self.index.scores(tokenize(previous))
+            scores = [score + PREVIOUS_TURN_WEIGHT * extra for score, extra in zip(scores, previous_scores)]
+
+        *scores, core_score = scores
+        best = max(scores, default=0.0)
+        if best < self.min_score:
+            return [] if core_score >= self.min_score else list(self.sections)
+        if core_score > best:
+            return []
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:self.top_k]
+        picked = {i for i in ranked if scores[i] >= max(self.min_score, best * RELATIVE_MIN_SCORE)}
+        return [section for i, section in enumerate(self.sections) if i in picked]
+
+    def system_instruction(
+        self,
+        stored: Optional[str],
+        query: str,
+        history: Optional[List[dict]] = None,
+    ) -> str:
+        """
+        System instruction for one turn. Threads using the built-in
+        instruction get the core rules plus the sections relevant to `query`;
+        custom instructions (set via the threads API) are used unchanged.
+        """
+        if stored is not None and not self.is_default(stored):
+            return stored
+        sections = self.retrieve(query, history)
+        logger.debug("Knowledge sections for turn: %s", [section.name for section in sections])
+        return self.compose(sections)
+
+
+Listener = Callable[[KnowledgeBase, KnowledgeBase], None]
+
+
+class KnowledgeRegistry:
+    """
+    Holds the current KnowledgeBase and swaps in new versions without a restart.
+
+    The source is the app/knowledge directory (KNOWLEDGE_DIR) or the
+    knowledge_sections table (KNOWLEDGE_SOURCE=database). Every worker
+    re-reads it each KNOWLEDGE_RELOAD_INTERVAL seconds, or on demand via the
+    admin API; a new version is fully parsed and indexed before a single
+    reference swap, so a turn always sees one consistent version. Caches
+    derived from prompts key on `version` or `subscribe()` to drop entries
+    when it changes. A source that fails to load or validate is ignored and
+    the current version stays in use.
+    """
+
+    def __init__(self, source: str, directory: Path, reload_interval: float, top_k: int, min_score: float):
+        self.source = source
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.top_k = top_k
+        self.min_score = min_score
+        self.last_error: Optional[str] = None
+        self._current: Optional[KnowledgeBase] = None
+        self._listeners: List[Listener] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def current(self) -> KnowledgeBase:
+        if self._current is None:
+            # bundled files until the first reload from the database
+            self._current = KnowledgeBase.from_dir(self.directory, self.top_k, self.min_score)
+        return self._current
+
+    def subscribe(self, listener: Listener) -> None:
+        """Call `listener(old, new)` after every version change"""
+        self._listeners.append(listener)
+
+    def _load(self) -> KnowledgeBase:
+        if self.source == "database":
+            rows = get_supabase().table("knowledge_sections").select("name, content").execute().data or []
+            if not rows:
+                raise ValueError("knowledge_sections table is empty")
+            return KnowledgeBase(
+                {row["name"]: row["content"] for row in rows}, self.top_k, self.min_score, source="database",
+            )
+        return KnowledgeBase.from_dir(self.directory, self.top_k, self.min_score)
+
+    async def reload(self) -> bool:
+        """Load the source again; returns whether a new version was swapped in"""
+        try:
+            loaded = await asyncio.to_thread(self._load)
+        except Exception as e:
+            self.last_error = repr(e)
+            logger.warning("Knowledge base reload failed, keeping version %s: %s", self.current.version, repr(e))
+            return False
+
+        self.last_error = None
+        old = self.current
+        if loaded.version == old.version:
+            return False
+        self._current = loaded
+        logger.info("Knowledge base %s -> %s (%s)", old.version, loaded.version, loaded.source)
+        for listener in self._listeners:
+            try:
+                listener(old, loaded)
+            except Exception:
+                logger.exception("Knowledge base listener failed")
+        return True
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        if self.source == "database":
+            await self.reload()
+        if self.reload_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload()
+
+    def report(self) -> dict:
+        kb = self.current
+        return {
+            "version": kb.version,
+            "source": kb.source,
+            "loaded_at": kb.loaded_at,
+            "last_error": self.last_error,
+            "sections": [
+                {"name": section.name, "title": section.title, "chars": len(section.body)}
+                for section in kb.sections
+            ],
+            "prompts": sorted(kb.prompts),
+            "core_chars": len(kb.core),
+        }
+
+
+# Singleton instance
+settings = get_settings()
+knowledge_registry = KnowledgeRegistry(
+    source=settings.knowledge_source,
+    directory=settings.knowledge_dir,
+    reload_interval=settings.knowledge_reload_interval,
+    top_k=settings.kb_top_k,
+    min_score=settings.kb_min_score,
+)
+
+
+def get_knowledge_registry() -> KnowledgeRegistry:
+    """Get knowledge registry instance"""
+    return knowledge_registry
+
+
+def get_knowledge_base() -> KnowledgeBase:
+    """Current knowledge base version; hold on to it for the whole turn"""
+    return knowledge_registry.current
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class LoopLagMonitor:
+    """
+    Detect when the event loop is blocked and log what is blocking it.
+
+    A task on the loop bumps a heartbeat every `threshold / 4`; a watchdog
+    thread checks the heartbeat and, once it is older than the threshold,
+    logs the loop thread's current stack (the code holding the loop). When
+    the loop catches up, the total blocked time is logged as well.
+    """
+
+    def __init__(self, threshold_ms: float):
+        self.threshold = threshold_ms / 1000
+        self.interval = self.threshold / 4
+        self.blocks = 0
+        self.max_lag_ms = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    async def start(self) -> None:
+        if self.threshold <= 0 or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._watchdog.join(timeout=1)
+
+    async def _beat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = now - expected
+            if lag >= self.threshold:
+                self.max_lag_ms = max(self.max_lag_ms, lag * 1000)
+                logger.warning("Event loop was blocked for %.0f ms", lag * 1000)
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat
+            # one stack per blocking episode, taken while it is still blocked
+            if blocked_for < self.threshold + self.interval or heartbeat == reported_beat:
+                continue
+            reported_beat = heartbeat
+            self.blocks += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<loop thread not found>"
+            logger.warning("Event loop blocked for over %.0f ms, loop thread stack:\n%s", blocked_for * 1000, stack)
+
+    def report(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "blocks": self.blocks,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+        }
+
+
+# Singleton instance
+loop_lag_monitor = LoopLagMonitor(get_settings().loop_lag_threshold_ms)
+
+
+def get_loop_lag_monitor() -> LoopLagMonitor:
+    """Get event loop lag monitor instance"""
+    return loop_lag_monitor
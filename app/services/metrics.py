@@ -0,0 +1,110 @@
+import os
+from typing import Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Labels stay low-cardinality (no user or thread ids); per-user and
+# per-thread numbers live in the usage_daily table.
+LLM_REQUESTS = Counter(
+    "llm_requests_total",
+    "Model calls with reported usage",
+    ["provider", "model", "kind"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens billed by providers",
+    ["provider", "model", "kind", "type"],  # type: prompt | completion | cached
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens",
+    "Prompt size per model call, grows with thread history",
+    ["provider", "kind"],
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072),
+)
+STT_AUDIO_SECONDS = Counter(
+    "stt_audio_seconds_total",
+    "Audio sent to speech-to-text",
+    ["provider", "model"],
+)
+LLM_COST = Counter(
+    "llm_estimated_cost_usd_total",
+    "Estimated spend from list prices",
+    ["provider", "model", "kind"],
+)
+
+LLM_TRUNCATED = Counter(
+    "llm_truncated_total",
+    "Answers cut off at the generation profile's output cap",
+    ["provider", "profile"],
+)
+
+THREAD_TITLES = Counter(
+    "thread_titles_total",
+    "Titles stored for new threads",
+    ["source"],  # local | llm | refined
+)
+
+THREAD_ARCHIVE = Counter(
+    "thread_archive_total",
+    "Threads moved to or from archive storage",
+    ["operation"],  # archived | restored
+)
+THREAD_ARCHIVE_BYTES = Counter(
+    "thread_archive_bytes_total",
+    "Archived message data before and after zstd",
+    ["size"],  # raw | compressed
+)
+GC_DELETED = Counter(
+    "gc_deleted_total",
+    "Objects removed by the storage and thread garbage collector",
+    ["kind"],  # audio_orphan | audio_expired | archive_orphan | empty_thread
+)
+AUDIO_CACHE = Counter(
+    "audio_cache_total",
+    "Audio playback disk cache lookups and evictions",
+    ["result"],  # hit | miss | missing | evicted
+)
+EVENTS_PUBLISHED = Counter(
+    "thread_events_published_total",
+    "Thread events published for GET /chat/events",
+    ["type"],
+)
+SINGLEFLIGHT = Counter(
+    "singleflight_calls_total",
+    "Thread and auth reads, run or joined while an identical one was in flight",
+    ["operation", "result"],  # result: executed | coalesced
+)
+IDEMPOTENCY = Counter(
+    "idempotency_requests_total",
+    "Chat turns sent with an Idempotency-Key",
+    ["result"],  # new | replayed | conflict
+)
+EXPORT_ROWS = Counter(
+    "export_rows_total",
+    "Rows streamed by the data export endpoint",
+    ["kind"],  # thread | message
+)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Metrics in the Prometheus text format.
+
+    Under gunicorn every worker writes its values to PROMETHEUS_MULTIPROC_DIR
+    (set in gunicorn.conf.py), so whichever worker answers the scrape reports
+    the totals of all of them.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
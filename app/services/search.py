@@ -0,0 +1,183 @@
+import asyncio
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+from uuid import UUID
+
+from app.database import get_supabase
+from app.services.knowledge import tokenize
+from app.settings import get_settings
+
+# Message hits kept per thread in a search result
+HITS_PER_THREAD = 3
+
+# Words around the first match in a memory-backend snippet
+SNIPPET_WORDS = 12
+
+_WORD = re.compile(r"\S+")
+
+
+class InvertedIndex:
+    """Term -> postings index with BM25 ranking; every query term must match"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.lengths: List[int] = []
+
+    def add(self, tokens: List[str]) -> int:
+        doc_id = len(self.lengths)
+        for term, tf in Counter(tokens).items():
+            self.postings[term][doc_id] = tf
+        self.lengths.append(len(tokens))
+        return doc_id
+
+    def search(self, query: List[str], limit: int) -> List[Tuple[int, float]]:
+        terms = set(query)
+        if not terms or any(term not in self.postings for term in terms):
+            return []
+        # intersect from the rarest term
+        ordered = sorted(terms, key=lambda term: len(self.postings[term]))
+        candidates = set(self.postings[ordered[0]])
+        for term in ordered[1:]:
+            candidates &= self.postings[term].keys()
+
+        n = len(self.lengths)
+        avg_length = sum(self.lengths) / n
+        scored = []
+        for doc_id in candidates:
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / avg_length)
+            score = 0.0
+            for term in terms:
+                df = len(self.postings[term])
+                tf = self.postings[term][doc_id]
+                score += math.log((n - df + 0.5) / (df + 0.5) + 1) * tf * (self.k1 + 1) / (tf + norm)
+            scored.append((doc_id, score))
+        scored.sort(key=lambda hit: -hit[1])
+        return scored[:limit]
+
+
+def snippet(content: str, query: List[str], words: int = SNIPPET_WORDS) -> str:
+    """Text around the first matching word, matches marked «like this» (as ts_headline is configured)"""
+    terms = set(query)
+    spans = list(_WORD.finditer(content))
+    matched = {i for i, match in enumerate(spans) if set(tokenize(match.group(0))) & terms}
+    if not matched:
+        return " ".join(match.group(0) for match in spans[:words])
+    start = max(0, min(matched) - words // 3)
+    parts = []
+    for i in range(start, min(len(spans), start + words)):
+        word = spans[i].group(0)
+        parts.append(f"«{word}»" if i in matched else word)
+    text = " ".join(parts)
+    return ("… " if start else "") + text + (" …" if start + words < len(spans) else "")
+
+
+class SearchService:
+    """
+    Full-text search over one user's messages, grouped by thread.
+
+    SEARCH_BACKEND=postgres (default) calls the `search_messages` function
+    (GIN expression index on an 'indonesian' tsvector, see
+    app/models/search.py). Archived threads are not searched: their
+    messages are in storage until the thread is opened.
+    SEARCH_BACKEND=memory reads the user's messages and ranks them with an
+    in-process inverted index using the knowledge base tokenizer: for tests
+    and the bench stand-ins, where no Postgres is available. It reads every
+    message of the user per query, so it is not for production data.
+    """
+
+    def __init__(self, backend: str):
+        if backend not in ("postgres", "memory"):
+            raise ValueError(f"SEARCH_BACKEND must be postgres or memory, not {backend!r}")
+        self.backend = backend
+
+    async def search(self, user_id: UUID, query: str, limit: int = 50) -> List[dict]:
+        """Threads with matching messages, best first; each with its best HITS_PER_THREAD hits"""
+        if self.backend == "postgres":
+            rows = await asyncio.to_thread(self._search_postgres, user_id, query, limit)
+        else:
+            rows = await asyncio.to_thread(self._search_memory, user_id, query, limit)
+
+        threads: Dict[str, dict] = {}
+        for row in rows:
+            thread = threads.get(row["thread_id"])
+            if thread is None:
+                thread = threads[row["thread_id"]] = {
+                    "thread_id": row["thread_id"],
+                    "title": row["thread_title"],
+                    "score": row["rank"],
+                    "hits": [],
+                }
+            if len(thread["hits"]) < HITS_PER_THREAD:
+                thread["hits"].append({
+                    "message_id": row["message_id"],
+                    "role": row["role"],
+                    "snippet": row["snippet"],
+                    "created_at": row["created_at"],
+                    "score": row["rank"],
+                })
+        # rows come best first: a thread's score is that of its best hit
+        return list(threads.values())
+
+    @staticmethod
+    def _search_postgres(user_id: UUID, query: str, limit: int) -> List[dict]:
+        result = get_supabase().rpc("search_messages", {
+            "p_user_id": str(user_id),
+            "p_query": query,
+            "p_limit": limit,
+        }).execute()
+        return result.data or []
+
+    @staticmethod
+    def _search_memory(user_id: UUID, query: str, limit: int) -> List[dict]:
+        supabase = get_supabase()
+        threads = (
+            supabase.table("threads").select("id, title").eq("user_id", str(user_id)).execute().data or []
+        )
+        titles = {thread["id"]: thread["title"] for thread in threads}
+        messages: List[dict] = []
+        ids = list(titles)
+        for start in range(0, len(ids), 100):  # keeps the request URL short
+            messages.extend(
+                supabase.table("messages")
+                .select("id, thread_id, role, content, created_at")
+                .in_("thread_id", ids[start:start + 100])
+                .execute().data or []
+            )
+
+        index = InvertedIndex()
+        documents = [tokenize(message["content"]) for message in messages]
+        for tokens in documents:
+            index.add(tokens)
+        # "-word" excludes, as in websearch_to_tsquery; quotes only group words here
+        words = query.replace('"', " ").split()
+        terms = tokenize(" ".join(word for word in words if not word.startswith("-")))
+        excluded = set(tokenize(" ".join(word[1:] for word in words if word.startswith("-"))))
+        hits = [hit for hit in index.search(terms, len(messages)) if not excluded & set(documents[hit[0]])]
+        # best first, newest first among equal scores (as in search_messages)
+        hits.sort(key=lambda hit: messages[hit[0]]["created_at"], reverse=True)
+        hits.sort(key=lambda hit: -hit[1])
+        return [
+            {
+                "thread_id": messages[doc_id]["thread_id"],
+                "thread_title": titles[messages[doc_id]["thread_id"]],
+                "message_id": messages[doc_id]["id"],
+                "role": messages[doc_id]["role"],
+                "created_at": messages[doc_id]["created_at"],
+                "rank": round(score, 4),
+                "snippet": snippet(messages[doc_id]["content"], terms),
+            }
+            for doc_id, score in hits[:limit]
+        ]
+
+
+# Singleton instance
+search_service = SearchService(get_settings().search_backend)
+
+
+def get_search_service() -> SearchService:
+    """Get search service instance"""
+    return search_service
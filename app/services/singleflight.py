@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, Callable, Dict, Tuple
+
+from app.services import metrics
+
+
+def _own_copy(value: Any) -> Any:
+    # callers update the rows they get (e.g. a restored thread): each gets its own dicts
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [_own_copy(item) for item in value]
+    return value
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical upstream reads.
+
+    The first call for an (operation, key) runs the blocking function in a
+    worker thread; calls for the same pair while it is in flight wait for
+    that result instead of running it again (a client opening a thread asks
+    for the thread and its messages in parallel, each authenticated). The
+    call belongs to no request: one caller disconnecting does not cancel it
+    for the others. Results are not kept once the call returns.
+
+    Writers `forget` the reads they make stale, so a read started after a
+    write never joins one that started before it.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Tuple[str, Tuple], asyncio.Task] = {}
+
+    async def call(self, operation: str, key: Tuple, fn: Callable, *args) -> Any:
+        flight = (operation, key)
+        task = self._calls.get(flight)
+        if task is None:
+            task = asyncio.create_task(asyncio.to_thread(fn, *args))
+            self._calls[flight] = task
+            task.add_done_callback(lambda done: self._landed(flight, done))
+            metrics.SINGLEFLIGHT.labels(operation, "executed").inc()
+        else:
+            metrics.SINGLEFLIGHT.labels(operation, "coalesced").inc()
+        return _own_copy(await asyncio.shield(task))
+
+    def _landed(self, flight: Tuple[str, Tuple], task: asyncio.Task) -> None:
+        if self._calls.get(flight) is task:
+            del self._calls[flight]
+        if not task.cancelled():
+            task.exception()  # retrieved even if every caller went away
+
+    def forget(self, operation: str, *prefix: Any) -> None:
+        """Let later calls of `operation` whose key starts with `prefix` run afresh"""
+        for flight in [flight for flight in self._calls if flight[0] == operation]:
+            if flight[1][:len(prefix)] == prefix:
+                del self._calls[flight]
+
+
+# Singleton instance
+single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """Get single-flight instance"""
+    return single_flight
@@ -0,0 +1,79 @@
+import time
+from typing import List, Optional
+from uuid import UUID
+
+from app.services.thread import ThreadService
+from app.settings import get_settings
+
+# Seconds between progressive saves of a streaming assistant message (0 = save once at the end)
+STREAM_SAVE_INTERVAL = get_settings().stream_save_interval
+
+
+class ResponseAccumulator:
+    """
+    Collect streamed response chunks and persist the assistant message.
+
+    Chunks are kept in a list and joined on demand, so building the full
+    response is linear in its length. When a save interval is configured the
+    partial response is upserted periodically, so an interrupted stream still
+    leaves the answer-so-far in the database.
+    """
+
+    def __init__(
+        self,
+        thread_service: ThreadService,
+        thread_id: UUID,
+        save_interval: Optional[float] = None,
+    ):
+        self.thread_service = thread_service
+        self.thread_id = thread_id
+        self.save_interval = STREAM_SAVE_INTERVAL if save_interval is None else save_interval
+        self.message_id: Optional[str] = None
+        self._chunks: List[str] = []
+        self._saved_chunks = 0
+        self._last_save = time.monotonic()
+
+    def append(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    @property
+    def has_content(self) -> bool:
+        return bool(self._chunks)
+
+    async def maybe_persist(self) -> None:
+        """Upsert the partial response if the save interval has elapsed"""
+        if self.save_interval <= 0 or self._saved_chunks == len(self._chunks):
+            return
+        if time.monotonic() - self._last_save < self.save_interval:
+            return
+        await self._save()
+
+    async def finalize(self) -> Optional[dict]:
+        """Persist the complete response and return the stored message"""
+        if self.message_id is not None and self._saved_chunks == len(self._chunks):
+            return {"id": self.message_id, "content": self.text}
+        return await self._save()
+
+    async def _save(self) -> Optional[dict]:
+        content = self.text
+        if self.message_id is None:
+            message = await self.thread_service.add_message(
+                thread_id=self.thread_id,
+                role="assistant",
+                content=content,
+            )
+            if message:
+                self.message_id = message["id"]
+        else:
+            message = await self.thread_service.update_message(
+                message_id=self.message_id,
+                thread_id=self.thread_id,
+                content=content,
+            )
+        self._saved_chunks = len(self._chunks)
+        self._last_save = time.monotonic()
+        return message
@@ -4,60 +4,51 @@ import tempfile
 import logging
 import json
 import traceback
-from typing import Optional, Dict, Any, AsyncGenerator
+from typing import Optional, Dict, Any, AsyncGenerator, Callable
 from uuid import UUID
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Header, Form
 from fastapi.responses import JSONResponse, StreamingResponse
-from supabase import Client
 import httpx
-from dotenv import load_dotenv
 
-from app.database import get_supabase
+from app.middleware.capture import annotate, pseudonym
+from app.models.usage import TokenUsage
+from app.services import metrics
+from app.services.audio import ProcessedAudio, preprocess_audio, read_upload
+from app.services.auth import get_current_user_id
+from app.services.generation import GenerationProfile, get_profile, groq_params
+from app.services.health import require_accepting_streams
+from app.services.idempotency import fingerprint, get_idempotency_store
+from app.services.knowledge import DEFAULT_INSTRUCTION, get_knowledge_base
+from app.services.cache import TTLCache
 from app.services.thread import get_thread_service, ThreadService
-
-# Load env from project root (where main.py/.env located)
-load_dotenv()
+from app.services.titles import get_title_service
+from app.services.http import get_http_client
+from app.services.streaming import ResponseAccumulator
+from app.services.usage import get_usage_service
+from app.settings import get_settings
 
 router = APIRouter(prefix="/stt", tags=["speech-to-text"])
 
-# Configuration from .env
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_STT_URL = os.getenv(
-    "GROQ_STT_URL",
-    "https://api.groq.com/openai/v1/audio/transcriptions"
-)
-GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1")
-GROQ_STT_MODEL = os.getenv("GROQ_STT_MODEL", "whisper-large-v3")
-GROQ_LLM_MODEL = os.getenv("GROQ_LLM_MODEL", "meta-llama/llama-4-maverick-17b-128e-instruct")  # change as needed
+# Configuration from .env (loaded once in app.settings)
+settings = get_settings()
+GROQ_API_KEY = settings.groq_api_key
+GROQ_STT_URL = settings.groq_stt_url
+GROQ_API_BASE = settings.groq_api_base
+GROQ_STT_MODEL = settings.groq_stt_model
+GROQ_LLM_MODEL = settings.groq_llm_model  # change as needed
+STT_CACHE_SIZE = settings.stt_cache_size
+STT_CACHE_TTL = settings.stt_cache_ttl
 
 logger = logging.getLogger("uvicorn.error")
 
+# Transcripts keyed by (audio content hash, model, language)
+transcript_cache = TTLCache(maxsize=STT_CACHE_SIZE, ttl=STT_CACHE_TTL)
+
 if not GROQ_API_KEY:
     logger.warning("GROQ_API_KEY not set — STT/LLM calls will fail until configured.")
 
 
-# -------------------- Auth Helper --------------------
-
-async def get_current_user_id(
-    authorization: str = Header(..., description="Bearer token")
-) -> UUID:
-    """Extract and verify user from JWT token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization header")
-
-    token = authorization.replace("Bearer ", "")
-
-    try:
-        supabase: Client = get_supabase()
-        user = supabase.auth.get_user(token)
-        if not user or not user.user:
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
-        return UUID(user.user.id)
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
-
-
 # -------------------- Helpers --------------------
 
 async def save_upload_to_tempfile(upload_file: UploadFile) -> str:
@@ -121,108 +112,165 @@ def extract_text_from_llm_response(resp_json: Dict[str, Any]) -> str:
         return str(resp_json)
 
 
-# -------------------- System context --------------------
-
-SYSTEM_CONTEXT = """
-Anda adalah Asisten Customer Service Amartha yang ramah dan membantu.
-
-## TENTANG AMARTHA
-Amartha adalah perusahaan fintech P2P Lending yang terdaftar dan diawasi OJK, fokus memberdayakan UMKM perempuan di Indonesia melalui model Grameen Bank. Amartha berdiri sejak tahun 2010 dan dipimpin oleh CEO Andi Taufan Garuda Putra.
-
-**Lokasi Poin Amartha:**
-Poin layanan Amartha tersebar di Jawa, Sumatera, Sulawesi, Bali, Nusa Tenggara, dan Kalimantan. Untuk mencari poin terdekat dari lokasi Anda, silakan hubungi WhatsApp: 0811-1915-0170.
-
-## PRODUK & LAYANAN
-
-### 1. PINJAMAN UNTUK MITRA (Perempuan UMKM)
-**Group Loan & Modal** (sama, bedanya cara repayment)
-- Khusus untuk perempuan mitra UMKM usia 18-58 tahun
-- Sistem majelis: kelompok 5 orang, bergabung ke majelis 15-20 orang
-- Tanggung renteng: anggota saling menjamin kredibilitas
-- Harus memiliki usaha mikro dan aktif dalam kelompok
-- Jumlah pinjaman: hingga Rp30 juta
-- Group Loan: repayment cash | Modal: repayment via AmarthaFin
-
-**Cara Mengajukan Pinjaman Modal:**
-1. Buka aplikasi/website Amartha
-2. Klik menu "Modal" di homepage
-3. Hubungi nomor Business Partner (BP) yang tertera di layar
-4. BP akan membantu proses pengajuan hingga pencairan
-
-### 2. CELENGAN (Investasi untuk Pendana)
-Platform investasi mulai dari Rp10.000, semua jangka waktu 12 bulan, bisa ditarik setelah 1 bulan, keuntungan diterima tiap bulan, tanpa biaya admin:
-
-- **Celengan Pengrajin Lokal**: 6,5%/tahun, min Rp12,5 juta
-- **Celengan Lebaran**: 5%/tahun, min Rp10.000
-- **Celengan Liburan Akhir Tahun**: 6,5%/tahun, min Rp10 juta
-- **Celengan Pertanian Nusantara**: 6,5%/tahun, min Rp15 juta
-- **Celengan Peternakan Daging Lokal**: 6%/tahun, min Rp5 juta
-- **Celengan Pasar Rakyat**: 5,5%/tahun, min Rp500.000
-- **Celengan Warung Usaha Mikro**: 7%/tahun, min Rp50 juta (atau 8%/tahun, min Rp100 juta)
-- **Celengan Pendidikan Anak**: 5%/tahun, min Rp10.000
-
-**Cara Berinvestasi di Celengan:**
-1. Buka aplikasi/website Amartha dan klik menu "Celengan"
-2. Lakukan verifikasi data diri Anda
-3. Pilih tipe celengan yang sesuai dengan tujuan investasi Anda
-4. Masukkan nominal yang ingin diinvestasikan (pastikan saldo Pocket Amartha mencukupi)
-5. Masukkan PIN untuk konfirmasi
-6. Selesai! Investasi Anda aktif dan keuntungan akan diterima setiap bulan
-
-### 3. AMARTHALINK (Agen PPOB)
-**Fitur layanan**: Pulsa, paket data, listrik, PDAM, internet & TV kabel, zakat & sedekah, tarik tunai
-**Keuntungan jadi agen**:
-- Komisi dari setiap transaksi sukses
-- Komisi dari referral peminjam yang layak
-- Tidak butuh modal besar
-- Membantu pemberdayaan ekonomi lokal
-
-**Cara Isi Paket Data (untuk Agen):**
-1. Klik menu "Paket Data" di AmarthaLink
-2. Masukkan nomor HP pelanggan
-3. Pilih paket data yang tersedia
-4. Masukkan harga untuk pelanggan
-5. Lakukan pembayaran
-6. Selesai! Paket data akan terkirim ke nomor pelanggan
-
-**Cara Tarik Tunai (untuk Agen):**
-1. Klik menu "Tarik Tunai" di AmarthaLink
-2. Masukkan nominal tarik tunai yang diminta pelanggan
-3. Klik "Lanjutkan"
-4. Minta pelanggan scan QR code melalui aplikasi Amartha mereka
-5. Setelah pembayaran berhasil, berikan uang tunai kepada pelanggan
-6. Transaksi selesai! Anda akan mendapatkan komisi dari layanan ini
-
-## CARA TOP UP POCKET AMARTHA
-1. Klik "Isi Saldo" di homepage
-2. Pilih "Pocket"
-3. Pilih metode pengisian (transfer bank, virtual account, dll)
-4. Ikuti cara pembayaran sesuai metode yang dipilih
-5. Saldo akan masuk ke Pocket Amartha setelah pembayaran berhasil
-
-## CARA MENJAWAB
-- Gunakan bahasa Indonesia yang ramah, sopan, dan hangat
-- Gunakan sapaan "Anda" (bukan "Ibu" atau "Bapak")
-- Jawaban singkat dan jelas (1-3 kalimat), hindari jargon teknis
-- HANYA jawab topik seputar Amartha dan layanan yang tersedia di amartha.com
-- Boleh jawab study case/issue mitra dan solusinya
-- JANGAN bahas topik sensitif (politik, SARA, atau di luar scope bisnis Amartha)
-
-## JIKA TIDAK TAHU / DI LUAR TOPIK
-"Maaf, saya tidak dapat menjawab pertanyaan tersebut. Ada yang bisa saya bantu terkait layanan Amartha?"
-
-## JIKA USER KOMPLAIN / BUTUH ESCALATION
-"Mohon maaf atas kendala yang Anda alami. Untuk penanganan lebih lanjut, silakan hubungi:
-
-📞 Layanan Pengaduan Konsumen: 150170
-💬 WhatsApp: 0811-1915-0170
-📧 Email: support@amartha.com
-
-Atau hubungi Direktorat Jenderal Perlindungan Konsumen dan Tertib Niaga Kementerian Perdagangan RI:
-💬 WhatsApp: 0853-1111-1010"
-
-Goal: Bantu user dengan informasi akurat, ramah, dan solutif berdasarkan transcript yang diterima.
-"""
+def groq_token_usage(model: str, usage: Dict[str, Any]) -> TokenUsage:
+    """Convert an OpenAI-style `usage` object from Groq"""
+    return TokenUsage(
+        provider="groq",
+        model=model,
+        prompt_tokens=usage.get("prompt_tokens") or 0,
+        completion_tokens=usage.get("completion_tokens") or 0,
+        cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+    )
+
+
+async def transcribe_audio(
+    audio_data: bytes,
+    filename: str,
+    content_type: str,
+    stt_model: Optional[str] = None,
+    language: Optional[str] = None,
+    on_usage: Optional[Callable[[TokenUsage], None]] = None,
+    audio_seconds: float = 0.0,
+) -> str:
+    """
+    Transcribe audio bytes via Groq STT and return the transcript text.
+    `on_usage` is called with `audio_seconds` (Groq bills STT by duration).
+    Raises HTTPException(502) on upstream/network errors.
+    """
+    files = {"file": (filename, audio_data, content_type)}
+    data = {"model": stt_model or GROQ_STT_MODEL}
+    if language:
+        data["language"] = language
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
+
+    try:
+        client = get_http_client()
+        try:
+            stt_resp = await client.post(GROQ_STT_URL, headers=headers, data=data, files=files, timeout=180.0)
+        except httpx.RequestError as req_err:
+            logger.exception("Network error calling Groq STT: %s", repr(req_err))
+            raise HTTPException(status_code=502, detail=f"Groq STT network error: {repr(req_err)}")
+
+        if stt_resp.status_code >= 400:
+            logger.error("Groq STT error %s: %s", stt_resp.status_code, stt_resp.text)
+            raise HTTPException(status_code=502, detail=f"Groq STT error: {stt_resp.text}")
+
+        try:
+            stt_json = stt_resp.json()
+        except ValueError as json_err:
+            logger.exception("Failed to parse JSON from Groq STT")
+            raise HTTPException(
+                status_code=502,
+                detail=f"Groq STT returned invalid JSON: {repr(json_err)}"
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        tb = traceback.format_exc()
+        logger.error("Groq STT request failed: %s\n%s", repr(e), tb)
+        raise HTTPException(status_code=502, detail=f"Groq STT request failed: {repr(e)}")
+
+    if on_usage:
+        on_usage(TokenUsage(provider="groq", model=data["model"], audio_seconds=audio_seconds))
+    return stt_json.get("text") or stt_json.get("transcript") or ""
+
+
+async def transcribe_cached(
+    audio: ProcessedAudio,
+    stt_model: Optional[str] = None,
+    language: Optional[str] = None,
+    on_usage: Optional[Callable[[TokenUsage], None]] = None,
+) -> str:
+    """
+    Transcribe preprocessed audio, reusing the result for identical audio.
+    Retried uploads of the same recording skip the Groq STT round trip
+    (and are not reported to `on_usage`, since nothing is billed).
+    """
+    key = (audio.content_hash, stt_model or GROQ_STT_MODEL, language or "")
+    transcript = transcript_cache.get(key)
+    if transcript is not None:
+        logger.info("STT cache hit for %s", audio.content_hash)
+        return transcript
+
+    transcript = await transcribe_audio(
+        audio.data, audio.filename, audio.content_type, stt_model, language,
+        on_usage=on_usage, audio_seconds=audio.duration or 0.0,
+    )
+    transcript_cache.set(key, transcript)
+    return transcript
+
+
+def annotate_audio(raw_audio: bytes, processed: ProcessedAudio) -> None:
+    """Record upload size and duration for request replay"""
+    annotate(
+        audio=pseudonym(processed.content_hash),
+        audio_bytes=len(raw_audio),
+        audio_seconds=round(processed.duration, 2) if processed.duration else None,
+    )
+
+
+async def stream_llm_completion(
+    messages: list,
+    llm_model: Optional[str] = None,
+    on_usage: Optional[Callable[[TokenUsage], None]] = None,
+    profile: Optional[GenerationProfile] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Stream a Groq chat completion, yielding content deltas as they arrive.
+    `on_usage` is called with the token usage once the stream completes;
+    `profile` sets output limits and sampling (the groq_stream default).
+    Raises HTTPException(502) if Groq answers with an error status.
+    """
+    llm_endpoint = f"{GROQ_API_BASE.rstrip('/')}/chat/completions"
+    model_to_use = llm_model or GROQ_LLM_MODEL
+    profile = profile or get_profile("groq_stream")
+    llm_body = {
+        "model": model_to_use,
+        "messages": messages,
+        **groq_params(profile),
+        "stream": True,  # Enable streaming
+        "stream_options": {"include_usage": True},
+    }
+    usage = None
+
+    client = get_http_client()
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
+    async with client.stream("POST", llm_endpoint, headers=headers, json=llm_body, timeout=60.0) as llm_resp:
+        if llm_resp.status_code >= 400:
+            error_text = await llm_resp.aread()
+            logger.error("Groq LLM error %s: %s", llm_resp.status_code, error_text.decode())
+            raise HTTPException(status_code=502, detail="Groq LLM error")
+
+        # Stream chunks
+        async for line in llm_resp.aiter_lines():
+            if not line or line.startswith(":"):
+                continue
+
+            if line.startswith("data: "):
+                line = line[6:]  # Remove "data: " prefix
+
+            if line == "[DONE]":
+                break
+
+            try:
+                chunk_json = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            # final chunk: `usage` (stream_options) or Groq's own `x_groq.usage`
+            usage = chunk_json.get("usage") or (chunk_json.get("x_groq") or {}).get("usage") or usage
+
+            choices = chunk_json.get("choices", [])
+            if choices and len(choices) > 0:
+                if choices[0].get("finish_reason") == "length":
+                    metrics.LLM_TRUNCATED.labels("groq", profile.name).inc()
+                delta = choices[0].get("delta", {})
+                content = delta.get("content", "")
+                if content:
+                    yield content
+
+    if on_usage and usage:
+        on_usage(groq_token_usage(model_to_use, usage))
 
 
 # -------------------- Endpoint --------------------
@@ -231,7 +279,8 @@ Goal: Bantu user dengan informasi akurat, ramah, dan solutif berdasarkan transcr
 async def groq_stt_and_llm(
     audio: UploadFile = File(...),
     stt_model: Optional[str] = None,
-    llm_model: Optional[str] = None
+    llm_model: Optional[str] = None,
+    language: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Minimal flow using Groq only:
@@ -248,82 +297,41 @@ async def groq_stt_and_llm(
     if not (ct.startswith("audio/") or ct.startswith("video/")):
         raise HTTPException(status_code=400, detail="Upload an audio/video file (Content-Type audio/* or video/*)")
 
-    # save uploaded file to disk (streamed)
-    tmp_path = await save_upload_to_tempfile(audio)
+    # read and normalize uploaded audio
+    raw_audio = await read_upload(audio)
+    processed = await preprocess_audio(raw_audio, ct, audio.filename or "audio.wav")
+    annotate_audio(raw_audio, processed)
 
     # ---------- 1) Groq STT ----------
-    transcript = ""
-    stt_json = {}
-    try:
-        with open(tmp_path, "rb") as fh:
-            files = {"file": (os.path.basename(tmp_path), fh, ct)}
-            data = {"model": stt_model or GROQ_STT_MODEL}
-            headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
-
-            async with httpx.AsyncClient(timeout=180.0) as client:
-                try:
-                    stt_resp = await client.post(GROQ_STT_URL, headers=headers, data=data, files=files)
-                except httpx.RequestError as req_err:
-                    # network / connection error
-                    logger.exception("Network error calling Groq STT: %s", repr(req_err))
-                    # do not expose internal traceback to client; use repr for concise message
-                    raise HTTPException(status_code=502, detail=f"Groq STT network error: {repr(req_err)}")
-
-        # status code check (response exists here)
-        if stt_resp.status_code >= 400:
-            logger.error("Groq STT error %s: %s", stt_resp.status_code, stt_resp.text)
-            return JSONResponse(status_code=502, content={"error": "Groq STT error", "body": stt_resp.text})
-
-        # try parse JSON separately so we can catch decode errors
-        try:
-            stt_json = stt_resp.json()
-        except ValueError as json_err:
-            logger.exception("Failed to parse JSON from Groq STT")
-            raise HTTPException(
-                status_code=502,
-                detail=f"Groq STT returned invalid JSON: {repr(json_err)}. Raw (truncated): {stt_resp.text[:1000]!r}"
-            )
-
-        transcript = stt_json.get("text") or stt_json.get("transcript") or ""
-    except HTTPException:
-        # re-raise HTTPExceptions unchanged
-        raise
-    except Exception as e:
-        tb = traceback.format_exc()
-        logger.error("Groq STT request failed: %s\n%s", repr(e), tb)
-        raise HTTPException(status_code=502, detail=f"Groq STT request failed: {repr(e)}")
-    finally:
-        # cleanup tmp file (always attempt)
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            logger.debug("Failed to remove tmp file %s", tmp_path)
+    # unauthenticated endpoint: usage is attributed to no user or thread
+    usage = get_usage_service()
+    transcript = await transcribe_cached(processed, stt_model, language, on_usage=usage.tracker(None, None, "stt"))
 
     # ---------- 2) Groq LLM ----------
     llm_endpoint = f"{GROQ_API_BASE.rstrip('/')}/chat/completions"
     model_to_use = llm_model or GROQ_LLM_MODEL
     user_prompt = f"Transcript:\n{transcript}\n\nPlease reply concisely according to the system rules."
+    profile = get_profile("groq_simple")
 
     llm_body = {
         "model": model_to_use,
         "messages": [
-            {"role": "system", "content": SYSTEM_CONTEXT},
+            {"role": "system", "content": get_knowledge_base().system_instruction(None, transcript)},
             {"role": "user", "content": user_prompt}
         ],
-        "temperature": 0.0,
-        "max_tokens": 300
+        **groq_params(profile),
     }
 
     llm_json: Dict[str, Any] = {}
     llm_text = ""
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-            try:
-                llm_resp = await client.post(llm_endpoint, headers=headers, json=llm_body)
-            except httpx.RequestError as req_err:
-                logger.exception("Network error calling Groq LLM: %s", repr(req_err))
-                raise JSONResponse(status_code=502, content={"error": "Groq LLM network error", "detail": repr(req_err)})
+        client = get_http_client()
+        headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
+        try:
+            llm_resp = await client.post(llm_endpoint, headers=headers, json=llm_body, timeout=60.0)
+        except httpx.RequestError as req_err:
+            logger.exception("Network error calling Groq LLM: %s", repr(req_err))
+            return JSONResponse(status_code=502, content={"error": "Groq LLM network error", "detail": repr(req_err)})
 
         if llm_resp.status_code >= 400:
             logger.error("Groq LLM error %s: %s", llm_resp.status_code, llm_resp.text)
@@ -340,6 +348,10 @@ async def groq_stt_and_llm(
             })
 
         llm_text = extract_text_from_llm_response(llm_json)
+        if (llm_json.get("choices") or [{}])[0].get("finish_reason") == "length":
+            metrics.LLM_TRUNCATED.labels("groq", profile.name).inc()
+        if isinstance(llm_json.get("usage"), dict):
+            usage.record(groq_token_usage(model_to_use, llm_json["usage"]), kind="chat")
     except JSONResponse:
         # returned already-formed JSONResponse
         raise
@@ -356,12 +368,15 @@ async def groq_stt_and_llm(
     }
 
 
-@router.post("/groq_stream")
+@router.post("/groq_stream", dependencies=[Depends(require_accepting_streams)])
 async def groq_stt_and_llm_stream(
     audio: UploadFile = File(...),
     thread_id: Optional[str] = Form(None),
     stt_model: Optional[str] = Form(None),
     llm_model: Optional[str] = Form(None),
+    language: Optional[str] = Form(None),
+    include_full_response: bool = Form(True),
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="Same key to retry a turn without running it again"),
     user_id: UUID = Depends(get_current_user_id),
     thread_service: ThreadService = Depends(get_thread_service),
 ):
@@ -383,9 +398,12 @@ async def groq_stt_and_llm_stream(
       - type: 'thread_created' - New thread ID (if new thread)
       - type: 'transcript' - Transcribed text
       - type: 'chunk' - Streaming chunks of LLM response
-      - type: 'done' - Final complete response
+      - type: 'done' - Final complete response (content omitted if include_full_response=false)
       - type: 'title_generated' - Auto-generated title (if new thread)
       - type: 'error' - Error occurred
+
+    A retry with the same Idempotency-Key replays the first request's
+    events instead of transcribing and generating again.
     """
     if not GROQ_API_KEY:
         raise HTTPException(status_code=500, detail="GROQ_API_KEY not configured in environment")
@@ -395,101 +413,99 @@ async def groq_stt_and_llm_stream(
     if not (ct.startswith("audio/") or ct.startswith("video/")):
         raise HTTPException(status_code=400, detail="Upload an audio/video file (Content-Type audio/* or video/*)")
 
-    # -------------------- Thread Management --------------------
-    is_new_thread = thread_id is None
-    history = []
-    thread = None
-
-    if thread_id:
-        # Existing thread - get context
-        thread_uuid = UUID(thread_id)
-        thread = await thread_service.get_thread(thread_uuid, user_id)
-        if not thread:
-            raise HTTPException(status_code=404, detail="Thread not found")
-
-        # Get conversation history
-        messages = await thread_service.get_thread_messages(thread_uuid)
-        history = [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in messages
-        ]
-        system_instruction = thread["system_instruction"]
-    else:
-        # New thread - create it
-        thread = await thread_service.create_thread(
-            user_id=user_id,
-            system_instruction=SYSTEM_CONTEXT,
-            title=None,
-        )
-        if not thread:
-            raise HTTPException(status_code=500, detail="Failed to create thread")
-        thread_uuid = UUID(thread["id"])
-        system_instruction = SYSTEM_CONTEXT
-
-    # save uploaded file to disk (streamed)
-    tmp_path = await save_upload_to_tempfile(audio)
+    # read the uploaded audio first: retries are recognized by their content
+    raw_audio = await read_upload(audio)
 
-    # ---------- 1) Groq STT ----------
-    transcript = ""
-    try:
-        with open(tmp_path, "rb") as fh:
-            files = {"file": (os.path.basename(tmp_path), fh, ct)}
-            data = {"model": stt_model or GROQ_STT_MODEL}
-            headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
+    knowledge = get_knowledge_base()
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+        "X-Knowledge-Version": knowledge.version,
+    }
+    idempotency = get_idempotency_store()
+    turn, replayed = idempotency.begin(
+        user_id, "stt.groq_stream", idempotency_key,
+        fingerprint(thread_id, stt_model, llm_model, language, include_full_response, raw_audio),
+    )
+    if replayed:
+        return StreamingResponse(
+            turn.replay(),
+            media_type="text/event-stream",
+            headers={**headers, "Idempotent-Replayed": "true"},
+        )
 
-            async with httpx.AsyncClient(timeout=180.0) as client:
-                try:
-                    stt_resp = await client.post(GROQ_STT_URL, headers=headers, data=data, files=files)
-                except httpx.RequestError as req_err:
-                    logger.exception("Network error calling Groq STT: %s", repr(req_err))
-                    raise HTTPException(status_code=502, detail=f"Groq STT network error: {repr(req_err)}")
+    with idempotency.preparing(turn):
+        # -------------------- Thread Management --------------------
+        is_new_thread = thread_id is None
+        history = []
+        thread = None
+
+        if thread_id:
+            # Existing thread - get context
+            thread_uuid = UUID(thread_id)
+            thread = await thread_service.get_thread(thread_uuid, user_id)
+            if not thread:
+                raise HTTPException(status_code=404, detail="Thread not found")
+
+            # Get conversation history
+            messages = await thread_service.get_thread_messages(thread_uuid, thread)
+            history = [
+                {"role": msg["role"], "content": msg["content"]}
+                for msg in messages
+            ]
+            system_instruction = thread["system_instruction"]
+        else:
+            # New thread - create it
+            thread = await thread_service.create_thread(
+                user_id=user_id,
+                system_instruction=DEFAULT_INSTRUCTION,
+                title=None,
+            )
+            if not thread:
+                raise HTTPException(status_code=500, detail="Failed to create thread")
+            thread_uuid = UUID(thread["id"])
+            system_instruction = DEFAULT_INSTRUCTION
+
+        # normalize the uploaded audio (needed both for STT and storage)
+        processed = await preprocess_audio(raw_audio, ct, audio.filename or "audio.wav")
+        annotate_audio(raw_audio, processed)
+        annotate(
+            thread=pseudonym(thread_uuid),
+            new_thread=is_new_thread,
+            history_depth=len(history),
+            include_full_response=include_full_response,
+        )
 
-        if stt_resp.status_code >= 400:
-            logger.error("Groq STT error %s: %s", stt_resp.status_code, stt_resp.text)
-            raise HTTPException(status_code=502, detail=f"Groq STT error: {stt_resp.text}")
+        # ---------- 1) Groq STT ----------
+        usage = get_usage_service()
+        transcript = await transcribe_cached(
+            processed, stt_model, language, on_usage=usage.tracker(user_id, thread_uuid, "stt"),
+        )
 
-        try:
-            stt_json = stt_resp.json()
-        except ValueError as json_err:
-            logger.exception("Failed to parse JSON from Groq STT")
-            raise HTTPException(
-                status_code=502,
-                detail=f"Groq STT returned invalid JSON: {repr(json_err)}"
+        # Core rules plus only the knowledge sections this transcript needs
+        system_instruction = knowledge.system_instruction(system_instruction, transcript, history)
+
+        # -------------------- Save Audio & User Message --------------------
+        # Upload audio to storage
+        audio_url = None
+        if processed.data:
+            audio_url = await thread_service.upload_audio(
+                user_id=user_id,
+                audio_data=processed.data,
+                filename=processed.filename,
+                content_type=processed.content_type,
+                content_hash=processed.content_hash,
             )
 
-        transcript = stt_json.get("text") or stt_json.get("transcript") or ""
-    except HTTPException:
-        raise
-    except Exception as e:
-        tb = traceback.format_exc()
-        logger.error("Groq STT request failed: %s\n%s", repr(e), tb)
-        raise HTTPException(status_code=502, detail=f"Groq STT request failed: {repr(e)}")
-    finally:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            logger.debug("Failed to remove tmp file %s", tmp_path)
-
-    # -------------------- Save Audio & User Message --------------------
-    # Upload audio to storage
-    audio_data = open(tmp_path, "rb").read() if os.path.exists(tmp_path) else None
-    audio_url = None
-    if audio_data:
-        audio_url = await thread_service.upload_audio(
-            user_id=user_id,
+        # Save user message
+        await thread_service.add_message(
             thread_id=thread_uuid,
-            audio_data=audio_data,
-            filename="audio.wav"
+            role="user",
+            content=transcript or "[Audio message]",
+            audio_url=audio_url,
         )
 
-    # Save user message
-    await thread_service.add_message(
-        thread_id=thread_uuid,
-        role="user",
-        content=transcript or "[Audio message]",
-        audio_url=audio_url,
-    )
-
     # ---------- 2) Stream LLM Response ----------
     async def generate_stream() -> AsyncGenerator[str, None]:
         """Generate SSE stream of LLM response"""
@@ -500,92 +516,59 @@ async def groq_stt_and_llm_stream(
         # Send transcript
         yield f"data: {json.dumps({'type': 'transcript', 'content': transcript})}\n\n"
 
-        llm_endpoint = f"{GROQ_API_BASE.rstrip('/')}/chat/completions"
-        model_to_use = llm_model or GROQ_LLM_MODEL
-
         # Build messages with history
         messages = [{"role": "system", "content": system_instruction}]
         messages.extend(history)
         messages.append({"role": "user", "content": transcript})
 
-        llm_body = {
-            "model": model_to_use,
-            "messages": messages,
-            "temperature": 0.0,
-            "max_tokens": 300,
-            "stream": True  # Enable streaming
-        }
-
-        full_response = ""
+        response = ResponseAccumulator(thread_service, thread_uuid)
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-                async with client.stream("POST", llm_endpoint, headers=headers, json=llm_body) as llm_resp:
-                    if llm_resp.status_code >= 400:
-                        error_text = await llm_resp.aread()
-                        logger.error("Groq LLM error %s: %s", llm_resp.status_code, error_text.decode())
-                        yield f"data: {json.dumps({'type': 'error', 'content': 'Groq LLM error'})}\n\n"
-                        return
-
-                    # Stream chunks
-                    async for line in llm_resp.aiter_lines():
-                        if not line or line.startswith(":"):
-                            continue
-
-                        if line.startswith("data: "):
-                            line = line[6:]  # Remove "data: " prefix
-
-                        if line == "[DONE]":
-                            break
-
-                        try:
-                            chunk_json = json.loads(line)
-                            choices = chunk_json.get("choices", [])
-                            if choices and len(choices) > 0:
-                                delta = choices[0].get("delta", {})
-                                content = delta.get("content", "")
-                                if content:
-                                    full_response += content
-                                    yield f"data: {json.dumps({'type': 'chunk', 'content': content})}\n\n"
-                        except json.JSONDecodeError:
-                            continue
+            try:
+                async for content in stream_llm_completion(
+                    messages, llm_model, on_usage=usage.tracker(user_id, thread_uuid, "chat"),
+                    profile=get_profile("groq_stream", thread),
+                ):
+                    response.append(content)
+                    yield f"data: {json.dumps({'type': 'chunk', 'content': content})}\n\n"
+                    await response.maybe_persist()
+            except HTTPException as http_err:
+                yield f"data: {json.dumps({'type': 'error', 'content': http_err.detail})}\n\n"
+                return
 
             # Save assistant response to database
-            await thread_service.add_message(
-                thread_id=thread_uuid,
-                role="assistant",
-                content=full_response,
-            )
+            await response.finalize()
+            full_response = response.text
 
             # Generate title for new threads only
             if is_new_thread:
                 try:
-                    from app.services.gemini import get_gemini_service
-                    gemini = get_gemini_service()
-                    title = await gemini.generate_title(transcript, full_response)
-                    await thread_service.update_thread(
-                        thread_id=thread_uuid,
-                        user_id=user_id,
-                        title=title,
+                    title = await get_title_service().title_thread(
+                        thread_service, thread_uuid, user_id, transcript, full_response,
+                        on_usage=usage.tracker(user_id, thread_uuid, "title"),
                     )
                     yield f"data: {json.dumps({'type': 'title_generated', 'title': title})}\n\n"
                 except Exception:
                     pass  # Title generation is optional
 
             # Send done event
-            yield f"data: {json.dumps({'type': 'done', 'content': full_response})}\n\n"
+            done_event = {"type": "done"}
+            if include_full_response:
+                done_event["content"] = full_response
+            yield f"data: {json.dumps(done_event)}\n\n"
 
         except Exception as e:
             tb = traceback.format_exc()
             logger.error("Groq LLM stream failed: %s\n%s", repr(e), tb)
+            # Keep whatever was already streamed when progressive saving is on
+            if response.save_interval > 0 and response.has_content:
+                try:
+                    await response.finalize()
+                except Exception:
+                    logger.exception("Failed to save partial assistant response")
             yield f"data: {json.dumps({'type': 'error', 'content': f'LLM error: {repr(e)}'})}\n\n"
 
     return StreamingResponse(
-        generate_stream(),
+        idempotency.run(turn, generate_stream()),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
+        headers=headers,
     )
@@ -1,19 +1,53 @@
-from typing import List, Optional
+import asyncio
+import hashlib
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from uuid import UUID
 from datetime import datetime
-from supabase import Client
 from app.database import get_supabase
+from app.services.archive import ARCHIVE_BUCKET, get_archive_service
+from app.services.cache import TTLCache
+from app.services.events import publish_thread_event
+from app.services.singleflight import get_single_flight
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+AUDIO_BUCKET = "audio"
+
+
+def audio_path(url: Optional[str]) -> Optional[str]:
+    """Storage path of an `audio` bucket public URL (as stored in messages.audio_url)"""
+    marker = f"/object/public/{AUDIO_BUCKET}/"
+    if not url or marker not in url:
+        return None
+    return url.split(marker, 1)[1].split("?", 1)[0]
 
 
 class ThreadService:
     def __init__(self):
-        self.supabase: Client = get_supabase()
+        # Storage paths known to exist, to skip re-uploading identical audio
+        self._uploaded_paths = TTLCache(maxsize=4096, ttl=24 * 3600)
+
+    @property
+    def supabase(self) -> "Client":
+        return get_supabase()
+
+    @staticmethod
+    def _changed(thread_id: Optional[UUID], user_id: Optional[UUID] = None) -> None:
+        """Reads in flight may predate this write: later ones must not join them"""
+        flights = get_single_flight()
+        if thread_id is not None:
+            flights.forget("get_thread", str(thread_id))
+            flights.forget("get_thread_messages", str(thread_id))
+        if user_id is not None:
+            flights.forget("get_user_threads", str(user_id))
 
     async def create_thread(
         self,
         user_id: UUID,
         system_instruction: str,
-        title: Optional[str] = None
+        title: Optional[str] = None,
+        generation_profile: Optional[str] = None,
     ) -> dict:
         """Create a new chat thread"""
         data = {
@@ -21,12 +55,23 @@ class ThreadService:
             "system_instruction": system_instruction,
             "title": title,
         }
+        if generation_profile is not None:
+            data["generation_profile"] = generation_profile
 
         result = self.supabase.table("threads").insert(data).execute()
-        return result.data[0] if result.data else None
+        self._changed(None, user_id)
+        if not result.data:
+            return None
+        await publish_thread_event(user_id, "thread_created", result.data[0])
+        return result.data[0]
 
     async def get_thread(self, thread_id: UUID, user_id: UUID) -> Optional[dict]:
         """Get a thread by ID (with user verification)"""
+        return await get_single_flight().call(
+            "get_thread", (str(thread_id), str(user_id)), self._select_thread, thread_id, user_id,
+        )
+
+    def _select_thread(self, thread_id: UUID, user_id: UUID) -> Optional[dict]:
         result = (
             self.supabase.table("threads")
             .select("*")
@@ -39,6 +84,11 @@ class ThreadService:
 
     async def get_user_threads(self, user_id: UUID) -> List[dict]:
         """Get all threads for a user"""
+        return await get_single_flight().call(
+            "get_user_threads", (str(user_id),), self._select_threads, user_id,
+        )
+
+    def _select_threads(self, user_id: UUID) -> List[dict]:
         result = (
             self.supabase.table("threads")
             .select("*")
@@ -53,7 +103,8 @@ class ThreadService:
         thread_id: UUID,
         user_id: UUID,
         title: Optional[str] = None,
-        system_instruction: Optional[str] = None
+        system_instruction: Optional[str] = None,
+        generation_profile: Optional[str] = None,
     ) -> Optional[dict]:
         """Update a thread"""
         data = {"updated_at": datetime.utcnow().isoformat()}
@@ -61,6 +112,8 @@ class ThreadService:
             data["title"] = title
         if system_instruction is not None:
             data["system_instruction"] = system_instruction
+        if generation_profile is not None:
+            data["generation_profile"] = generation_profile
 
         result = (
             self.supabase.table("threads")
@@ -69,7 +122,13 @@ class ThreadService:
             .eq("user_id", str(user_id))
             .execute()
         )
-        return result.data[0] if result.data else None
+        self._changed(thread_id, user_id)
+        if not result.data:
+            return None
+        await publish_thread_event(
+            user_id, "thread_title" if title is not None else "thread_updated", result.data[0],
+        )
+        return result.data[0]
 
     async def delete_thread(self, thread_id: UUID, user_id: UUID) -> bool:
         """Delete a thread and all its messages"""
@@ -80,6 +139,12 @@ class ThreadService:
             .eq("user_id", str(user_id))
             .execute()
         )
+        self._changed(thread_id, user_id)
+        archive_paths = [row["archive_path"] for row in result.data or [] if row.get("archive_path")]
+        if archive_paths:
+            self.supabase.storage.from_(ARCHIVE_BUCKET).remove(archive_paths)
+        for row in result.data or []:
+            await publish_thread_event(user_id, "thread_deleted", row)
         return len(result.data) > 0 if result.data else False
 
     async def add_message(
@@ -100,14 +165,71 @@ class ThreadService:
         result = self.supabase.table("messages").insert(data).execute()
 
         # Update thread's updated_at timestamp
-        self.supabase.table("threads").update(
+        threads = self.supabase.table("threads").update(
+            {"updated_at": datetime.utcnow().isoformat()}
+        ).eq("id", str(thread_id)).execute().data
+        self._changed(thread_id, threads[0]["user_id"] if threads else None)
+
+        message = result.data[0] if result.data else None
+        if threads and message:
+            await publish_thread_event(
+                threads[0]["user_id"], "thread_updated", threads[0], message_id=message["id"], role=role,
+            )
+        return message
+
+    async def update_message(
+        self,
+        message_id: str,
+        thread_id: UUID,
+        content: str
+    ) -> Optional[dict]:
+        """Replace a message's content (used for progressively saved responses)"""
+        result = (
+            self.supabase.table("messages")
+            .update({"content": content})
+            .eq("id", str(message_id))
+            .eq("thread_id", str(thread_id))
+            .execute()
+        )
+
+        # Update thread's updated_at timestamp
+        threads = self.supabase.table("threads").update(
             {"updated_at": datetime.utcnow().isoformat()}
-        ).eq("id", str(thread_id)).execute()
+        ).eq("id", str(thread_id)).execute().data
+        self._changed(thread_id, threads[0]["user_id"] if threads else None)
 
         return result.data[0] if result.data else None
 
-    async def get_thread_messages(self, thread_id: UUID) -> List[dict]:
-        """Get all messages in a thread ordered by creation time"""
+    async def get_thread_messages(self, thread_id: UUID, thread: Optional[dict] = None) -> List[dict]:
+        """
+        Get all messages in a thread ordered by creation time.
+
+        An archived thread is restored first. Pass the thread row when the
+        caller has it, so an archived thread is restored without reading
+        its (empty) messages first. An empty result is always checked for a
+        tombstone, since the thread may have been archived after the row was
+        read; live threads with messages cost no extra query. Concurrent
+        reads of the same thread's messages share one query.
+        """
+        if thread is not None and thread.get("archived_at"):
+            await get_archive_service().restore(thread_id)
+            self._changed(thread_id)
+            thread.update(archived_at=None, archive_path=None)
+        messages = await self._messages(thread_id)
+        if not messages and await asyncio.to_thread(self._is_archived, thread_id):
+            await get_archive_service().restore(thread_id)
+            self._changed(thread_id)
+            if thread is not None:
+                thread.update(archived_at=None, archive_path=None)
+            messages = await self._messages(thread_id)
+        return messages
+
+    async def _messages(self, thread_id: UUID) -> List[dict]:
+        return await get_single_flight().call(
+            "get_thread_messages", (str(thread_id),), self._select_messages, thread_id,
+        )
+
+    def _select_messages(self, thread_id: UUID) -> List[dict]:
         result = (
             self.supabase.table("messages")
             .select("*")
@@ -117,25 +239,88 @@ class ThreadService:
         )
         return result.data or []
 
-    async def upload_audio(
+    async def get_threads_page(
         self,
         user_id: UUID,
+        after: Optional[Tuple[str, str]] = None,
+        limit: int = 100,
+        inclusive: bool = False,
+    ) -> List[dict]:
+        """
+        A user's threads oldest first, keyset-paginated on (created_at, id):
+        the `limit` threads after `after` (from it when `inclusive`).
+        """
+        query = (
+            self.supabase.table("threads")
+            .select("*")
+            .eq("user_id", str(user_id))
+        )
+        if after is not None:
+            created_at, thread_id = after
+            op = "gte" if inclusive else "gt"
+            query = query.or_(f"created_at.gt.{created_at},and(created_at.eq.{created_at},id.{op}.{thread_id})")
+        query = query.order("created_at").order("id").limit(limit)
+        result = await asyncio.to_thread(query.execute)
+        return result.data or []
+
+    async def get_messages_page(
+        self,
         thread_id: UUID,
+        after: Optional[Tuple[str, str]] = None,
+        limit: int = 500,
+    ) -> List[dict]:
+        """A thread's live messages oldest first, keyset-paginated on (created_at, id)"""
+        query = self.supabase.table("messages").select("*").eq("thread_id", str(thread_id))
+        if after is not None:
+            created_at, message_id = after
+            query = query.or_(f"created_at.gt.{created_at},and(created_at.eq.{created_at},id.gt.{message_id})")
+        query = query.order("created_at").order("id").limit(limit)
+        result = await asyncio.to_thread(query.execute)
+        return result.data or []
+
+    def _is_archived(self, thread_id: UUID) -> bool:
+        result = (
+            self.supabase.table("threads")
+            .select("id")
+            .eq("id", str(thread_id))
+            .not_.is_("archived_at", "null")
+            .execute()
+        )
+        return bool(result.data)
+
+    async def upload_audio(
+        self,
+        user_id: UUID,
         audio_data: bytes,
-        filename: str
+        filename: str,
+        content_type: str = "audio/wav",
+        content_hash: Optional[str] = None
     ) -> str:
-        """Upload audio file to Supabase storage and return URL"""
-        path = f"{user_id}/{thread_id}/{filename}"
-
-        # Upload to storage bucket
-        self.supabase.storage.from_("audio").upload(
-            path=path,
-            file=audio_data,
-            file_options={"content-type": "audio/wav"}
-        )
+        """
+        Upload audio file to Supabase storage and return URL.
+
+        Objects are content-addressed (`{user_id}/{hash}.{ext}`), so uploading
+        the same recording twice (e.g. a client retry) stores a single blob.
+        Uploads overwrite: rewriting an existing blob refreshes its
+        `updated_at`, which keeps the garbage collector (app/services/gc.py)
+        away from a blob a new message is about to reference.
+        """
+        extension = filename.rsplit(".", 1)[1] if "." in filename else "wav"
+        digest = content_hash or hashlib.blake2b(audio_data, digest_size=16).hexdigest()
+        path = f"{user_id}/{digest}.{extension}"
+        bucket = self.supabase.storage.from_(AUDIO_BUCKET)
+
+        if path not in self._uploaded_paths:
+            # Upload to storage bucket
+            bucket.upload(
+                path=path,
+                file=audio_data,
+                file_options={"content-type": content_type, "upsert": "true"}
+            )
+            self._uploaded_paths.set(path, True)
 
         # Get public URL
-        url = self.supabase.storage.from_("audio").get_public_url(path)
+        url = bucket.get_public_url(path)
         return url
 
 
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import re
+from typing import Callable, List, Optional, Set, Tuple
+from uuid import UUID
+
+from app.models.usage import TokenUsage
+from app.services import metrics
+from app.services.knowledge import STOPWORDS, SUFFIXES
+from app.services.thread import ThreadService
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+MAX_TITLE_WORDS = 5
+FALLBACK_TITLE = "Percakapan Baru"
+
+# Product names as Amartha writes them, most specific first. A product
+# followed by capitalised words keeps them ("Celengan Pendidikan Anak").
+PRODUCTS: List[Tuple[str, str]] = [
+    (r"celengan", "Celengan"),
+    (r"(?:ber)?investasi", "Investasi"),
+    (r"amartha\s?link", "AmarthaLink"),
+    (r"amartha\s?fin", "AmarthaFin"),
+    (r"pocket", "Pocket"),
+    (r"group\s?loan", "Group Loan"),
+    (r"tanggung\s?renteng", "Tanggung Renteng"),
+    (r"modal(\s+usaha)?", "Modal Usaha"),
+    (r"pinjam(an)?|kredit", "Pinjaman"),
+    (r"top\s?up|isi\s+saldo", "Top Up"),
+    (r"tarik\s+tunai", "Tarik Tunai"),
+    (r"paket\s+data", "Paket Data"),
+    (r"pulsa", "Pulsa"),
+    (r"listrik|token\s+pln|pdam", "Tagihan"),
+    (r"virtual\s+account", "Virtual Account"),
+    (r"agen", "Agen"),
+    (r"majelis", "Majelis"),
+    (r"saldo", "Saldo"),
+]
+
+# What the user wants to know, put in front of the product
+INTENTS: List[Tuple[str, str]] = [
+    (r"komplain|keluhan|kendala|error|gagal|belum\s+masuk|penipuan|tipu|pengaduan", "Kendala"),
+    (r"daftar|mendaftar|registrasi", "Pendaftaran"),
+    (r"ajukan|mengajukan|pengajuan|apply", "Pengajuan"),
+    (r"syarat|persyaratan|ketentuan", "Syarat"),
+    (r"bunga|imbal\s+hasil|return", "Imbal Hasil"),
+    (r"keuntungan|untung|komisi", "Keuntungan"),
+    (r"minimal|minimum", "Minimal"),
+    (r"maksimal|maksimum|plafon|limit", "Batas"),
+    (r"cicilan|angsuran|bayar", "Pembayaran"),
+    (r"cair|pencairan|ditarik|penarikan", "Penarikan"),
+    (r"beda|bedanya|perbedaan|banding", "Perbedaan"),
+    (r"cara|bagaimana|gimana", "Cara"),
+]
+
+# Dropped from keyword titles on top of the retrieval stopwords
+TITLE_STOPWORDS = STOPWORDS | frozenset("""
+    oleh sih tapi terus kalau kalo jadi pakai pake lewat sekarang per saja bisakah
+    uangnya dibantu nya lah ini itu sama buat biar udah udh gitu
+""".split())
+
+_PRODUCTS = [(re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE), label) for pattern, label in PRODUCTS]
+_INTENTS = [(re.compile(rf"\b(?:{pattern})", re.IGNORECASE), label) for pattern, label in INTENTS]
+_QUALIFIER = re.compile(r"(?:\s+[A-Z][a-z]+){1,3}")
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9]+")
+
+OnUsage = Callable[[TokenUsage], None]
+
+
+def _products(text: str) -> List[str]:
+    """Products in the order the user mentions them"""
+    found: List[Tuple[int, int, str]] = []
+    for pattern, label in _PRODUCTS:
+        match = pattern.search(text)
+        # "isi saldo" is Top Up, not Top Up and Saldo
+        if not match or any(start < match.end() and match.start() < end for start, end, _ in found):
+            continue
+        if label == "Celengan":
+            # the named Celengan product, e.g. "Celengan Warung Usaha Mikro"
+            qualifier = _QUALIFIER.match(text, match.end())
+            if qualifier:
+                label += qualifier.group(0).rstrip()
+        found.append((match.start(), match.end(), label))
+    return [label for _, _, label in sorted(found)]
+
+
+def _strip_suffix(word: str) -> str:
+    for suffix in SUFFIXES:
+        if len(word) > len(suffix) + 3 and word.lower().endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def _keywords(text: str, limit: int) -> List[str]:
+    words = []
+    for word in _WORD.findall(text):
+        word = _strip_suffix(word)
+        lower = word.lower()
+        if lower in TITLE_STOPWORDS or len(lower) < 3 or any(w.lower() == lower for w in words):
+            continue
+        # keep the user's casing for names and acronyms ("CEO", "OJK")
+        words.append(word if not word.islower() else word.capitalize())
+        if len(words) == limit:
+            break
+    return words
+
+
+def extract_title(user_message: str, assistant_response: str = "") -> str:
+    """
+    Thread title from the first exchange without a model call: an intent
+    ("Pengajuan", "Imbal Hasil", ...) followed by the Amartha products
+    mentioned, or else the first content words. The user's message decides;
+    the response is only used when the message says nothing (audio only).
+    """
+    for text in (user_message, assistant_response):
+        if not text or text.startswith("[Audio"):
+            continue
+        intent = next((label for pattern, label in _INTENTS if pattern.search(text)), None)
+        topic = _products(text)
+        if not topic:
+            topic = _keywords(text, limit=3)
+            if intent:
+                # "Cara isi ..." words already say the intent
+                topic = [word for word in topic if not any(p.fullmatch(word) for p, _ in _INTENTS)]
+        if not topic and not intent:
+            continue
+        words = " ".join(([intent] if intent else []) + topic).split()
+        return " ".join(words[:MAX_TITLE_WORDS])[:100]
+    return FALLBACK_TITLE
+
+
+class TitleService:
+    """
+    Titles for new threads.
+
+    TITLE_MODE=local (default) extracts the title from the first exchange in
+    microseconds; refine also asks Gemini for a better title in the
+    background and replaces the local one unless the user renamed the thread
+    meanwhile; llm is the previous behaviour, a model call before `done`.
+    """
+
+    def __init__(self, mode: str):
+        if mode not in ("local", "refine", "llm"):
+            raise ValueError(f"TITLE_MODE must be local, refine or llm, not {mode!r}")
+        self.mode = mode
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def title_thread(
+        self,
+        thread_service: ThreadService,
+        thread_id: UUID,
+        user_id: UUID,
+        user_message: str,
+        assistant_response: str,
+        on_usage: Optional[OnUsage] = None,
+    ) -> str:
+        """Store a title for a new thread and return it"""
+        if self.mode == "llm":
+            title = await self._llm_title(user_message, assistant_response, on_usage)
+            source = "llm"
+        else:
+            title = extract_title(user_message, assistant_response)
+            source = "local"
+        await thread_service.update_thread(thread_id=thread_id, user_id=user_id, title=title)
+        metrics.THREAD_TITLES.labels(source).inc()
+
+        if self.mode == "refine":
+            task = asyncio.create_task(self._refine(
+                thread_service, thread_id, user_id, title, user_message, assistant_response, on_usage,
+            ))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return title
+
+    @staticmethod
+    async def _llm_title(user_message: str, assistant_response: str, on_usage: Optional[OnUsage]) -> str:
+        from app.services.gemini import get_gemini_service
+        return await get_gemini_service().generate_title(user_message, assistant_response, on_usage=on_usage)
+
+    async def _refine(
+        self,
+        thread_service: ThreadService,
+        thread_id: UUID,
+        user_id: UUID,
+        local_title: str,
+        user_message: str,
+        assistant_response: str,
+        on_usage: Optional[OnUsage],
+    ) -> None:
+        try:
+            title = await self._llm_title(user_message, assistant_response, on_usage)
+            thread = await thread_service.get_thread(thread_id, user_id)
+            if title and thread and thread.get("title") == local_title:
+                await thread_service.update_thread(thread_id=thread_id, user_id=user_id, title=title)
+                metrics.THREAD_TITLES.labels("refined").inc()
+        except Exception as e:
+            # the local title stays
+            logger.warning("Title refinement for thread %s failed: %s", thread_id, repr(e))
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Let running refinements finish, up to `timeout` seconds"""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+
+# Singleton instance
+title_service = TitleService(get_settings().title_mode)
+
+
+def get_title_service() -> TitleService:
+    """Get title service instance"""
+    return title_service
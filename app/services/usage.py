@@ -0,0 +1,237 @@
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from functools import partial
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from app.database import get_supabase
+from app.models.usage import TokenUsage
+from app.services import metrics
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# List prices in USD (per million tokens, per hour of STT audio). Estimates
+# only: the provider invoice is authoritative. Audio sent to Gemini is priced
+# as text input here, which undercounts audio turns slightly.
+PRICES: Dict[Tuple[str, str], dict] = {
+    ("gemini", "gemini-2.5-flash"): {"input": 0.30, "cached": 0.075, "output": 2.50},
+    ("groq", "meta-llama/llama-4-maverick-17b-128e-instruct"): {"input": 0.20, "output": 0.60},
+    ("groq", "meta-llama/llama-4-scout-17b-16e-instruct"): {"input": 0.11, "output": 0.34},
+    ("groq", "llama-3.3-70b-versatile"): {"input": 0.59, "output": 0.79},
+    ("groq", "whisper-large-v3"): {"audio_hour": 0.111},
+    ("groq", "whisper-large-v3-turbo"): {"audio_hour": 0.04},
+}
+
+# Groq bills every transcription as at least 10 seconds
+STT_MIN_BILLED_SECONDS = 10.0
+
+COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "cached_tokens", "audio_seconds", "cost_usd")
+GROUP_FIELDS = ("day", "user_id", "thread_id", "provider", "model", "kind")
+
+OnUsage = Callable[[TokenUsage], None]
+
+
+def estimate_cost(usage: TokenUsage) -> float:
+    """Estimated USD cost of one call; 0 for models missing from PRICES"""
+    price = PRICES.get((usage.provider, usage.model))
+    if not price:
+        return 0.0
+    cached = min(usage.cached_tokens, usage.prompt_tokens)
+    cost = (
+        (usage.prompt_tokens - cached) * price.get("input", 0.0)
+        + cached * price.get("cached", price.get("input", 0.0))
+        + usage.completion_tokens * price.get("output", 0.0)
+    ) / 1_000_000
+    if usage.audio_seconds:
+        cost += max(usage.audio_seconds, STT_MIN_BILLED_SECONDS) / 3600 * price.get("audio_hour", 0.0)
+    return cost
+
+
+def _add(row: dict, values: dict) -> None:
+    for name in COUNTERS:
+        row[name] += values[name]
+    row["max_prompt_tokens"] = max(row["max_prompt_tokens"], values["max_prompt_tokens"])
+
+
+class UsageService:
+    """
+    Token usage and estimated cost per thread, user, provider and day.
+
+    Providers report usage through an `on_usage` callback (see `tracker()`);
+    recording only updates in-process counters and Prometheus metrics, so it
+    never waits on the database. A background task adds the accumulated rows
+    onto `usage_daily` every USAGE_FLUSH_INTERVAL seconds with one RPC call.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: Dict[tuple, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def tracker(self, user_id: Optional[UUID], thread_id: Optional[UUID], kind: str) -> OnUsage:
+        """Callback that attributes reported usage to a user, thread and kind (chat, title, stt, ...)"""
+        return partial(self.record, user_id=user_id, thread_id=thread_id, kind=kind)
+
+    def record(
+        self,
+        usage: TokenUsage,
+        user_id: Optional[UUID] = None,
+        thread_id: Optional[UUID] = None,
+        kind: str = "chat",
+    ) -> None:
+        try:
+            cost = estimate_cost(usage)
+            self._observe(usage, kind, cost)
+            day = datetime.now(timezone.utc).date().isoformat()
+            key = (day, str(user_id) if user_id else None, str(thread_id) if thread_id else None,
+                   usage.provider, usage.model, kind)
+            row = self._pending.get(key)
+            if row is None:
+                row = self._pending[key] = {
+                    **dict(zip(GROUP_FIELDS, key)),
+                    **{name: 0 for name in COUNTERS},
+                    "max_prompt_tokens": 0,
+                }
+            _add(row, {
+                "requests": 1,
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "cached_tokens": usage.cached_tokens,
+                "audio_seconds": usage.audio_seconds,
+                "cost_usd": cost,
+                "max_prompt_tokens": usage.prompt_tokens,
+            })
+        except Exception:
+            # accounting must never break a response
+            logger.exception("Recording usage failed")
+
+    @staticmethod
+    def _observe(usage: TokenUsage, kind: str, cost: float) -> None:
+        metrics.LLM_REQUESTS.labels(usage.provider, usage.model, kind).inc()
+        if usage.audio_seconds:
+            metrics.STT_AUDIO_SECONDS.labels(usage.provider, usage.model).inc(usage.audio_seconds)
+        else:
+            metrics.LLM_PROMPT_TOKENS.labels(usage.provider, kind).observe(usage.prompt_tokens)
+        for token_type, count in (
+            ("prompt", usage.prompt_tokens),
+            ("completion", usage.completion_tokens),
+            ("cached", usage.cached_tokens),
+        ):
+            if count:
+                metrics.LLM_TOKENS.labels(usage.provider, usage.model, kind, token_type).inc(count)
+        if cost:
+            metrics.LLM_COST.labels(usage.provider, usage.model, kind).inc(cost)
+
+    async def start(self) -> None:
+        if self.flush_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write what is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.flush_interval > 0:
+            await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        rows = [{**row, "cost_usd": round(row["cost_usd"], 6)} for row in pending.values()]
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except Exception as e:
+            # keep the rows for the next flush; usage recorded meanwhile is merged in
+            logger.warning("Usage flush failed, keeping %d rows: %s", len(rows), repr(e))
+            for key, row in pending.items():
+                if key in self._pending:
+                    _add(self._pending[key], row)
+                else:
+                    self._pending[key] = row
+
+    @staticmethod
+    def _write(rows: List[dict]) -> None:
+        get_supabase().rpc("record_usage", {"rows": rows}).execute()
+
+    async def query(
+        self,
+        start: date,
+        end: date,
+        group_by: Sequence[str] = ("day",),
+        user_id: Optional[UUID] = None,
+        thread_id: Optional[UUID] = None,
+        provider: Optional[str] = None,
+    ) -> List[dict]:
+        """Sum usage_daily rows between start and end (inclusive) per `group_by` fields"""
+        # this worker's pending usage first, so a query right after a turn sees it
+        await self.flush()
+        rows = await asyncio.to_thread(self._read, start, end, user_id, thread_id, provider)
+
+        groups: Dict[tuple, dict] = {}
+        for row in rows:
+            key = tuple(row[name] for name in group_by)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    **dict(zip(group_by, key)),
+                    **{name: 0 for name in COUNTERS},
+                    "max_prompt_tokens": 0,
+                }
+            _add(group, {**row, "cost_usd": float(row["cost_usd"])})
+
+        summaries = []
+        for group in sorted(groups.values(), key=lambda g: tuple(str(g[name]) for name in group_by)):
+            group["cost_usd"] = round(group["cost_usd"], 6)
+            group["audio_seconds"] = round(group["audio_seconds"], 3)
+            group["avg_prompt_tokens"] = round(group["prompt_tokens"] / group["requests"], 1) if group["requests"] else 0.0
+            summaries.append(group)
+        return summaries
+
+    @staticmethod
+    def _read(
+        start: date,
+        end: date,
+        user_id: Optional[UUID],
+        thread_id: Optional[UUID],
+        provider: Optional[str],
+        page_size: int = 1000,
+    ) -> List[dict]:
+        rows: List[dict] = []
+        while True:
+            request = (
+                get_supabase().table("usage_daily")
+                .select("*")
+                .gte("day", start.isoformat())
+                .lte("day", end.isoformat())
+            )
+            if user_id:
+                request = request.eq("user_id", str(user_id))
+            if thread_id:
+                request = request.eq("thread_id", str(thread_id))
+            if provider:
+                request = request.eq("provider", provider)
+            # a total order keeps pages from overlapping
+            for name in GROUP_FIELDS:
+                request = request.order(name)
+            page = request.range(len(rows), len(rows) + page_size - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+
+
+# Singleton instance
+usage_service = UsageService(get_settings().usage_flush_interval)
+
+
+def get_usage_service() -> UsageService:
+    """Get usage service instance"""
+    return usage_service
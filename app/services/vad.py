@@ -0,0 +1,166 @@
+import io
+import math
+import wave
+from array import array
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.settings import get_settings
+
+# Energy-based voice activity detection tuning (16-bit PCM RMS units / milliseconds)
+settings = get_settings()
+VAD_ENERGY_THRESHOLD = settings.vad_energy_threshold
+VAD_NOISE_RATIO = settings.vad_noise_ratio
+VAD_FRAME_MS = settings.vad_frame_ms
+VAD_SEGMENT_SILENCE_MS = settings.vad_segment_silence_ms
+VAD_UTTERANCE_SILENCE_MS = settings.vad_utterance_silence_ms
+VAD_MAX_SEGMENT_MS = settings.vad_max_segment_ms
+VAD_PRE_ROLL_MS = settings.vad_pre_roll_ms
+
+SAMPLE_WIDTH = 2  # 16-bit signed little-endian PCM
+
+
+@dataclass
+class VadEvent:
+    type: str  # 'segment' or 'end_of_utterance'
+    pcm: Optional[bytes] = None
+
+
+def frame_rms(frame: bytes) -> float:
+    """Root-mean-square energy of a 16-bit PCM frame"""
+    samples = array("h")
+    samples.frombytes(frame[: len(frame) - len(frame) % SAMPLE_WIDTH])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int, channels: int = 1) -> bytes:
+    """Wrap raw 16-bit PCM in a WAV container"""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buf.getvalue()
+
+
+class VoiceActivitySegmenter:
+    """
+    Split a live 16-bit mono PCM stream into speech segments.
+
+    Audio is consumed in fixed-size frames and compared against an energy
+    threshold that adapts to the background noise floor. A segment closes after a short
+    pause (or when it grows too long) so it can be transcribed while the user
+    keeps talking; a longer pause after speech marks the end of the utterance.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = VAD_FRAME_MS,
+        energy_threshold: float = VAD_ENERGY_THRESHOLD,
+        noise_ratio: float = VAD_NOISE_RATIO,
+        segment_silence_ms: int = VAD_SEGMENT_SILENCE_MS,
+        utterance_silence_ms: int = VAD_UTTERANCE_SILENCE_MS,
+        max_segment_ms: int = VAD_MAX_SEGMENT_MS,
+        pre_roll_ms: int = VAD_PRE_ROLL_MS,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * SAMPLE_WIDTH
+        if self.frame_bytes <= 0:
+            raise ValueError(f"A {frame_ms} ms frame at {sample_rate} Hz holds no samples")
+        self.energy_threshold = energy_threshold
+        self.noise_ratio = noise_ratio
+        self.segment_silence_frames = max(1, segment_silence_ms // frame_ms)
+        self.utterance_silence_frames = max(1, utterance_silence_ms // frame_ms)
+        self.max_segment_frames = max(1, max_segment_ms // frame_ms)
+        self.pre_roll_frames = pre_roll_ms // frame_ms
+
+        self._pending = bytearray()
+        self._pre_roll: List[bytes] = []
+        self._segment: List[bytes] = []
+        self._in_speech = False
+        self._utterance_has_speech = False
+        self._silent_frames = 0
+        self._noise_floor: Optional[float] = None
+
+    def feed(self, pcm: bytes) -> List[VadEvent]:
+        """Consume PCM bytes and return any segment / end-of-utterance events"""
+        self._pending.extend(pcm)
+        events: List[VadEvent] = []
+
+        while len(self._pending) >= self.frame_bytes:
+            frame = bytes(self._pending[: self.frame_bytes])
+            del self._pending[: self.frame_bytes]
+            events.extend(self._process_frame(frame))
+
+        return events
+
+    def flush(self) -> List[VadEvent]:
+        """Close any open segment and end the current utterance"""
+        events: List[VadEvent] = []
+        if self._pending and self._in_speech:
+            self._segment.append(bytes(self._pending))
+        self._pending.clear()
+        if self._segment:
+            events.append(self._close_segment())
+        if self._utterance_has_speech:
+            events.append(VadEvent(type="end_of_utterance"))
+        self._reset_utterance()
+        return events
+
+    def _process_frame(self, frame: bytes) -> List[VadEvent]:
+        events: List[VadEvent] = []
+        rms = frame_rms(frame)
+        threshold = self.energy_threshold
+        if self._noise_floor is not None:
+            threshold = max(threshold, self._noise_floor * self.noise_ratio)
+        is_speech = rms >= threshold
+        if not is_speech:
+            # track background noise so a noisy room does not count as speech
+            if self._noise_floor is None:
+                self._noise_floor = rms
+            else:
+                self._noise_floor = 0.95 * self._noise_floor + 0.05 * rms
+
+        if is_speech:
+            if not self._in_speech:
+                # keep a little audio from before the onset so words are not clipped
+                self._segment.extend(self._pre_roll)
+                self._pre_roll = []
+                self._in_speech = True
+            self._segment.append(frame)
+            self._utterance_has_speech = True
+            self._silent_frames = 0
+            if len(self._segment) >= self.max_segment_frames:
+                events.append(self._close_segment())
+            return events
+
+        self._silent_frames += 1
+        if self._in_speech:
+            self._segment.append(frame)
+            if self._silent_frames >= self.segment_silence_frames:
+                events.append(self._close_segment())
+        else:
+            self._pre_roll.append(frame)
+            if len(self._pre_roll) > self.pre_roll_frames:
+                self._pre_roll.pop(0)
+
+        if self._utterance_has_speech and self._silent_frames >= self.utterance_silence_frames:
+            events.append(VadEvent(type="end_of_utterance"))
+            self._reset_utterance()
+
+        return events
+
+    def _close_segment(self) -> VadEvent:
+        pcm = b"".join(self._segment)
+        self._segment = []
+        self._in_speech = False
+        return VadEvent(type="segment", pcm=pcm)
+
+    def _reset_utterance(self) -> None:
+        self._utterance_has_speech = False
+        self._silent_frames = 0
+        self._pre_roll = []
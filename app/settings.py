@@ -0,0 +1,208 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# .env lives in the backend directory (next to main.py)
+ENV_PATH = Path(__file__).resolve().parent.parent / ".env"
+PROJECT_ROOT = ENV_PATH.parent
+
+
+def _bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+
+@dataclass(frozen=True)
+class Settings:
+    # Supabase
+    supabase_url: Optional[str]
+    supabase_service_role_key: Optional[str]
+
+    # Gemini
+    gemini_api_key: Optional[str]
+    gemini_api_endpoint: Optional[str]
+
+    # Groq
+    groq_api_key: Optional[str]
+    groq_stt_url: str
+    groq_api_base: str
+    groq_stt_model: str
+    groq_llm_model: str
+
+    # Streaming
+    stream_save_interval: float
+
+    # Audio preprocessing
+    audio_preprocess: bool
+    audio_sample_rate: int
+    audio_trim_silence: bool
+    audio_trim_threshold: float
+    audio_trim_padding_ms: int
+    audio_encode: str
+    audio_opus_bitrate: str
+    max_upload_mb: float
+    audio_workers: int
+
+    # Transcript cache
+    stt_cache_size: int
+    stt_cache_ttl: float
+
+    # Voice activity detection
+    vad_energy_threshold: float
+    vad_noise_ratio: float
+    vad_frame_ms: int
+    vad_segment_silence_ms: int
+    vad_utterance_silence_ms: int
+    vad_max_segment_ms: int
+    vad_pre_roll_ms: int
+
+    # Production server (gunicorn.conf.py)
+    web_concurrency: int
+    web_preload: bool
+
+    # Request shape capture (bench/replay.py)
+    capture_requests: bool
+    capture_path: Path
+    capture_sample_rate: float
+    capture_salt: bytes
+
+    # Admin API and profiling
+    admin_token: Optional[str]
+    profile_dir: Path
+    profile_max_files: int
+    loop_lag_threshold_ms: float
+
+    # Token usage accounting
+    usage_flush_interval: float
+
+    # Knowledge base registry and retrieval
+    knowledge_source: str
+    knowledge_dir: Path
+    knowledge_reload_interval: float
+    kb_top_k: int
+    kb_min_score: float
+
+    # Thread titles
+    title_mode: str
+
+    # Message search
+    search_backend: str
+
+    # Thread archival
+    archive_after_days: float
+    archive_interval: float
+    archive_batch_size: int
+
+    # Storage and thread garbage collection
+    gc_interval: float
+    gc_grace_hours: float
+    gc_empty_threads: str
+    audio_retention_days: float
+    gc_batch_size: int
+    gc_requests_per_second: float
+
+    # Thread event stream
+    event_bus_backend: str
+    event_bus_url: str
+
+    # Idempotent chat turns
+    idempotency_ttl: float
+    idempotency_max_entries: int
+
+    # Audio playback
+    audio_cache_dir: Path
+    audio_cache_max_mb: float
+    audio_cache_revalidate: float
+
+    # Readiness / draining
+    health_check_interval: float
+    health_check_timeout: float
+    drain_timeout: float
+
+    # Batch jobs
+    batch_jobs_dir: Path
+    batch_concurrency: int
+    batch_max_files: int
+    batch_retention_days: float
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Load .env once and return the shared settings"""
+    load_dotenv(dotenv_path=ENV_PATH)
+
+    return Settings(
+        supabase_url=os.getenv("SUPABASE_URL"),
+        supabase_service_role_key=os.getenv("SUPABASE_SERVICE_ROLE_KEY"),
+        gemini_api_key=os.getenv("GEMINI_API_KEY"),
+        gemini_api_endpoint=os.getenv("GEMINI_API_ENDPOINT"),
+        groq_api_key=os.getenv("GROQ_API_KEY"),
+        groq_stt_url=os.getenv("GROQ_STT_URL", "https://api.groq.com/openai/v1/audio/transcriptions"),
+        groq_api_base=os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1"),
+        groq_stt_model=os.getenv("GROQ_STT_MODEL", "whisper-large-v3"),
+        groq_llm_model=os.getenv("GROQ_LLM_MODEL", "meta-llama/llama-4-maverick-17b-128e-instruct"),
+        stream_save_interval=float(os.getenv("STREAM_SAVE_INTERVAL", "0")),
+        audio_preprocess=_bool("AUDIO_PREPROCESS", "true"),
+        audio_sample_rate=int(os.getenv("AUDIO_SAMPLE_RATE", "16000")),
+        audio_trim_silence=_bool("AUDIO_TRIM_SILENCE", "true"),
+        audio_trim_threshold=float(os.getenv("AUDIO_TRIM_THRESHOLD", "300")),
+        audio_trim_padding_ms=int(os.getenv("AUDIO_TRIM_PADDING_MS", "200")),
+        audio_encode=os.getenv("AUDIO_ENCODE", "wav").lower(),
+        audio_opus_bitrate=os.getenv("AUDIO_OPUS_BITRATE", "24k"),
+        max_upload_mb=float(os.getenv("MAX_UPLOAD_MB", "25")),
+        audio_workers=int(os.getenv("AUDIO_WORKERS", "2")),
+        stt_cache_size=int(os.getenv("STT_CACHE_SIZE", "1024")),
+        stt_cache_ttl=float(os.getenv("STT_CACHE_TTL", "3600")),
+        vad_energy_threshold=float(os.getenv("VAD_ENERGY_THRESHOLD", "500")),
+        vad_noise_ratio=float(os.getenv("VAD_NOISE_RATIO", "3.0")),
+        vad_frame_ms=int(os.getenv("VAD_FRAME_MS", "30")),
+        vad_segment_silence_ms=int(os.getenv("VAD_SEGMENT_SILENCE_MS", "300")),
+        vad_utterance_silence_ms=int(os.getenv("VAD_UTTERANCE_SILENCE_MS", "900")),
+        vad_max_segment_ms=int(os.getenv("VAD_MAX_SEGMENT_MS", "10000")),
+        vad_pre_roll_ms=int(os.getenv("VAD_PRE_ROLL_MS", "150")),
+        web_concurrency=int(os.getenv("WEB_CONCURRENCY", "0")),
+        web_preload=_bool("WEB_PRELOAD", "true"),
+        capture_requests=_bool("CAPTURE_REQUESTS", "false"),
+        capture_path=Path(os.getenv("CAPTURE_PATH", str(PROJECT_ROOT / "data" / "capture.jsonl"))),
+        capture_sample_rate=float(os.getenv("CAPTURE_SAMPLE_RATE", "1.0")),
+        # random per process unless set: identifiers stay linkable only within one capture
+        capture_salt=os.getenv("CAPTURE_SALT", "").encode() or os.urandom(16),
+        admin_token=os.getenv("ADMIN_TOKEN") or None,
+        profile_dir=Path(os.getenv("PROFILE_DIR", str(PROJECT_ROOT / "data" / "profiles"))),
+        profile_max_files=int(os.getenv("PROFILE_MAX_FILES", "200")),
+        loop_lag_threshold_ms=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250")),
+        usage_flush_interval=float(os.getenv("USAGE_FLUSH_INTERVAL", "30")),
+        knowledge_source=os.getenv("KNOWLEDGE_SOURCE", "files").lower(),
+        knowledge_dir=Path(os.getenv("KNOWLEDGE_DIR", str(PROJECT_ROOT / "app" / "knowledge"))),
+        knowledge_reload_interval=float(os.getenv("KNOWLEDGE_RELOAD_INTERVAL", "30")),
+        kb_top_k=int(os.getenv("KB_TOP_K", "2")),
+        kb_min_score=float(os.getenv("KB_MIN_SCORE", "1.0")),
+        title_mode=os.getenv("TITLE_MODE", "local").lower(),
+        search_backend=os.getenv("SEARCH_BACKEND", "postgres").lower(),
+        archive_after_days=float(os.getenv("ARCHIVE_AFTER_DAYS", "0")),
+        archive_interval=float(os.getenv("ARCHIVE_INTERVAL", "3600")),
+        archive_batch_size=int(os.getenv("ARCHIVE_BATCH_SIZE", "100")),
+        gc_interval=float(os.getenv("GC_INTERVAL", "3600")),
+        gc_grace_hours=float(os.getenv("GC_GRACE_HOURS", "24")),
+        gc_empty_threads=os.getenv("GC_EMPTY_THREADS", "off").lower(),
+        audio_retention_days=float(os.getenv("AUDIO_RETENTION_DAYS", "0")),
+        gc_batch_size=int(os.getenv("GC_BATCH_SIZE", "100")),
+        gc_requests_per_second=float(os.getenv("GC_REQUESTS_PER_SECOND", "5")),
+        event_bus_backend=os.getenv("EVENT_BUS_BACKEND", "memory").lower(),
+        event_bus_url=os.getenv("EVENT_BUS_URL", ""),
+        idempotency_ttl=float(os.getenv("IDEMPOTENCY_TTL", "600")),
+        idempotency_max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "1000")),
+        audio_cache_dir=Path(os.getenv("AUDIO_CACHE_DIR", str(PROJECT_ROOT / "data" / "audio_cache"))),
+        audio_cache_max_mb=float(os.getenv("AUDIO_CACHE_MAX_MB", "512")),
+        audio_cache_revalidate=float(os.getenv("AUDIO_CACHE_REVALIDATE", "3600")),
+        health_check_interval=float(os.getenv("HEALTH_CHECK_INTERVAL", "15")),
+        health_check_timeout=float(os.getenv("HEALTH_CHECK_TIMEOUT", "5")),
+        drain_timeout=float(os.getenv("DRAIN_TIMEOUT", "60")),
+        batch_jobs_dir=Path(os.getenv("BATCH_JOBS_DIR", str(PROJECT_ROOT / "data" / "jobs"))),
+        batch_concurrency=int(os.getenv("BATCH_CONCURRENCY", "4")),
+        batch_max_files=int(os.getenv("BATCH_MAX_FILES", "500")),
+        batch_retention_days=float(os.getenv("BATCH_RETENTION_DAYS", "7")),
+    )
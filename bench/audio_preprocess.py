@@ -0,0 +1,52 @@
+"""
+Benchmark the audio preprocessing stage on a sample recording.
+
+Usage:
+    python bench/audio_preprocess.py [path/to/audio.wav] [--runs N]
+
+Reports output size and processing time for each encoding available in
+this environment (FLAC/Opus need ffmpeg on PATH).
+"""
+import argparse
+import sys
+import time
+import wave
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services import audio  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", default=str(Path(__file__).resolve().parent.parent / "test_1.wav"))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    data = Path(args.path).read_bytes()
+    with wave.open(args.path, "rb") as wav:
+        params = wav.getparams()
+    duration = params.nframes / params.framerate
+    print(f"input: {args.path}")
+    print(f"  {params.nchannels} ch, {params.framerate} Hz, {8 * params.sampwidth}-bit, "
+          f"{duration:.2f}s, {len(data):,} bytes")
+    print(f"ffmpeg: {audio.FFMPEG or 'not found (wav only)'}")
+    print()
+    print(f"{'encoding':<10}{'bytes':>12}{'ratio':>9}{'duration':>10}{'ms/run':>10}")
+
+    encodings = ["wav"] + (["flac", "opus"] if audio.FFMPEG else [])
+    for encoding in encodings:
+        timings = []
+        result = None
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = audio.preprocess_audio_sync(data, encoding=encoding)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(f"{encoding:<10}{len(result.data):>12,}{len(data) / len(result.data):>8.1f}x"
+              f"{result.duration:>9.2f}s{timings[len(timings) // 2]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
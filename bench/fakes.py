@@ -0,0 +1,532 @@
+"""
+Local stand-ins for Supabase, Gemini and Groq, for benchmarking without credentials.
+
+Usage:
+    python bench/fakes.py [--port 8900] [--grpc-port 8901] [--cert-dir /tmp/amartha-fakes]
+                          [--db-latency-ms 5] [--stt-latency-ms 200] [--llm-latency-ms 300]
+                          [--tokens 60] [--tokens-per-sec 100] [--chunk-tokens 8] [--max-rows 1000]
+
+HTTP on --port:
+  - /auth/v1/user: any bearer token is a valid user (stable id per token)
+  - /rest/v1/<table>: in-memory PostgREST subset (eq/gt/gte/lt/lte/in/is
+    filters, not. and or=(...), order, limit, single-object responses,
+    insert/upsert/update/delete returning rows); reads return at most
+    --max-rows rows, like PostgREST's max-rows (Supabase: 1000)
+  - /rest/v1/rpc/record_usage, delete_empty_threads: the functions from
+    app/models/usage.py and app/models/thread.py
+  - /storage/v1/object/<bucket>/<path>: upload (409 Duplicate on existing
+    keys unless upserting), download (and HEAD), bulk remove and folder listing
+  - /openai/v1/audio/transcriptions, /openai/v1/chat/completions (streaming
+    and not), /openai/v1/models: Groq's OpenAI-compatible API
+
+gRPC over TLS on --grpc-port: Gemini's GenerativeService (GenerateContent and
+StreamGenerateContent), so the app uses the same grpc_asyncio transport as in
+production. A self-signed certificate for localhost is written to --cert-dir;
+point GRPC_DEFAULT_SSL_ROOTS_FILE_PATH at its cert.pem.
+
+Generation waits the first-token latency, then emits `--tokens` tokens at
+`--tokens-per-sec`, `--chunk-tokens` per chunk; both LLM stand-ins report
+token usage (prompt tokens estimated as characters / 4). bench/load.py
+starts this process and wires the app's environment to it.
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import unquote
+
+import grpc
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from google.ai import generativelanguage_v1beta as glm
+
+WORDS = (
+    "Modal usaha bisa diajukan melalui mitra Amartha dengan syarat sederhana dan "
+    "angsuran mingguan yang disesuaikan dengan kemampuan usaha Anda"
+).split()
+
+GEMINI_SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+
+
+def now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+def generated_words(count: int) -> List[str]:
+    return [WORDS[i % len(WORDS)] for i in range(count)]
+
+
+def estimate_tokens(texts) -> int:
+    return sum(len(text) for text in texts) // 4
+
+
+def make_cert(cert_dir: Path) -> None:
+    cert_dir.mkdir(parents=True, exist_ok=True)
+    if (cert_dir / "cert.pem").exists():
+        return
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "7",
+         "-keyout", str(cert_dir / "key.pem"), "-out", str(cert_dir / "cert.pem"),
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True, capture_output=True,
+    )
+
+
+class Generation:
+    """Token timing shared by the Gemini and Groq stand-ins"""
+
+    def __init__(self, latency_ms: float, tokens: int, tokens_per_sec: float, chunk_tokens: int):
+        self.latency = latency_ms / 1000
+        self.tokens = tokens
+        self.tokens_per_sec = tokens_per_sec
+        self.chunk_tokens = max(1, chunk_tokens)
+
+    def capped(self, max_tokens: Optional[int]) -> int:
+        """Tokens generated under a request's output cap (0 or None: no cap)"""
+        return min(self.tokens, max_tokens) if max_tokens else self.tokens
+
+    async def chunks(self, max_tokens: Optional[int] = None):
+        await asyncio.sleep(self.latency)
+        words = generated_words(self.capped(max_tokens))
+        for start in range(0, len(words), self.chunk_tokens):
+            chunk = words[start:start + self.chunk_tokens]
+            if start:
+                await asyncio.sleep(len(chunk) / self.tokens_per_sec)
+            yield " ".join(chunk) + " "
+
+    async def text(self, max_tokens: Optional[int] = None) -> str:
+        return "".join([chunk async for chunk in self.chunks(max_tokens)])
+
+
+# -------------------- Supabase --------------------
+
+class PostgrestStore:
+    """Just enough of PostgREST for app/services/thread.py"""
+
+    DEFAULTS = {
+        "threads": {"title": None, "generation_profile": None, "archived_at": None, "archive_path": None,
+                    "archived_messages": None, "restored_at": None, "audio_expired_at": None},
+        "messages": {"audio_url": None},
+    }
+
+    def __init__(self, max_rows: Optional[int] = None):
+        self.tables: Dict[str, Dict[str, dict]] = {}
+        self.max_rows = max_rows
+
+    def rows(self, table: str) -> Dict[str, dict]:
+        return self.tables.setdefault(table, {})
+
+    OPERATORS = {
+        "eq": lambda a, b: a == b,
+        "gt": lambda a, b: a > b,
+        "gte": lambda a, b: a >= b,
+        "lt": lambda a, b: a < b,
+        "lte": lambda a, b: a <= b,
+        "in": lambda a, b: a in [value.strip('"') for value in b.strip("()").split(",")],
+    }
+
+    @classmethod
+    def condition(cls, column: str, expression: str) -> Optional[Callable[[dict], bool]]:
+        """`eq.x`, `is.null`, `not.is.null`, ... on one column; values compare as strings"""
+        negate = expression.startswith("not.")
+        op, _, operand = expression[4 if negate else 0:].partition(".")
+        operand = unquote(operand)
+        if op == "is":
+            def test(row):
+                return row.get(column) is None if operand == "null" else str(row.get(column)).lower() == operand
+        elif op in cls.OPERATORS:
+            def test(row):
+                return row.get(column) is not None and cls.OPERATORS[op](str(row[column]), operand)
+        else:
+            return None
+        return (lambda row: not test(row)) if negate else test
+
+    @classmethod
+    def logical(cls, op: str, value: str) -> Callable[[dict], bool]:
+        """or=(col.op.value,and(col.op.value,col.op.value))"""
+        parts, depth, start = [], 0, 0
+        inner = value[1:-1]
+        for i, char in enumerate(inner + ","):
+            depth += {"(": 1, ")": -1}.get(char, 0)
+            if char == "," and depth == 0:
+                parts.append(inner[start:i])
+                start = i + 1
+        tests = [
+            cls.logical(part[:part.index("(")], part[part.index("("):])
+            if part.startswith(("and(", "or(")) else cls.condition(*part.split(".", 1))
+            for part in parts
+        ]
+        combine = any if op == "or" else all
+        return lambda row: combine(test(row) for test in tests)
+
+    @classmethod
+    def filters(cls, params) -> List[Callable[[dict], bool]]:
+        wanted = []
+        for key, value in params.multi_items():
+            if key in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+                continue
+            if key == "or":
+                wanted.append(cls.logical("or", value))
+            else:
+                test = cls.condition(key, value)
+                if test:
+                    wanted.append(test)
+        return wanted
+
+    def select(self, table: str, params) -> List[dict]:
+        wanted = self.filters(params)
+        # values compare as strings: fine for ids, ISO dates and timestamps
+        rows = [row for row in self.rows(table).values() if all(test(row) for test in wanted)]
+        if "order" in params:
+            # stable sorts, least significant column first
+            for term in reversed(params["order"].split(",")):
+                column, _, direction = term.partition(".")
+                rows.sort(key=lambda row: (row.get(column) is None, str(row.get(column) or "")),
+                          reverse=direction.startswith("desc"))
+        offset = int(params.get("offset", 0))
+        limit = int(params["limit"]) if "limit" in params else None
+        return rows[offset:None if limit is None else offset + limit]
+
+    def read(self, table: str, params) -> List[dict]:
+        """A GET: like PostgREST, longer results are cut to max-rows without an error"""
+        rows = self.select(table, params)
+        return rows if self.max_rows is None else rows[:self.max_rows]
+
+    def insert(self, table: str, body) -> List[dict]:
+        inserted = []
+        for values in body if isinstance(body, list) else [body]:
+            row = {
+                "id": str(uuid.uuid4()),
+                "created_at": now(),
+                "updated_at": now(),
+                **self.DEFAULTS.get(table, {}),
+                **values,
+            }
+            self.rows(table)[row["id"]] = row
+            inserted.append(row)
+        return inserted
+
+    def update(self, table: str, params, values: dict) -> List[dict]:
+        rows = self.select(table, params)
+        for row in rows:
+            row.update(values)
+        return rows
+
+    def delete(self, table: str, params) -> List[dict]:
+        rows = self.select(table, params)
+        for row in rows:
+            self.rows(table).pop(row["id"], None)
+        return rows
+
+    def delete_empty_threads(self, before: str, limit: int, untitled_only: bool = True) -> List[str]:
+        used = {message["thread_id"] for message in self.rows("messages").values()}
+        empty = sorted(
+            (thread for thread in self.rows("threads").values()
+             if thread["id"] not in used and thread.get("archived_at") is None and thread["updated_at"] < before
+             and (thread.get("title") is None or not untitled_only)),
+            key=lambda thread: thread["updated_at"],
+        )[:limit]
+        for thread in empty:
+            self.rows("threads").pop(thread["id"])
+        return [thread["id"] for thread in empty]
+
+    def record_usage(self, rows: List[dict]) -> None:
+        keys = ("day", "user_id", "thread_id", "provider", "model", "kind")
+        table = self.rows("usage_daily")
+        for values in rows:
+            key = "|".join(str(values.get(name)) for name in keys)
+            row = table.get(key)
+            if row is None:
+                table[key] = {"id": key, **values, "updated_at": now()}
+                continue
+            for name in ("requests", "prompt_tokens", "completion_tokens", "cached_tokens",
+                         "audio_seconds", "cost_usd"):
+                row[name] += values[name]
+            row["max_prompt_tokens"] = max(row["max_prompt_tokens"], values["max_prompt_tokens"])
+            row["updated_at"] = now()
+
+
+def build_http_app(
+    db_latency: float,
+    stt_latency: float,
+    generation: Generation,
+    max_rows: Optional[int] = None,
+) -> FastAPI:
+    app = FastAPI()
+    store = PostgrestStore(max_rows)
+    blobs: Dict[str, dict] = {}
+    # for tests that set up or inspect the data directly
+    app.state.store = store
+    app.state.blobs = blobs
+
+    @app.get("/auth/v1/user")
+    async def auth_user(request: Request):
+        await asyncio.sleep(db_latency)
+        token = request.headers.get("authorization", "").removeprefix("Bearer ")
+        return {
+            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, token)),
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": "bench@example.com",
+            "app_metadata": {},
+            "user_metadata": {},
+            "created_at": now(),
+        }
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def postgrest_rpc(function: str, request: Request):
+        await asyncio.sleep(db_latency)
+        body = await request.json()
+        if function == "record_usage":
+            store.record_usage(body["rows"])
+            return None
+        if function == "delete_empty_threads":
+            return store.delete_empty_threads(body["p_before"], body["p_limit"], body.get("p_untitled_only", True))
+        return JSONResponse(status_code=404, content={
+            "code": "PGRST202", "details": None, "hint": None,
+            "message": f"Could not find the function public.{function}",
+        })
+
+    @app.api_route("/rest/v1/{table}", methods=["GET", "POST", "PATCH", "DELETE"])
+    async def postgrest(table: str, request: Request):
+        await asyncio.sleep(db_latency)
+        params = request.query_params
+        if request.method == "GET":
+            rows = store.read(table, params)
+        elif request.method == "POST":
+            rows = store.insert(table, await request.json())
+        elif request.method == "PATCH":
+            rows = store.update(table, params, await request.json())
+        else:
+            rows = store.delete(table, params)
+
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return JSONResponse(status_code=406, content={
+                    "code": "PGRST116",
+                    "details": f"The result contains {len(rows)} rows",
+                    "hint": None,
+                    "message": "JSON object requested, multiple (or no) rows returned",
+                })
+            return rows[0]
+        return rows
+
+    @app.post("/storage/v1/object/list/{bucket}")
+    async def storage_list(bucket: str, request: Request):
+        body = await request.json()
+        await asyncio.sleep(db_latency)
+        prefix = f"{bucket}/{body['prefix']}".rstrip("/") + "/"
+        entries: Dict[str, dict] = {}
+        for key, blob in blobs.items():
+            if not key.startswith(prefix):
+                continue
+            name, _, rest = key[len(prefix):].partition("/")
+            if rest:
+                entries.setdefault(name, {"name": name, "id": None, "created_at": None, "updated_at": None})
+            else:
+                entries[name] = {"name": name, "id": str(uuid.uuid5(uuid.NAMESPACE_URL, key)),
+                                 "created_at": blob["created_at"] + "Z", "updated_at": blob["updated_at"] + "Z",
+                                 "metadata": {"size": len(blob["data"])}}
+        ordered = [entries[name] for name in sorted(entries)]
+        return ordered[body["offset"]:body["offset"] + body["limit"]]
+
+    @app.post("/storage/v1/object/{bucket}/{path:path}")
+    async def storage_upload(bucket: str, path: str, request: Request):
+        form = await request.form()
+        body = await form["file"].read()
+        await asyncio.sleep(db_latency)
+        key = f"{bucket}/{path}"
+        if key in blobs and request.headers.get("x-upsert") != "true":
+            return JSONResponse(status_code=400, content={
+                "statusCode": "409", "error": "Duplicate", "message": "The resource already exists",
+            })
+        created_at = blobs[key]["created_at"] if key in blobs else now()
+        blobs[key] = {"data": body, "created_at": created_at, "updated_at": now()}
+        return {"Key": key, "Id": str(uuid.uuid4())}
+
+    @app.api_route("/storage/v1/object/{bucket}/{path:path}", methods=["GET", "HEAD"])
+    async def storage_download(bucket: str, path: str):
+        await asyncio.sleep(db_latency)
+        key = f"{bucket}/{path}"
+        if key not in blobs:
+            return JSONResponse(status_code=400, content={
+                "statusCode": "404", "error": "not_found", "message": "Object not found",
+            })
+        return Response(content=blobs[key]["data"], media_type="application/octet-stream")
+
+    @app.delete("/storage/v1/object/{bucket}")
+    async def storage_remove(bucket: str, request: Request):
+        await asyncio.sleep(db_latency)
+        removed = []
+        for path in (await request.json())["prefixes"]:
+            if blobs.pop(f"{bucket}/{path}", None) is not None:
+                removed.append({"name": path, "bucket_id": bucket})
+        return removed
+
+    # -------------------- Groq --------------------
+
+    @app.get("/openai/v1/models")
+    async def groq_models():
+        return {"object": "list", "data": [{"id": "whisper-large-v3", "object": "model"}]}
+
+    @app.post("/openai/v1/audio/transcriptions")
+    async def groq_transcribe(request: Request):
+        await request.body()
+        await asyncio.sleep(stt_latency)
+        return {"text": "Bagaimana cara mengajukan modal usaha di Amartha?"}
+
+    @app.post("/openai/v1/chat/completions")
+    async def groq_chat(request: Request):
+        body = await request.json()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        prompt_tokens = estimate_tokens(message.get("content") or "" for message in body.get("messages", []))
+        max_tokens = body.get("max_tokens")
+        completion_tokens = generation.capped(max_tokens)
+        finish_reason = "length" if completion_tokens < generation.tokens else "stop"
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": await generation.text(max_tokens)},
+                             "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+
+        async def events():
+            async for chunk in generation.chunks(max_tokens):
+                delta = {"id": completion_id, "object": "chat.completion.chunk", "model": body.get("model"),
+                         "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+                yield f"data: {json.dumps(delta)}\n\n"
+            last = {"id": completion_id, "object": "chat.completion.chunk", "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]}
+            yield f"data: {json.dumps(last)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final = {"id": completion_id, "object": "chat.completion.chunk", "model": body.get("model"),
+                         "choices": [], "usage": usage}
+                yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+# -------------------- Gemini --------------------
+
+def gemini_response(
+    text: str,
+    finished: bool,
+    usage: Optional[tuple] = None,
+    truncated: bool = False,
+) -> glm.GenerateContentResponse:
+    FinishReason = glm.Candidate.FinishReason
+    if not finished:
+        finish_reason = FinishReason.FINISH_REASON_UNSPECIFIED
+    else:
+        finish_reason = FinishReason.MAX_TOKENS if truncated else FinishReason.STOP
+    response = glm.GenerateContentResponse(candidates=[glm.Candidate(
+        index=0,
+        content=glm.Content(role="model", parts=[glm.Part(text=text)]),
+        finish_reason=finish_reason,
+    )])
+    if usage:
+        prompt_tokens, output_tokens = usage
+        response.usage_metadata = glm.GenerateContentResponse.UsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+    return response
+
+
+def gemini_prompt_tokens(request: glm.GenerateContentRequest) -> int:
+    texts = [part.text for content in request.contents for part in content.parts]
+    texts += [part.text for part in request.system_instruction.parts]
+    return estimate_tokens(texts)
+
+
+def build_grpc_server(port: int, cert_dir: Path, generation: Generation) -> grpc.aio.Server:
+    async def stream_generate_content(request, context):
+        max_tokens = request.generation_config.max_output_tokens
+        async for chunk in generation.chunks(max_tokens):
+            yield gemini_response(chunk, finished=False)
+        output_tokens = generation.capped(max_tokens)
+        yield gemini_response("", finished=True, usage=(gemini_prompt_tokens(request), output_tokens),
+                              truncated=output_tokens < generation.tokens)
+
+    async def generate_content(request, context):
+        # only used for thread titles: short answer, first-token latency only
+        await asyncio.sleep(generation.latency)
+        return gemini_response("Pengajuan Modal Usaha", finished=True, usage=(gemini_prompt_tokens(request), 4))
+
+    handler = grpc.method_handlers_generic_handler(GEMINI_SERVICE, {
+        "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+            stream_generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize,
+        ),
+        "GenerateContent": grpc.unary_unary_rpc_method_handler(
+            generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize,
+        ),
+    })
+    server = grpc.aio.server()
+    server.add_generic_rpc_handlers((handler,))
+    credentials = grpc.ssl_server_credentials([(
+        (cert_dir / "key.pem").read_bytes(),
+        (cert_dir / "cert.pem").read_bytes(),
+    )])
+    server.add_secure_port(f"127.0.0.1:{port}", credentials)
+    return server
+
+
+async def serve(args: argparse.Namespace) -> None:
+    generation = Generation(args.llm_latency_ms, args.tokens, args.tokens_per_sec, args.chunk_tokens)
+    http_app = build_http_app(args.db_latency_ms / 1000, args.stt_latency_ms / 1000, generation, args.max_rows)
+    http_server = uvicorn.Server(uvicorn.Config(
+        http_app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False,
+    ))
+
+    grpc_server = build_grpc_server(args.grpc_port, args.cert_dir, generation)
+    await grpc_server.start()
+    try:
+        await http_server.serve()
+    finally:
+        await grpc_server.stop(grace=None)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--grpc-port", type=int, default=8901)
+    parser.add_argument("--cert-dir", type=Path, default=Path("/tmp/amartha-fakes"))
+    parser.add_argument("--db-latency-ms", type=float, default=5)
+    parser.add_argument("--stt-latency-ms", type=float, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--tokens-per-sec", type=float, default=100)
+    parser.add_argument("--chunk-tokens", type=int, default=8)
+    parser.add_argument("--max-rows", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    make_cert(args.cert_dir)
+    print(f"fakes: http on :{args.port}, gemini grpc+tls on :{args.grpc_port}, "
+          f"cert {args.cert_dir / 'cert.pem'}", flush=True)
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Measure how long `import main` takes and enforce a startup budget.
+
+Usage:
+    python bench/import_time.py [--budget-ms 1000] [--runs 5] [--top 10]
+
+Each run imports the app in a fresh interpreter; the fastest run is compared
+against the budget (exit code 1 when over). With --top, the slowest modules
+from `python -X importtime` are listed to show what to make lazy next.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MEASURE = "import time; t = time.perf_counter(); import main; print((time.perf_counter() - t) * 1000)"
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONWARNINGS": "ignore"}
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def slowest_modules(top: int) -> list:
+    stderr = run_python("-X", "importtime", "-c", "import main").stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1000")))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0)
+    args = parser.parse_args()
+
+    timings = sorted(float(run_python("-c", MEASURE).stdout.strip()) for _ in range(args.runs))
+    best, median = timings[0], timings[len(timings) // 2]
+    print(f"import main: best {best:.0f} ms, median {median:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+
+    if args.top:
+        print(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+        for cumulative_us, self_us, name in slowest_modules(args.top):
+            print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+    if best > args.budget_ms:
+        print("FAIL: import time over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Check knowledge-base retrieval (app/services/knowledge.py) on labelled questions.
+
+Usage:
+    python bench/kb_quality.py [--cases bench/kb_cases.json] [--verbose]
+    python bench/kb_quality.py --answers groq|gemini [--limit 10]
+
+Offline (default): per question, the sections retrieved against the
+expected ones, and the system prompt size with retrieval against the full
+document every prompt used to carry. Questions the core rules answer
+(no expected sections) only count towards prompt size. Exits non-zero when
+an expected section is missed.
+
+--answers also asks the model every question twice, with the full document
+and with the retrieved prompt (needs GROQ_API_KEY or GEMINI_API_KEY), and
+checks the answers for the expected facts. Reports the pass rate, prompt
+tokens and time to first token of both variants.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.knowledge import get_knowledge_base  # noqa: E402
+
+CASES = Path(__file__).resolve().parent / "kb_cases.json"
+
+
+def as_history(case: dict) -> List[dict]:
+    history = []
+    for message in case.get("history", []):
+        history.append({"role": "user", "content": message})
+        history.append({"role": "assistant", "content": "Baik, ada yang ingin Anda ketahui?"})
+    return history
+
+
+def check_retrieval(cases: List[dict], verbose: bool) -> int:
+    kb = get_knowledge_base()
+    full_chars = len(kb.full_text)
+    missed = extra = 0
+    prompt_chars = []
+
+    print(f"{'question':<60}{'retrieved':<28}{'chars':>7}  result")
+    for case in cases:
+        sections = kb.retrieve(case["question"], as_history(case))
+        names = [section.name for section in sections]
+        prompt = kb.compose(sections)
+        prompt_chars.append(len(prompt))
+
+        expected = set(case["sections"])
+        lost = expected - set(names)
+        result = "ok"
+        if lost:
+            missed += 1
+            result = f"MISSED {', '.join(sorted(lost))}"
+        elif expected and len(names) > len(expected):
+            extra += 1
+            result = "extra"
+        if verbose or result != "ok":
+            print(f"{case['question'][:58]:<60}{','.join(names)[:26]:<28}{len(prompt):>7}  {result}")
+
+    mean_chars = statistics.mean(prompt_chars)
+    print()
+    print(f"cases: {len(cases)}, missed: {missed}, with extra sections: {extra}")
+    print(f"system prompt: full {full_chars} chars (~{full_chars // 4} tokens), "
+          f"retrieved mean {mean_chars:.0f} chars (~{mean_chars / 4:.0f} tokens), "
+          f"{100 * (1 - mean_chars / full_chars):.0f}% smaller")
+    return missed
+
+
+async def ask(provider: str, system: str, question: str, history: List[dict]) -> dict:
+    usage = {}
+
+    def on_usage(token_usage) -> None:
+        usage["prompt_tokens"] = token_usage.prompt_tokens
+
+    if provider == "groq":
+        from app.services.stt import stream_llm_completion
+        messages = [{"role": "system", "content": system}, *history, {"role": "user", "content": question}]
+        stream = stream_llm_completion(messages, on_usage=on_usage)
+    else:
+        from app.services.gemini import get_gemini_service
+        stream = get_gemini_service().chat_stream(question, history, system, on_usage=on_usage)
+
+    start = time.perf_counter()
+    first: Optional[float] = None
+    parts = []
+    async for chunk in stream:
+        if first is None:
+            first = time.perf_counter() - start
+        parts.append(chunk)
+    return {"text": "".join(parts), "ttft_ms": (first or 0) * 1000, "prompt_tokens": usage.get("prompt_tokens", 0)}
+
+
+async def check_answers(cases: List[dict], provider: str, verbose: bool) -> None:
+    kb = get_knowledge_base()
+    results = {"full": [], "retrieved": []}
+    for case in cases:
+        history = as_history(case)
+        prompts = {
+            "full": kb.full_text,
+            "retrieved": kb.system_instruction(None, case["question"], history),
+        }
+        for variant, system in prompts.items():
+            answer = await ask(provider, system, case["question"], history)
+            text = answer["text"].lower()
+            answer["passed"] = all(fact.lower() in text for fact in case["facts"])
+            results[variant].append(answer)
+            if verbose or not answer["passed"]:
+                status = "pass" if answer["passed"] else f"FAIL (wanted {case['facts']})"
+                print(f"[{variant}] {case['question']}\n    {answer['text'].strip()[:200]}\n    {status}")
+
+    print()
+    print(f"{'variant':<12}{'passed':>8}{'prompt tok':>12}{'ttft p50':>10}{'ttft p95':>10}")
+    for variant, answers in results.items():
+        ttft = sorted(answer["ttft_ms"] for answer in answers)
+        passed = sum(answer["passed"] for answer in answers)
+        print(f"{variant:<12}{passed:>5}/{len(answers):<2}"
+              f"{statistics.mean(answer['prompt_tokens'] for answer in answers):>12.0f}"
+              f"{ttft[len(ttft) // 2]:>10.0f}{ttft[min(len(ttft) - 1, int(len(ttft) * 0.95))]:>10.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=Path, default=CASES)
+    parser.add_argument("--answers", choices=["groq", "gemini"], help="also check model answers")
+    parser.add_argument("--limit", type=int, help="only the first N cases")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    cases = json.loads(args.cases.read_text(encoding="utf-8"))[:args.limit]
+    missed = check_retrieval(cases, args.verbose)
+    if args.answers:
+        print()
+        asyncio.run(check_answers(cases, args.answers, args.verbose))
+    sys.exit(1 if missed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Load-test the API against local stand-ins for Supabase, Gemini and Groq.
+
+Usage:
+    python bench/load.py [--scenario chat_send threads groq_stream] [--concurrency 1 8 32]
+                         [--requests 200] [--workers 1] [--json results.json]
+                         [--llm-latency-ms 300] [--tokens-per-sec 100] [--db-latency-ms 5] ...
+
+Starts bench/fakes.py and the app (gunicorn, WEB_CONCURRENCY=--workers) wired
+to it, then for every scenario and concurrency level sends --requests
+requests with that many in flight. Reports:
+  - ttfc: time to first chunk (first `chunk` SSE event; whole response for
+    plain JSON endpoints)
+  - total: time to the end of the response
+  - req/s: completed requests per second of wall time
+  - rss: peak resident memory of the server process tree
+
+Scenarios:
+  chat_send    POST /api/v1/chat/send, new thread per request
+  threads      GET /api/v1/chat/threads, user seeded with --seed-threads threads
+  groq_stream  POST /api/v1/stt/groq_stream with --audio (default test_1.wav)
+
+The transcript cache makes repeated uploads of the same file skip STT; pass
+--no-stt-cache to measure STT on every request. Fakes, app and load generator
+share this machine, so compare runs on the same host only.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = ("chat_send", "threads", "groq_stream")
+
+# Fake service-role key: supabase-py only checks that it looks like a JWT
+FAKE_SERVICE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.bench"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on port {port}")
+
+
+def wait_until_warm(base_url: str, timeout: float = 60) -> dict:
+    """Wait until the app finished building its clients (/ready is no longer 'starting')"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            body = httpx.get(f"{base_url}/ready", timeout=2).json()
+            if body.get("status") not in (None, "starting"):
+                return body
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"app at {base_url} did not warm up")
+
+
+def tree_rss_bytes(pid: int) -> int:
+    """Resident memory of a process and all its descendants (Linux /proc)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+class RssSampler:
+    """Track peak RSS of the server tree in a background thread"""
+
+    def __init__(self, pid: int, interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, tree_rss_bytes(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = tree_rss_bytes(self.pid)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+# -------------------- Requests --------------------
+
+async def read_sse(resp: httpx.Response, started: float) -> Optional[float]:
+    """Consume an SSE response; return time to the first chunk, or raise on an error event"""
+    first_chunk = None
+    async for line in resp.aiter_lines():
+        if not line.startswith("data: "):
+            continue
+        event = json.loads(line[6:])
+        if event["type"] == "chunk" and first_chunk is None:
+            first_chunk = time.perf_counter() - started
+        elif event["type"] == "error":
+            raise RuntimeError(event.get("content"))
+    return first_chunk
+
+
+async def chat_send(client: httpx.AsyncClient, args: argparse.Namespace) -> Optional[float]:
+    started = time.perf_counter()
+    async with client.stream("POST", "/api/v1/chat/send", json={
+        "message": "Bagaimana cara mengajukan modal usaha?",
+        "include_full_response": False,
+    }) as resp:
+        resp.raise_for_status()
+        return await read_sse(resp, started)
+
+
+async def threads(client: httpx.AsyncClient, args: argparse.Namespace) -> Optional[float]:
+    started = time.perf_counter()
+    resp = await client.get("/api/v1/chat/threads")
+    resp.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def groq_stream(client: httpx.AsyncClient, args: argparse.Namespace) -> Optional[float]:
+    started = time.perf_counter()
+    files = {"audio": (args.audio.name, args.audio_bytes, "audio/wav")}
+    async with client.stream("POST", "/api/v1/stt/groq_stream", files=files,
+                             data={"include_full_response": "false"}) as resp:
+        resp.raise_for_status()
+        return await read_sse(resp, started)
+
+
+REQUESTS = {"chat_send": chat_send, "threads": threads, "groq_stream": groq_stream}
+
+
+async def run_level(base_url: str, scenario: str, concurrency: int, args: argparse.Namespace) -> dict:
+    request = REQUESTS[scenario]
+    ttfc: List[float] = []
+    totals: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = args.requests
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Authorization": f"Bearer {args.token}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=120) as client:
+        async def user() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    first = await request(client, args)
+                except Exception as e:
+                    key = type(e).__name__
+                    errors[key] = errors.get(key, 0) + 1
+                    continue
+                totals.append(time.perf_counter() - started)
+                if first is not None:
+                    ttfc.append(first)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "ok": len(totals),
+        "errors": errors,
+        "rps": len(totals) / wall if wall else 0.0,
+        "ttfc_ms": summarize(ttfc),
+        "total_ms": summarize(totals),
+    }
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    if len(values) == 1:
+        value = values[0] * 1000
+        return {"p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49] * 1000, "p95": cuts[94] * 1000, "p99": cuts[98] * 1000}
+
+
+async def seed_threads(base_url: str, args: argparse.Namespace) -> None:
+    headers = {"Authorization": f"Bearer {args.token}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=30) as client:
+        for n in range(args.seed_threads):
+            resp = await client.post("/api/v1/chat/threads", json={
+                "title": f"Bench thread {n}",
+                "system_instruction": "Anda adalah asisten Amartha.",
+            })
+            resp.raise_for_status()
+
+
+# -------------------- Processes --------------------
+
+def start_fakes(args: argparse.Namespace, http_port: int, grpc_port: int, cert_dir: Path) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, str(ROOT / "bench" / "fakes.py"),
+         "--port", str(http_port), "--grpc-port", str(grpc_port), "--cert-dir", str(cert_dir),
+         "--db-latency-ms", str(args.db_latency_ms), "--stt-latency-ms", str(args.stt_latency_ms),
+         "--llm-latency-ms", str(args.llm_latency_ms), "--tokens", str(args.tokens),
+         "--tokens-per-sec", str(args.tokens_per_sec), "--chunk-tokens", str(args.chunk_tokens)],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+
+
+def start_app(args: argparse.Namespace, port: int, http_port: int, grpc_port: int, workdir: Path) -> subprocess.Popen:
+    fakes = f"http://127.0.0.1:{http_port}"
+    env = {
+        **os.environ,
+        "SUPABASE_URL": fakes,
+        "SUPABASE_SERVICE_ROLE_KEY": FAKE_SERVICE_KEY,
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_API_ENDPOINT": f"localhost:{grpc_port}",
+        "GRPC_DEFAULT_SSL_ROOTS_FILE_PATH": str(workdir / "certs" / "cert.pem"),
+        "GROQ_API_KEY": "bench",
+        "GROQ_API_BASE": f"{fakes}/openai/v1",
+        "GROQ_STT_URL": f"{fakes}/openai/v1/audio/transcriptions",
+        "BATCH_JOBS_DIR": str(workdir / "jobs"),
+        "PROMETHEUS_MULTIPROC_DIR": str(workdir / "prometheus"),
+        "WEB_CONCURRENCY": str(args.workers),
+        "PYTHONWARNINGS": "ignore",
+    }
+    if args.no_stt_cache:
+        env["STT_CACHE_SIZE"] = "0"
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py",
+         "--bind", f"127.0.0.1:{port}", "--access-logfile", "/dev/null", "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def add_stack_args(parser: argparse.ArgumentParser) -> None:
+    """Options for the app + stand-ins started by `running_stack()`"""
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--no-stt-cache", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="show server logs")
+    fakes = parser.add_argument_group("stand-in timing")
+    fakes.add_argument("--db-latency-ms", type=float, default=5)
+    fakes.add_argument("--stt-latency-ms", type=float, default=200)
+    fakes.add_argument("--llm-latency-ms", type=float, default=300)
+    fakes.add_argument("--tokens", type=int, default=60)
+    fakes.add_argument("--tokens-per-sec", type=float, default=100)
+    fakes.add_argument("--chunk-tokens", type=int, default=8)
+
+
+@contextmanager
+def running_stack(args: argparse.Namespace) -> Iterator[subprocess.Popen]:
+    """Start the stand-ins and the app wired to them; yields the app process (`.base_url` set)"""
+    workdir = Path(tempfile.mkdtemp(prefix="amartha-bench-"))
+    http_port, grpc_port, app_port = free_port(), free_port(), free_port()
+
+    fakes_process = start_fakes(args, http_port, grpc_port, workdir / "certs")
+    app_process = None
+    try:
+        wait_for_port(http_port)
+        app_process = start_app(args, app_port, http_port, grpc_port, workdir)
+        app_process.base_url = f"http://127.0.0.1:{app_port}"
+        wait_for_port(app_port)
+        wait_until_warm(app_process.base_url)
+        yield app_process
+    finally:
+        if app_process:
+            stop(app_process)
+        stop(fakes_process)
+
+
+def print_row(result: dict) -> None:
+    ttfc, total = result["ttfc_ms"], result["total_ms"]
+    errors = sum(result["errors"].values())
+    print(f"{result['scenario']:<12}{result['concurrency']:>5}{result['ok']:>6}{errors:>6}{result['rps']:>9.1f}"
+          f"{ttfc['p50']:>9.0f}{ttfc['p95']:>9.0f}{ttfc['p99']:>9.0f}"
+          f"{total['p50']:>9.0f}{total['p99']:>9.0f}{result['peak_rss_mb']:>9.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--audio", type=Path, default=ROOT / "test_1.wav")
+    parser.add_argument("--seed-threads", type=int, default=20)
+    parser.add_argument("--token", default="bench-user", help="bearer token; the fake auth accepts anything")
+    parser.add_argument("--json", type=Path, help="also write results to this file")
+    add_stack_args(parser)
+    args = parser.parse_args()
+    args.audio_bytes = args.audio.read_bytes() if "groq_stream" in args.scenario else b""
+
+    results = []
+    with running_stack(args) as app_process:
+        base_url = app_process.base_url
+        if "threads" in args.scenario:
+            asyncio.run(seed_threads(base_url, args))
+
+        print(f"workers: {args.workers}, requests/level: {args.requests}, llm: {args.llm_latency_ms:.0f} ms "
+              f"+ {args.tokens} tokens @ {args.tokens_per_sec:.0f}/s, db: {args.db_latency_ms:.0f} ms, "
+              f"stt: {args.stt_latency_ms:.0f} ms, idle rss: {tree_rss_bytes(app_process.pid) / 2**20:.0f} MB")
+        print(f"{'scenario':<12}{'conc':>5}{'ok':>6}{'err':>6}{'req/s':>9}"
+              f"{'ttfc50':>9}{'ttfc95':>9}{'ttfc99':>9}{'tot50':>9}{'tot99':>9}{'rss MB':>9}")
+        for scenario in args.scenario:
+            for concurrency in args.concurrency:
+                with RssSampler(app_process.pid) as rss:
+                    result = asyncio.run(run_level(base_url, scenario, concurrency, args))
+                result["peak_rss_mb"] = rss.peak / 2**20
+                results.append(result)
+                print_row(result)
+                if result["errors"]:
+                    print(f"{'':<12}errors: {result['errors']}")
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in vars(args).items() if key != "audio_bytes"
+        }, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+Replay captured production traffic against the app and local stand-ins.
+
+Usage:
+    python bench/replay.py data/capture.jsonl [--speed 1] [--limit 1000] [--max-in-flight 256]
+                           [--url http://host:8000 --token <jwt>] [--json results.json]
+                           [--workers 1] [--llm-latency-ms 300] ...
+
+Input is a capture written by the app with CAPTURE_REQUESTS=true (see
+app/middleware/capture.py). Requests are re-issued at their original
+inter-arrival times divided by --speed (0 = as fast as --max-in-flight
+allows), with synthesized bodies of the recorded shape: message length,
+history depth, audio duration. By default the app and bench/fakes.py are
+started locally like bench/load.py; --url targets a running build instead.
+
+Threads are matched by pseudonym: a thread created during the capture is
+created again during the replay and later requests reuse it; threads that
+existed before the capture are primed with enough turns to reach the
+recorded history depth before the clock starts.
+
+Reports per route: count, errors, p50/p95/p99 latency and time to first
+chunk, and how late requests were issued (replay lag).
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import sys
+import time
+import wave
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from load import ROOT, add_stack_args, read_sse, running_stack, summarize
+
+sys.path.insert(0, str(ROOT))
+
+from app.services.knowledge import DEFAULT_INSTRUCTION  # noqa: E402
+
+SEND = ("POST", "/api/v1/chat/send")
+GROQ_STREAM = ("POST", "/api/v1/stt/groq_stream")
+GROQ_SIMPLE = ("POST", "/api/v1/stt/groq_simple")
+CREATE_THREAD = ("POST", "/api/v1/chat/threads")
+THREAD_ROUTES = {
+    ("GET", "/api/v1/chat/threads"),
+    ("GET", "/api/v1/chat/threads/{thread_id}"),
+    ("GET", "/api/v1/chat/threads/{thread_id}/messages"),
+    ("PATCH", "/api/v1/chat/threads/{thread_id}"),
+    ("DELETE", "/api/v1/chat/threads/{thread_id}"),
+}
+SUPPORTED = {SEND, GROQ_STREAM, GROQ_SIMPLE, CREATE_THREAD} | THREAD_ROUTES
+
+FILLER = "Bagaimana cara mengajukan modal usaha dan berapa angsuran mingguannya? "
+# the built-in instruction, so replayed threads get the app's per-turn knowledge retrieval
+SYSTEM_INSTRUCTION = DEFAULT_INSTRUCTION
+
+
+def load_records(path: Path, limit: Optional[int]) -> List[dict]:
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    records.sort(key=lambda record: record["ts"])
+    return records[:limit] if limit else records
+
+
+def filler_text(chars: int) -> str:
+    chars = max(1, chars)
+    return (FILLER * (chars // len(FILLER) + 1))[:chars]
+
+
+class AudioFactory:
+    """WAV bodies of a given duration, identical for the same audio pseudonym"""
+
+    def __init__(self, sample_path: Path):
+        with wave.open(str(sample_path), "rb") as wav:
+            self.params = wav.getparams()
+            self.frames = wav.readframes(wav.getnframes())
+        self.frame_size = self.params.sampwidth * self.params.nchannels
+        self._cache: Dict[str, bytes] = {}
+
+    def make(self, key: str, seconds: Optional[float]) -> bytes:
+        if key in self._cache:
+            return self._cache[key]
+        seconds = seconds or self.params.nframes / self.params.framerate
+        length = int(seconds * self.params.framerate) * self.frame_size
+        pcm = bytearray((self.frames * (length // len(self.frames) + 1))[:length])
+        # make every distinct recording hash differently, like real uploads
+        stamp = key.encode()[:len(pcm)]
+        pcm[:len(stamp)] = stamp
+
+        out = io.BytesIO()
+        with wave.open(out, "wb") as wav:
+            wav.setparams(self.params)
+            wav.writeframes(bytes(pcm))
+        self._cache[key] = out.getvalue()
+        return self._cache[key]
+
+
+class ThreadMap:
+    """Pseudonym -> thread id of this replay; waits for threads still being created"""
+
+    def __init__(self):
+        self._ids: Dict[str, asyncio.Future] = {}
+
+    def _future(self, pseudonym: str) -> asyncio.Future:
+        if pseudonym not in self._ids:
+            self._ids[pseudonym] = asyncio.get_running_loop().create_future()
+        return self._ids[pseudonym]
+
+    def set(self, pseudonym: str, thread_id: str) -> None:
+        future = self._future(pseudonym)
+        if not future.done():
+            future.set_result(thread_id)
+
+    def fail(self, pseudonym: str) -> None:
+        future = self._future(pseudonym)
+        if not future.done():
+            future.set_result(None)
+
+    async def get(self, pseudonym: str, timeout: float = 120) -> Optional[str]:
+        return await asyncio.wait_for(asyncio.shield(self._future(pseudonym)), timeout)
+
+
+def record_key(record: dict) -> tuple:
+    return record["method"], record["route"]
+
+
+def thread_of(record: dict) -> Optional[str]:
+    return record.get("params", {}).get("thread_id") or record.get("thread")
+
+
+def threads_to_prime(records: List[dict]) -> Dict[str, int]:
+    """Threads used before (or without) being created in the capture, with the depth to reach"""
+    created = set()
+    prime: Dict[str, Optional[int]] = {}
+    for record in records:
+        thread = thread_of(record)
+        if not thread:
+            continue
+        if record_key(record) == CREATE_THREAD or record.get("new_thread"):
+            created.add(thread)
+        elif thread not in created and thread not in prime:
+            prime[thread] = record.get("history_depth")
+        elif prime.get(thread, 0) is None:
+            # first reference was e.g. a GET; the first turn tells the depth
+            prime[thread] = record.get("history_depth")
+    return {thread: depth or 0 for thread, depth in prime.items()}
+
+
+class Replayer:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.threads = ThreadMap()
+        self.audio = AudioFactory(args.audio)
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.ttfc: Dict[str, List[float]] = defaultdict(list)
+        self.lag: List[float] = []
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.skipped: Dict[str, int] = defaultdict(int)
+
+    async def prime(self, thread: str, depth: int) -> None:
+        resp = await self.client.post("/api/v1/chat/threads", json={
+            "title": "Replay thread", "system_instruction": SYSTEM_INSTRUCTION,
+        })
+        resp.raise_for_status()
+        thread_id = resp.json()["id"]
+        # every /send adds a user and an assistant message
+        for _ in range((depth + 1) // 2):
+            async with self.client.stream("POST", "/api/v1/chat/send", json={
+                "message": filler_text(80), "thread_id": thread_id, "include_full_response": False,
+            }) as stream:
+                stream.raise_for_status()
+                await read_sse(stream, time.perf_counter())
+        self.threads.set(thread, thread_id)
+
+    async def thread_id(self, record: dict) -> Optional[str]:
+        thread = thread_of(record)
+        return await self.threads.get(thread) if thread else None
+
+    def audio_file(self, record: dict) -> tuple:
+        body = self.audio.make(record.get("audio") or str(record["ts"]), record.get("audio_seconds"))
+        return "audio.wav", body, "audio/wav"
+
+    async def issue(self, record: dict) -> Optional[float]:
+        """Send one synthesized request; returns time to first chunk for streams"""
+        key = record_key(record)
+        started = time.perf_counter()
+        creates = record.get("new_thread") or key == CREATE_THREAD
+
+        if key == SEND:
+            body = {
+                "message": filler_text(record.get("message_chars", 40)),
+                "include_full_response": record.get("include_full_response", True),
+            }
+            if not creates:
+                body["thread_id"] = await self.thread_id(record)
+            if record.get("audio_bytes"):
+                body["audio_base64"] = base64.b64encode(self.audio_file(record)[1]).decode()
+            async with self.client.stream("POST", key[1], json=body) as resp:
+                resp.raise_for_status()
+                return await self.read_stream(resp, started, record if creates else None)
+
+        if key in (GROQ_STREAM, GROQ_SIMPLE):
+            data = {}
+            if key == GROQ_STREAM:
+                data["include_full_response"] = str(record.get("include_full_response", True)).lower()
+                if not creates:
+                    data["thread_id"] = await self.thread_id(record)
+            files = {"audio": self.audio_file(record)}
+            if key == GROQ_SIMPLE:
+                resp = await self.client.post(key[1], files=files)
+                resp.raise_for_status()
+                return None
+            async with self.client.stream("POST", key[1], files=files, data=data) as resp:
+                resp.raise_for_status()
+                return await self.read_stream(resp, started, record if creates else None)
+
+        if key == CREATE_THREAD:
+            resp = await self.client.post(key[1], json={
+                "title": "Replay thread", "system_instruction": SYSTEM_INSTRUCTION,
+            })
+            resp.raise_for_status()
+            if record.get("thread"):
+                self.threads.set(record["thread"], resp.json()["id"])
+            return None
+
+        path = key[1]
+        if "{thread_id}" in path:
+            path = path.replace("{thread_id}", str(await self.thread_id(record)))
+        resp = await self.client.request(key[0], path, json={"title": "Replay"} if key[0] == "PATCH" else None)
+        if resp.status_code >= 500 or (resp.status_code >= 400 and record["status"] < 400):
+            resp.raise_for_status()
+        return None
+
+    async def read_stream(self, resp: httpx.Response, started: float, creator: Optional[dict]) -> Optional[float]:
+        """Like load.read_sse, but registers the thread a creating request made"""
+        first_chunk = None
+        async for line in resp.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if event["type"] == "thread_created" and creator and creator.get("thread"):
+                self.threads.set(creator["thread"], event["thread_id"])
+            elif event["type"] == "chunk" and first_chunk is None:
+                first_chunk = time.perf_counter() - started
+            elif event["type"] == "error":
+                raise RuntimeError(event.get("content"))
+        return first_chunk
+
+    async def run(self, record: dict, due: float, limiter: asyncio.Semaphore) -> None:
+        label = f"{record['method']} {record['route']}"
+        async with limiter:
+            self.lag.append(max(0.0, time.perf_counter() - due))
+            started = time.perf_counter()
+            try:
+                first = await self.issue(record)
+            except Exception as e:
+                name = type(e).__name__
+                self.errors[label][name] = self.errors[label].get(name, 0) + 1
+                if record.get("new_thread") or record_key(record) == CREATE_THREAD:
+                    self.threads.fail(record.get("thread"))
+                return
+            self.latency[label].append(time.perf_counter() - started)
+            if first is not None:
+                self.ttfc[label].append(first)
+
+    async def replay(self, records: List[dict]) -> float:
+        limiter = asyncio.Semaphore(self.args.max_in_flight)
+        speed = self.args.speed
+        origin = records[0]["ts"]
+        start = time.perf_counter()
+        tasks = []
+        for record in records:
+            if record_key(record) not in SUPPORTED:
+                self.skipped[f"{record['method']} {record['route']}"] += 1
+                continue
+            due = start + ((record["ts"] - origin) / speed if speed > 0 else 0)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.run(record, due, limiter)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+
+async def replay(base_url: str, records: List[dict], args: argparse.Namespace) -> dict:
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    headers = {"Authorization": f"Bearer {args.token}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=300) as client:
+        replayer = Replayer(client, args)
+
+        prime = threads_to_prime(records)
+        if prime:
+            print(f"priming {len(prime)} threads (max depth {max(prime.values())})")
+            limiter = asyncio.Semaphore(16)
+
+            async def primed(thread: str, depth: int) -> None:
+                async with limiter:
+                    await replayer.prime(thread, depth)
+
+            await asyncio.gather(*(primed(thread, depth) for thread, depth in prime.items()))
+
+        wall = await replayer.replay(records)
+
+    routes = {}
+    for label in sorted(set(replayer.latency) | set(replayer.errors)):
+        routes[label] = {
+            "ok": len(replayer.latency[label]),
+            "errors": replayer.errors.get(label, {}),
+            "latency_ms": summarize(replayer.latency[label]),
+            "ttfc_ms": summarize(replayer.ttfc[label]) if replayer.ttfc[label] else None,
+        }
+    return {
+        "wall_s": wall,
+        "captured_s": records[-1]["ts"] - records[0]["ts"],
+        "requests": sum(route["ok"] + sum(route["errors"].values()) for route in routes.values()),
+        "lag_ms": summarize(replayer.lag),
+        "skipped": dict(replayer.skipped),
+        "routes": routes,
+    }
+
+
+def print_report(result: dict) -> None:
+    lag = result["lag_ms"]
+    print(f"replayed {result['requests']} requests in {result['wall_s']:.1f}s "
+          f"(captured span {result['captured_s']:.1f}s), replay lag p50/p99 {lag['p50']:.0f}/{lag['p99']:.0f} ms")
+    print(f"{'route':<48}{'ok':>6}{'err':>6}{'p50':>8}{'p95':>8}{'p99':>8}{'ttfc50':>8}{'ttfc99':>8}")
+    for label, route in result["routes"].items():
+        latency, ttfc = route["latency_ms"], route["ttfc_ms"] or {}
+        print(f"{label:<48}{route['ok']:>6}{sum(route['errors'].values()):>6}"
+              f"{latency['p50']:>8.0f}{latency['p95']:>8.0f}{latency['p99']:>8.0f}"
+              f"{ttfc.get('p50', 0):>8.0f}{ttfc.get('p99', 0):>8.0f}")
+        if route["errors"]:
+            print(f"{'':<48}errors: {route['errors']}")
+    if result["skipped"]:
+        print(f"skipped (not replayable): {result['skipped']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", type=Path)
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression; 0 = no waiting")
+    parser.add_argument("--limit", type=int, help="replay only the first N records")
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    parser.add_argument("--url", help="replay against a running server instead of local stand-ins")
+    parser.add_argument("--token", default="bench-user", help="bearer token; the fake auth accepts anything")
+    parser.add_argument("--audio", type=Path, default=ROOT / "test_1.wav", help="source for synthesized audio")
+    parser.add_argument("--json", type=Path, help="also write results to this file")
+    add_stack_args(parser)
+    args = parser.parse_args()
+
+    records = load_records(args.capture, args.limit)
+    if not records:
+        parser.error(f"{args.capture} has no records")
+
+    if args.url:
+        result = asyncio.run(replay(args.url.rstrip("/"), records, args))
+    else:
+        with running_stack(args) as app_process:
+            result = asyncio.run(replay(app_process.base_url, records, args))
+
+    print_report(result)
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
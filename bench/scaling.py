@@ -0,0 +1,155 @@
+"""
+Measure how throughput scales with the number of server workers.
+
+Usage:
+    python bench/scaling.py [--workers 1 2 4] [--path /health] [--concurrency 64]
+                            [--duration 10] [--clients 2] [--header "Authorization: Bearer ..."]
+
+For each worker count the production server is started with gunicorn
+(`gunicorn.conf.py`, WEB_CONCURRENCY=N) on a free local port, loaded by
+`--clients` client processes holding `--concurrency` open requests in total
+for `--duration` seconds, then stopped with SIGTERM. Reports requests/s,
+p50/p99 latency and the speedup over the first worker count.
+
+Run the load generator on other cores than the server (or another machine
+with --url) when measuring, otherwise the clients compete for the same CPUs.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_headers(values: List[str]) -> Dict[str, str]:
+    headers = {}
+    for value in values:
+        name, _, content = value.partition(":")
+        headers[name.strip()] = content.strip()
+    return headers
+
+
+async def load(url: str, headers: Dict[str, str], concurrency: int, duration: float) -> Tuple[List[float], int]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(headers=headers, limits=limits, timeout=30) as client:
+        async def user() -> None:
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    resp = await client.get(url)
+                    await resp.aread()
+                    if resp.status_code >= 500:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args: Tuple[str, Dict[str, str], int, float]) -> Tuple[List[float], int]:
+    return asyncio.run(load(*args))
+
+
+def wait_until_up(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not come up")
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "PYTHONWARNINGS": "ignore"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py",
+         "--bind", f"127.0.0.1:{port}", "--access-logfile", "/dev/null"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[int(pct) - 1]
+
+
+def run(url: str, headers: Dict[str, str], concurrency: int, duration: float, clients: int) -> dict:
+    per_client = max(1, concurrency // clients)
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(client_process, [(url, headers, per_client, duration)] * clients)
+    latencies = [latency for result, _ in results for latency in result]
+    return {
+        "rps": len(latencies) / duration,
+        "p50": percentile(latencies, 50) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "errors": sum(errors for _, errors in results),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--url", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=2, help="load generator processes")
+    parser.add_argument("--header", action="append", default=[], help='extra header, e.g. "Authorization: Bearer <jwt>"')
+    args = parser.parse_args()
+    headers = parse_headers(args.header)
+
+    print(f"cpus: {os.cpu_count()}, path: {args.path}, concurrency: {args.concurrency}, duration: {args.duration}s")
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'speedup':>9}")
+
+    if args.url:
+        stats = run(args.url.rstrip("/") + args.path, headers, args.concurrency, args.duration, args.clients)
+        print(f"{'-':>8}{stats['rps']:>10.0f}{stats['p50']:>9.1f}{stats['p99']:>9.1f}{stats['errors']:>8}{'':>9}")
+        return
+
+    baseline = None
+    for workers in args.workers:
+        port = free_port()
+        server = start_server(workers, port)
+        try:
+            wait_until_up(f"http://127.0.0.1:{port}")
+            stats = run(f"http://127.0.0.1:{port}{args.path}", headers, args.concurrency, args.duration, args.clients)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+        baseline = baseline or stats["rps"]
+        print(f"{workers:>8}{stats['rps']:>10.0f}{stats['p50']:>9.1f}{stats['p99']:>9.1f}"
+              f"{stats['errors']:>8}{stats['rps'] / baseline:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Compare local thread titles (app/services/titles.py) with LLM titles.
+
+Usage:
+    python bench/titles.py [--cases bench/kb_cases.json] [--show-titles]
+    python bench/titles.py --stack [--threads 20] [--modes llm local refine] [--llm-latency-ms 300] ...
+
+Offline (default): the local title of every case question and the time to
+extract it (p50/p95 in microseconds).
+
+--stack starts the stand-ins and the app once per TITLE_MODE (see
+bench/load.py) and creates --threads new threads through POST /chat/send.
+Per mode it reports the time from the request to the `title_generated`
+event and to `done`, and the title model calls per new thread, counted
+from llm_requests_total{kind="title"} on /admin/metrics. In refine mode the
+model call still happens, but after `done`.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.titles import extract_title  # noqa: E402
+from load import add_stack_args, running_stack  # noqa: E402
+
+CASES = Path(__file__).resolve().parent / "kb_cases.json"
+ADMIN_TOKEN = "bench-admin"
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def check_local(cases: List[dict], show_titles: bool, repeat: int = 2000) -> None:
+    timings = []
+    for case in cases:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            title = extract_title(case["question"])
+        timings.append((time.perf_counter() - started) / repeat * 1_000_000)
+        if show_titles:
+            print(f"{case['question'][:58]:<60}{title}")
+    print(f"local title: p50 {percentile(timings, 0.5):.1f} us, p95 {percentile(timings, 0.95):.1f} us "
+          f"over {len(cases)} questions, 0 model calls")
+
+
+def title_calls(client: httpx.Client) -> float:
+    metrics = client.get("/api/v1/admin/metrics", headers={"X-Admin-Token": ADMIN_TOKEN}).text
+    return sum(
+        float(line.rsplit(" ", 1)[1])
+        for line in metrics.splitlines()
+        if line.startswith("llm_requests_total{") and 'kind="title"' in line
+    )
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, float]:
+    os.environ.update(TITLE_MODE=mode, ADMIN_TOKEN=ADMIN_TOKEN)
+    to_title, to_done = [], []
+    with running_stack(args) as app:
+        client = httpx.Client(base_url=app.base_url, headers={"Authorization": "Bearer bench"}, timeout=60)
+        for _ in range(args.threads):
+            started = time.perf_counter()
+            with client.stream("POST", "/api/v1/chat/send", json={
+                "message": "Bagaimana cara mengajukan modal usaha?",
+                "include_full_response": False,
+            }) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[6:])
+                    if event["type"] == "title_generated":
+                        to_title.append((time.perf_counter() - started) * 1000)
+                    elif event["type"] == "done":
+                        to_done.append((time.perf_counter() - started) * 1000)
+        # background refinements finish within one model call
+        time.sleep(args.llm_latency_ms / 1000 + 0.5)
+        calls = title_calls(client)
+    return {
+        "title_p50": statistics.median(to_title),
+        "done_p50": statistics.median(to_done),
+        "done_p95": percentile(to_done, 0.95),
+        "calls_per_thread": calls / args.threads,
+    }
+
+
+def check_stack(args: argparse.Namespace) -> None:
+    results = {mode: run_mode(mode, args) for mode in args.modes}
+
+    print(f"{'mode':<8}{'title p50':>11}{'done p50':>10}{'done p95':>10}{'title calls':>13}")
+    for mode, result in results.items():
+        print(f"{mode:<8}{result['title_p50']:>9.0f}ms{result['done_p50']:>8.0f}ms{result['done_p95']:>8.0f}ms"
+              f"{result['calls_per_thread']:>13.2f}")
+    if "llm" in results:
+        baseline = results["llm"]
+        for mode, result in results.items():
+            if mode != "llm":
+                print(f"{mode}: done {baseline['done_p50'] - result['done_p50']:.0f} ms sooner, "
+                      f"{baseline['calls_per_thread'] - result['calls_per_thread']:.2f} model calls saved per new thread")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=Path, default=CASES)
+    parser.add_argument("--show-titles", action="store_true")
+    parser.add_argument("--stack", action="store_true", help="compare title modes end to end on the stand-ins")
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", choices=["llm", "local", "refine"], default=["llm", "local", "refine"])
+    add_stack_args(parser)
+    args = parser.parse_args()
+
+    check_local(json.loads(args.cases.read_text(encoding="utf-8")), args.show_titles)
+    if args.stack:
+        print()
+        check_stack(args)
+
+
+if __name__ == "__main__":
+    main()
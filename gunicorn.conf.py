@@ -0,0 +1,79 @@
+"""
+Production server configuration.
+
+Usage:
+    gunicorn main:app -c gunicorn.conf.py
+
+One async uvicorn worker per available CPU (override with WEB_CONCURRENCY),
+uvloop + httptools, and a graceful timeout long enough for in-flight SSE
+streams to drain. With preload the app is imported once in the master and
+shared copy-on-write by the workers; upstream clients are still built per
+worker by the FastAPI lifespan, after the fork.
+
+Prometheus metrics are kept in per-worker files under
+PROMETHEUS_MULTIPROC_DIR, so a scrape answered by any worker reports the
+totals of all of them.
+"""
+import os
+import shutil
+
+from app.settings import PROJECT_ROOT, get_settings
+
+# must be set before prometheus_client is imported by the preloaded app
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", str(PROJECT_ROOT / "data" / "prometheus"))
+
+from uvicorn_worker import UvicornWorker  # noqa: E402
+
+settings = get_settings()
+
+
+def available_cpus() -> int:
+    # respects container CPU sets, unlike os.cpu_count()
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ServerWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        # uvicorn stops waiting for open connections after this; gunicorn's
+        # graceful_timeout below is the hard limit
+        "timeout_graceful_shutdown": int(settings.drain_timeout),
+    }
+
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = ServerWorker
+workers = settings.web_concurrency or available_cpus()
+preload_app = settings.web_preload
+
+# Streams and uploads can legitimately run long; the worker heartbeat is
+# separate from request duration for async workers.
+timeout = 120
+graceful_timeout = int(settings.drain_timeout) + 10
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # values of a previous run would be added to this one's
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    if workers > 1 and settings.event_bus_backend == "memory":
+        server.log.error(
+            "EVENT_BUS_BACKEND=memory with %d workers: thread events only reach clients of the "
+            "worker that published them. Set EVENT_BUS_BACKEND=redis or postgres, or WEB_CONCURRENCY=1",
+            workers,
+        )
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,13 +1,116 @@
+import asyncio
+import logging
+import signal
+from contextlib import asynccontextmanager
+
 from fastapi import APIRouter, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
+from app.middleware.body_limit import BodyLimitMiddleware
+from app.middleware.capture import RequestCaptureMiddleware
+from app.middleware.profiling import ProfilingMiddleware, get_profiling_control
+from app.routers.admin import router as admin_router
 from app.routers.chat import router as chat_router
+from app.routers.jobs import router as jobs_router
+from app.routers.voice import router as voice_router
+from app.database import get_supabase
+from app.services.archive import get_archive_service
+from app.services.events import get_event_bus
+from app.services.gc import get_garbage_collector
+from app.services.audio import shutdown_audio_executor
+from app.services.gemini import get_gemini_service
+from app.services.health import get_dependency_monitor
+from app.services.http import close_http_client, get_http_client
+from app.services.idempotency import get_idempotency_store
+from app.services.jobs import get_batch_job_service
+from app.services.knowledge import get_knowledge_registry
+from app.services.loop_lag import get_loop_lag_monitor
 from app.services.stt import router as stt_router
+from app.services.titles import get_title_service
+from app.services.usage import get_usage_service
+from app.settings import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+
+async def warm_up_clients(app: FastAPI) -> None:
+    """Build upstream clients in the background; /ready reports when done"""
+    try:
+        # SDK imports and client construction are blocking, keep them off the loop
+        await asyncio.to_thread(get_supabase)
+        await asyncio.to_thread(get_gemini_service)
+        get_http_client()
+        app.state.ready = True
+    except Exception as e:
+        logger.error("Client warm-up failed: %s", repr(e))
+        app.state.startup_error = repr(e)
+        return
+
+    await get_dependency_monitor().start()
+
+
+def drain_on_sigterm() -> None:
+    """Stop accepting new streams as soon as SIGTERM arrives, then let the server shut down"""
+    previous = signal.getsignal(signal.SIGTERM)
+    if not callable(previous):
+        return  # default disposition: the process just exits, nothing to drain
+    loop = asyncio.get_running_loop()
+
+    def handler(signum, frame):
+        get_dependency_monitor().start_draining()
+        # open-ended streams would hold up the shutdown; their queues belong
+        # to the loop, which this handler may have interrupted mid-step
+        loop.call_soon_threadsafe(get_event_bus().close_streams)
+        previous(signum, frame)
+
+    try:
+        signal.signal(signal.SIGTERM, handler)
+    except ValueError:
+        pass  # not in the main thread (e.g. under a test client)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    app.state.startup_error = None
+    warm_up = asyncio.create_task(warm_up_clients(app))
+    await get_loop_lag_monitor().start()
+    await get_batch_job_service().start()
+    await get_usage_service().start()
+    await get_knowledge_registry().start()
+    await get_archive_service().start()
+    await get_garbage_collector().start()
+    await get_event_bus().start()
+    drain_on_sigterm()
+
+    yield
+
+    monitor = get_dependency_monitor()
+    monitor.start_draining()
+    get_event_bus().close_streams()
+    await monitor.wait_for_streams(get_settings().drain_timeout)
+    await get_idempotency_store().stop()  # turns still generating after the drain timeout
+
+    warm_up.cancel()
+    await monitor.stop()
+    await get_batch_job_service().stop()
+    await get_archive_service().stop()
+    await get_garbage_collector().stop()
+    await get_event_bus().stop()
+    await get_title_service().stop()  # title refinements report usage too
+    await get_usage_service().stop()  # flushes usage of the drained streams
+    await get_knowledge_registry().stop()
+    await get_loop_lag_monitor().stop()
+    await close_http_client()
+    shutdown_audio_executor()
+
 
 app = FastAPI(
     title="Amartha Hackathon API",
     description="Backend API for Amartha Hackathon",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware configuration
@@ -19,13 +122,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(ProfilingMiddleware, control=get_profiling_control())
+
+settings = get_settings()
+# room for one base64-encoded audio upload plus the other fields; batch jobs check each file instead
+app.add_middleware(
+    BodyLimitMiddleware,
+    max_bytes=int(settings.max_upload_mb * 1024 * 1024) * 4 // 3 + 1024 * 1024,
+    exempt=("/api/v1/jobs",),
+)
+if settings.capture_requests:
+    app.add_middleware(
+        RequestCaptureMiddleware,
+        path=settings.capture_path,
+        sample_rate=settings.capture_sample_rate,
+    )
+
 # API v1 router
 api_v1_router = APIRouter(prefix="/api/v1")
 api_v1_router.include_router(chat_router)
 api_v1_router.include_router(stt_router)
+api_v1_router.include_router(voice_router)
+api_v1_router.include_router(jobs_router)
+api_v1_router.include_router(admin_router)
 
 app.include_router(api_v1_router)
 
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Amartha Hackathon API"}
@@ -34,3 +157,21 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Cached readiness: clients built, database reachable and not draining"""
+    if app.state.startup_error:
+        return JSONResponse(status_code=503, content={"status": "error", "detail": app.state.startup_error})
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+
+    monitor = get_dependency_monitor()
+    report = monitor.report()
+    if monitor.draining:
+        return JSONResponse(status_code=503, content={"status": "draining", **report})
+    if not monitor.healthy:
+        return JSONResponse(status_code=503, content={"status": "unavailable", **report})
+    # a model provider being down is reported, not a reason to leave rotation
+    return {"status": "degraded" if monitor.degraded else "ready", **report}
@@ -0,0 +1,50 @@
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import uvicorn
+
+from app import database
+from bench.fakes import Generation, build_http_app
+
+SERVICE_ROLE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.test"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def fake_server():
+    """bench/fakes.py's Supabase and Groq stand-ins, served for the whole session"""
+    app = build_http_app(db_latency=0, stt_latency=0, generation=Generation(0, 60, 100_000, 8), max_rows=1000)
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("fake Supabase did not start")
+        time.sleep(0.01)
+    yield SimpleNamespace(app=app, url=f"http://127.0.0.1:{port}")
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+@pytest.fixture
+def supabase(fake_server, monkeypatch):
+    """A real Supabase client against empty fake tables and buckets; `.store` and `.blobs` hold the data"""
+    from supabase import create_client
+
+    store, blobs = fake_server.app.state.store, fake_server.app.state.blobs
+    store.tables.clear()
+    store.max_rows = 1000
+    blobs.clear()
+    client = create_client(fake_server.url, SERVICE_ROLE_KEY)
+    monkeypatch.setattr(database, "_supabase", client)
+    return SimpleNamespace(client=client, store=store, blobs=blobs, url=fake_server.url)
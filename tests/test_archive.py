@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.services.archive import ArchiveService
+from app.services.thread import ThreadService
+
+USER_ID = "5f0c6d8e-1b2a-4c3d-9e8f-0a1b2c3d4e5f"
+
+
+def _idle_thread(supabase, messages: int = 3, days: float = 60) -> str:
+    service = ThreadService()
+
+    async def create():
+        thread = await service.create_thread(USER_ID, "system", title="Modal Usaha")
+        for i in range(messages):
+            await service.add_message(thread["id"], "user" if i % 2 == 0 else "assistant", f"pesan {i}")
+        return thread["id"]
+
+    thread_id = asyncio.run(create())
+    idle_since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    supabase.store.rows("threads")[thread_id]["updated_at"] = idle_since
+    return thread_id
+
+
+def _archiver() -> ArchiveService:
+    return ArchiveService(after_days=30, interval=0, batch_size=10)
+
+
+def _archived_blobs(supabase):
+    return [key for key in supabase.blobs if key.startswith("archive/")]
+
+
+def test_idle_thread_is_archived_into_one_blob(supabase):
+    thread_id = _idle_thread(supabase)
+    _idle_thread(supabase, days=1)  # recent: stays
+
+    counts = asyncio.run(_archiver().run_once())
+
+    assert counts == {"candidates": 1, "archived": 1, "messages": 3, "skipped": 0}
+    thread = supabase.store.rows("threads")[thread_id]
+    assert thread["archived_at"] and thread["archived_messages"] == 3
+    assert _archived_blobs(supabase) == [f"archive/{thread['archive_path']}"]
+    assert not [m for m in supabase.store.rows("messages").values() if m["thread_id"] == thread_id]
+
+
+def test_opening_an_archived_thread_restores_it(supabase):
+    thread_id = _idle_thread(supabase)
+    before = sorted(
+        (m for m in supabase.store.rows("messages").values() if m["thread_id"] == thread_id),
+        key=lambda m: m["created_at"],
+    )
+    asyncio.run(_archiver().run_once())
+
+    messages = asyncio.run(ThreadService().get_thread_messages(thread_id))
+
+    assert [(m["id"], m["content"]) for m in messages] == [(m["id"], m["content"]) for m in before]
+    thread = supabase.store.rows("threads")[thread_id]
+    assert thread["archived_at"] is None and thread["archive_path"] is None
+    assert thread["restored_at"]
+    assert _archived_blobs(supabase) == []
+
+
+def test_restore_with_the_thread_row_updates_it(supabase):
+    thread_id = _idle_thread(supabase)
+    asyncio.run(_archiver().run_once())
+    thread = dict(supabase.store.rows("threads")[thread_id])
+
+    messages = asyncio.run(ThreadService().get_thread_messages(thread_id, thread=thread))
+
+    assert len(messages) == 3
+    assert thread["archived_at"] is None
+
+
+def test_thread_written_meanwhile_is_not_archived(supabase):
+    thread_id = _idle_thread(supabase)
+    stale = dict(supabase.store.rows("threads")[thread_id])
+    supabase.store.rows("threads")[thread_id]["updated_at"] = datetime.utcnow().isoformat()
+
+    assert ArchiveService._archive_thread(stale) == 0
+    assert supabase.store.rows("threads")[thread_id]["archived_at"] is None
+    assert _archived_blobs(supabase) == []
+    assert len(asyncio.run(ThreadService().get_thread_messages(thread_id))) == 3
+
+
+def test_empty_threads_are_left_to_the_collector(supabase):
+    _idle_thread(supabase, messages=0)
+    assert asyncio.run(_archiver().run_once())["archived"] == 0
+    assert _archived_blobs(supabase) == []
+
+
+def test_restored_thread_is_not_archived_again_at_once(supabase):
+    thread_id = _idle_thread(supabase)
+    archiver = _archiver()
+    asyncio.run(archiver.run_once())
+    asyncio.run(ThreadService().get_thread_messages(thread_id))
+    supabase.store.rows("threads")[thread_id]["updated_at"] = (datetime.utcnow() - timedelta(days=60)).isoformat()
+
+    assert asyncio.run(archiver.run_once())["archived"] == 0
+
+
+def test_deleting_an_archived_thread_removes_its_blob(supabase):
+    thread_id = _idle_thread(supabase)
+    asyncio.run(_archiver().run_once())
+
+    assert asyncio.run(ThreadService().delete_thread(thread_id, USER_ID))
+    assert _archived_blobs(supabase) == []
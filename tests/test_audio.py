@@ -0,0 +1,134 @@
+import asyncio
+import base64
+import io
+import math
+import wave
+from array import array
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.services import audio
+from app.services.audio import decode_base64_audio, preprocess_audio, preprocess_audio_sync, read_upload
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(audio, "AUDIO_PREPROCESS", True)
+    monkeypatch.setattr(audio, "AUDIO_SAMPLE_RATE", 16000)
+    monkeypatch.setattr(audio, "AUDIO_TRIM_SILENCE", True)
+    monkeypatch.setattr(audio, "AUDIO_TRIM_THRESHOLD", 300)
+    monkeypatch.setattr(audio, "AUDIO_TRIM_PADDING_MS", 200)
+    # run in this process: a worker process would not see the patches
+    monkeypatch.setattr(audio, "get_audio_executor", lambda: None)
+
+
+def _wav(seconds_silence: float, seconds_tone: float, rate: int = 44100, channels: int = 2) -> bytes:
+    silence = [0] * int(rate * seconds_silence)
+    tone = [int(8000 * math.sin(2 * math.pi * 440 * i / rate)) for i in range(int(rate * seconds_tone))]
+    samples = array("h", (s for s in silence + tone + silence for _ in range(channels)))
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+
+def test_wav_is_normalized_and_trimmed():
+    processed = preprocess_audio_sync(_wav(1.0, 0.5), encoding="wav")
+
+    assert processed.sample_rate == 16000
+    # 0.5 s of speech plus 200 ms padding each side (to the 20 ms frame)
+    assert processed.duration == pytest.approx(0.9, abs=0.05)
+    with wave.open(io.BytesIO(processed.data), "rb") as wav:
+        assert (wav.getnchannels(), wav.getframerate(), wav.getsampwidth()) == (1, 16000, 2)
+    assert processed.content_type == "audio/wav"
+
+
+def test_same_speech_hashes_the_same():
+    # the same speech with more silence around it, or in stereo, is the same audio
+    first = preprocess_audio_sync(_wav(1.0, 0.5, rate=16000), encoding="wav")
+    second = preprocess_audio_sync(_wav(2.0, 0.5, rate=16000), encoding="wav")
+    assert first.content_hash == second.content_hash
+
+    stereo = preprocess_audio_sync(_wav(1.0, 0.5), encoding="wav")
+    mono = preprocess_audio_sync(_wav(1.0, 0.5, channels=1), encoding="wav")
+    assert stereo.content_hash == mono.content_hash
+
+
+def test_compressed_encodings_fall_back_to_wav_without_ffmpeg(monkeypatch):
+    monkeypatch.setattr(audio, "FFMPEG", None)
+    processed = preprocess_audio_sync(_wav(0.2, 0.5), encoding="opus")
+    assert (processed.content_type, processed.extension) == ("audio/wav", "wav")
+
+
+def test_undecodable_audio_is_kept_as_uploaded(monkeypatch):
+    monkeypatch.setattr(audio, "FFMPEG", None)
+    data = b"OggS" + bytes(1000)
+
+    assert preprocess_audio_sync(data) is None
+    kept = asyncio.run(preprocess_audio(data, "audio/ogg", "voice.ogg"))
+    assert (kept.data, kept.content_type, kept.extension, kept.pcm) == (data, "audio/ogg", "ogg", None)
+
+
+def test_failure_keeps_the_original(monkeypatch):
+    def broken(data):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(audio, "preprocess_audio_sync", broken)
+    data = _wav(0.2, 0.5)
+    assert asyncio.run(preprocess_audio(data)).data == data
+
+
+def test_disabled_preprocessing_keeps_the_original(monkeypatch):
+    monkeypatch.setattr(audio, "AUDIO_PREPROCESS", False)
+    data = _wav(0.2, 0.5)
+    kept = asyncio.run(preprocess_audio(data))
+    assert kept.data == data and kept.pcm is None
+
+
+def test_larger_output_keeps_the_upload_but_exposes_pcm():
+    # 8 kHz mono upsampled to 16 kHz grows
+    data = _wav(0.0, 0.5, rate=8000, channels=1)
+    kept = asyncio.run(preprocess_audio(data))
+    assert kept.data == data
+    assert kept.pcm and kept.sample_rate == 16000
+
+
+@pytest.mark.parametrize("width, frames, samples", [
+    (1, bytes([128, 255, 0]), [0, 127 << 8, -128 << 8]),
+    (3, (1 << 16).to_bytes(3, "little", signed=True), [256]),
+    (4, (-(1 << 24)).to_bytes(4, "little", signed=True), [-256]),
+])
+def test_sample_widths(width, frames, samples):
+    assert list(audio._to_int16(frames, width)) == samples
+
+
+def _upload(data: bytes, size):
+    upload = UploadFile(io.BytesIO(data), filename="voice.wav")
+    upload.size = size
+    return upload
+
+
+@pytest.mark.parametrize("size", [100, None])
+def test_upload_within_the_limit_is_read(size):
+    assert asyncio.run(read_upload(_upload(b"x" * 100, size), max_bytes=100)) == b"x" * 100
+
+
+@pytest.mark.parametrize("size", [101, None])
+def test_oversized_upload_is_rejected(size):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(read_upload(_upload(b"x" * 101, size), max_bytes=100))
+    assert error.value.status_code == 413
+
+
+def test_base64_audio_limit():
+    assert decode_base64_audio(base64.b64encode(b"x" * 99).decode(), max_bytes=100) == b"x" * 99
+    with pytest.raises(HTTPException) as error:
+        decode_base64_audio(base64.b64encode(b"x" * 150).decode(), max_bytes=100)
+    assert error.value.status_code == 413
+    with pytest.raises(HTTPException) as error:
+        decode_base64_audio("not base64!", max_bytes=100)
+    assert error.value.status_code == 400
@@ -0,0 +1,86 @@
+import asyncio
+import os
+
+from app.services.audio_cache import AudioCache, content_type
+
+HASH = "0123456789abcdef0123456789abcdef"
+
+
+def _store(supabase, path, data):
+    supabase.blobs[f"audio/{path}"] = {"data": data, "created_at": None, "updated_at": None}
+
+
+def test_miss_then_hit(supabase, tmp_path):
+    _store(supabase, f"u1/{HASH}.wav", b"RIFF" + bytes(96))
+    cache = AudioCache(tmp_path, max_bytes=10_000)
+
+    async def run():
+        first, second = await asyncio.gather(cache.get(f"u1/{HASH}.wav"), cache.get(f"u1/{HASH}.wav"))
+        assert first == second and first.read_bytes() == b"RIFF" + bytes(96)
+        # served from disk from now on
+        supabase.blobs.clear()
+        assert (await cache.get(f"u1/{HASH}.wav")).read_bytes() == b"RIFF" + bytes(96)
+
+    asyncio.run(run())
+    assert list(tmp_path.iterdir()) == [cache._file(f"u1/{HASH}.wav")]
+
+
+def test_missing_blob(supabase, tmp_path):
+    cache = AudioCache(tmp_path, max_bytes=10_000)
+    assert asyncio.run(cache.get("u1/gone.wav")) is None
+    assert not any(tmp_path.iterdir())
+
+
+def test_least_recently_used_files_are_evicted(supabase, tmp_path):
+    for name in ("a", "b", "c"):
+        _store(supabase, f"u1/{name}.wav", bytes(100))
+    cache = AudioCache(tmp_path, max_bytes=250)
+
+    async def run():
+        a = await cache.get("u1/a.wav")
+        b = await cache.get("u1/b.wav")
+        os.utime(a, (2000, 2000))
+        os.utime(b, (1000, 1000))
+        c = await cache.get("u1/c.wav")
+        return a, b, c
+
+    a, b, c = asyncio.run(run())
+    assert a.exists() and c.exists() and not b.exists()
+
+
+def test_deleted_blob_is_dropped_on_revalidation(supabase, tmp_path):
+    _store(supabase, "u1/a.wav", bytes(100))
+    _store(supabase, "u1/b.wav", bytes(100))
+    cache = AudioCache(tmp_path, max_bytes=10_000, revalidate_after=60)
+
+    async def run():
+        a = await cache.get("u1/a.wav")
+        await cache.get("u1/b.wav")
+        # the GC deleted both blobs; a is forgotten, b still trusted from its fetch
+        supabase.blobs.clear()
+        cache._verified.pop("u1/a.wav")
+        assert await cache.get("u1/a.wav") is None
+        assert not a.exists()
+        assert await cache.get("u1/b.wav") is not None
+
+    asyncio.run(run())
+
+
+def test_discard(supabase, tmp_path):
+    _store(supabase, "u1/a.wav", bytes(10))
+    cache = AudioCache(tmp_path, max_bytes=10_000)
+    local = asyncio.run(cache.get("u1/a.wav"))
+    cache.discard(["u1/a.wav", "u1/never-cached.wav"])
+    assert not local.exists()
+
+
+def test_etag_and_content_type(tmp_path):
+    cache = AudioCache(tmp_path, max_bytes=10_000)
+    local = tmp_path / "blob"
+    local.write_bytes(b"audio")
+    assert cache.etag(f"u1/{HASH}.ogg", local) == f'"{HASH}"'
+    legacy = cache.etag("u1/voice_123.wav", local)
+    assert legacy.startswith('"') and legacy != f'"{HASH}"'
+    assert cache.etag("u1/voice_123.wav", local) == legacy
+    assert content_type("u1/a.opus") == "audio/ogg"
+    assert content_type("u1/a.xyz") == "application/octet-stream"
@@ -0,0 +1,52 @@
+from fastapi import FastAPI
+from pydantic import BaseModel
+from starlette.testclient import TestClient
+
+from app.middleware.body_limit import BodyLimitMiddleware
+
+
+class Body(BaseModel):
+    audio_base64: str
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+
+    @app.post("/api/v1/chat/send")
+    async def send(body: Body):
+        return {"chars": len(body.audio_base64)}
+
+    @app.post("/api/v1/jobs/transcriptions")
+    async def jobs(body: Body):
+        return {"chars": len(body.audio_base64)}
+
+    app.add_middleware(BodyLimitMiddleware, max_bytes=1000, exempt=("/api/v1/jobs",))
+    return TestClient(app)
+
+
+def test_small_body_passes():
+    assert _client().post("/api/v1/chat/send", json={"audio_base64": "x" * 10}).json() == {"chars": 10}
+
+
+def test_declared_length_over_the_limit_is_rejected():
+    response = _client().post("/api/v1/chat/send", json={"audio_base64": "x" * 2000})
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large"}
+
+
+def test_chunked_body_over_the_limit_is_rejected():
+    def chunks():
+        yield b'{"audio_base64": "'
+        for _ in range(30):
+            yield b"x" * 100
+        yield b'"}'
+
+    response = _client().post(
+        "/api/v1/chat/send", content=chunks(), headers={"content-type": "application/json"},
+    )
+    assert response.status_code == 413
+
+
+def test_exempt_paths_are_not_limited():
+    response = _client().post("/api/v1/jobs/transcriptions", json={"audio_base64": "x" * 2000})
+    assert response.json() == {"chars": 2000}
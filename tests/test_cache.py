@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import cache
+from app.services.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set("a", 1)
+    clock.value += 59
+    assert entries.get("a") == 1
+    clock.value += 2
+    assert entries.get("a") is None
+    assert len(entries) == 0
+    assert (entries.hits, entries.misses) == (1, 1)
+
+
+def test_per_entry_ttl_overrides_default(clock):
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set("short", 1, ttl=5)
+    entries.set("long", 2)
+    clock.value += 10
+    assert "short" not in entries
+    assert "long" in entries
+
+
+def test_setting_again_restarts_ttl(clock):
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set("a", 1)
+    clock.value += 50
+    entries.set("a", 2)
+    clock.value += 50
+    assert entries.get("a") == 2
+
+
+def test_least_recently_used_is_evicted(clock):
+    entries = TTLCache(maxsize=2, ttl=60)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    assert entries.get("a") == 1  # "b" is now the least recently used
+    entries.set("c", 3)
+    assert "b" not in entries
+    assert entries.get("a") == 1
+    assert entries.get("c") == 3
+    assert len(entries) == 2
+
+
+def test_zero_maxsize_stores_nothing(clock):
+    entries = TTLCache(maxsize=0, ttl=60)
+    entries.set("a", 1)
+    assert len(entries) == 0
+    assert entries.get("a", "missing") == "missing"
+
+
+def test_pop_and_clear(clock):
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    assert entries.pop("a") == 1
+    assert entries.pop("a", "gone") == "gone"
+    entries.clear()
+    assert len(entries) == 0
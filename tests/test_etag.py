@@ -0,0 +1,42 @@
+from app.services.etag import etag_matches, thread_etag, threads_etag, weak_etag
+
+
+def test_weak_etag_is_stable_and_weak():
+    assert weak_etag("a", 1) == weak_etag("a", 1)
+    assert weak_etag("a", 1) != weak_etag("a", 2)
+    assert weak_etag("a").startswith('W/"')
+
+
+def test_matches_weak_and_strong_forms():
+    etag = weak_etag("thread")
+    assert etag_matches(etag, etag)
+    assert etag_matches(etag.removeprefix("W/"), etag)
+
+
+def test_matches_any_tag_in_a_list():
+    etag = weak_etag("thread")
+    assert etag_matches(f'W/"other", {etag}', etag)
+    assert not etag_matches('W/"other", "another"', etag)
+
+
+def test_wildcard_and_missing_header():
+    etag = weak_etag("thread")
+    assert etag_matches(" * ", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+
+
+def test_thread_etag_follows_updates_and_archiving():
+    thread = {"id": "t1", "updated_at": "2026-01-01T00:00:00+00:00", "archived_at": None}
+    etag = thread_etag(thread)
+    assert thread_etag({**thread, "title": "Renamed"}) == etag
+    assert thread_etag({**thread, "updated_at": "2026-01-02T00:00:00+00:00"}) != etag
+    assert thread_etag({**thread, "archived_at": "2026-02-01T00:00:00+00:00"}) != etag
+    assert thread_etag({**thread, "audio_expired_at": "2026-03-01T00:00:00+00:00"}) != etag
+
+
+def test_threads_etag_changes_with_membership_and_order():
+    a = {"id": "a", "updated_at": "1"}
+    b = {"id": "b", "updated_at": "1"}
+    assert threads_etag([a, b]) != threads_etag([a])
+    assert threads_etag([a, b]) != threads_etag([b, a])
@@ -0,0 +1,139 @@
+import asyncio
+import json
+from uuid import uuid4
+
+import pytest
+
+from app.services import events
+from app.services.events import CLOSED, QUEUE_SIZE, RESYNC, EventBus
+
+
+class FakeRelay:
+    """Loops published messages back; `drop()` ends the current connection"""
+
+    def __init__(self):
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.connections = 0
+
+    async def publish(self, message: str) -> None:
+        await self.messages.put(message)
+
+    async def listen(self, on_message, connected) -> None:
+        self.connections += 1
+        connected()
+        while True:
+            message = await self.messages.get()
+            if message is None:
+                raise ConnectionError("relay dropped")
+            on_message(message)
+
+    def drop(self) -> None:
+        self.messages.put_nowait(None)
+
+    async def close(self) -> None:
+        pass
+
+
+async def _start(bus: EventBus, relay: FakeRelay) -> None:
+    bus._relay = relay
+    bus._task = asyncio.create_task(bus._run())
+    while not relay.connections:
+        await asyncio.sleep(0)
+
+
+def test_events_reach_only_the_users_streams():
+    async def run():
+        bus = EventBus("memory", "")
+        alice, bob = uuid4(), uuid4()
+        async with bus.subscribe(alice) as first, bus.subscribe(alice) as second, bus.subscribe(bob) as other:
+            assert bus.subscriber_count == 3
+            await bus.publish(alice, {"type": "created", "thread_id": "t1"})
+            assert first.get_nowait() == second.get_nowait() == {"type": "created", "thread_id": "t1"}
+            assert other.empty()
+        assert bus.subscriber_count == 0
+
+    asyncio.run(run())
+
+
+def test_slow_stream_gets_a_resync():
+    async def run():
+        bus = EventBus("memory", "")
+        user = uuid4()
+        async with bus.subscribe(user) as queue:
+            for i in range(QUEUE_SIZE + 1):
+                await bus.publish(user, {"type": "updated", "thread_id": str(i)})
+            assert queue.qsize() == 1
+            assert queue.get_nowait() == RESYNC
+
+    asyncio.run(run())
+
+
+def test_close_streams_asks_clients_to_reconnect():
+    async def run():
+        bus = EventBus("memory", "")
+        user = uuid4()
+        async with bus.subscribe(user) as queue:
+            for i in range(QUEUE_SIZE):
+                await bus.publish(user, {"type": "updated", "thread_id": str(i)})
+            bus.close_streams()
+            assert queue.qsize() == 1
+            assert queue.get_nowait() == CLOSED
+
+    asyncio.run(run())
+
+
+def test_relay_delivers_and_resyncs_after_reconnecting(monkeypatch):
+    monkeypatch.setattr(events, "RECONNECT_DELAY", 0)
+
+    async def run():
+        bus = EventBus("redis", "redis://unused")
+        relay = FakeRelay()
+        user = uuid4()
+        async with bus.subscribe(user) as queue:
+            await _start(bus, relay)
+            await bus.publish(user, {"type": "title", "thread_id": "t1", "title": "Pinjaman"})
+            assert await asyncio.wait_for(queue.get(), 1) == {"type": "title", "thread_id": "t1", "title": "Pinjaman"}
+            # the first connection is not a reconnect
+            assert queue.empty()
+
+            relay.drop()
+            assert await asyncio.wait_for(queue.get(), 1) == RESYNC
+            assert relay.connections == 2
+        await bus.stop()
+
+    asyncio.run(run())
+
+
+def test_malformed_relay_messages_are_ignored():
+    async def run():
+        bus = EventBus("redis", "redis://unused")
+        relay = FakeRelay()
+        user = uuid4()
+        async with bus.subscribe(user) as queue:
+            await _start(bus, relay)
+            await relay.publish("not json")
+            await relay.publish(json.dumps({"event": {"type": "deleted"}}))
+            await bus.publish(user, {"type": "deleted", "thread_id": "t1"})
+            assert await asyncio.wait_for(queue.get(), 1) == {"type": "deleted", "thread_id": "t1"}
+        await bus.stop()
+
+    asyncio.run(run())
+
+
+def test_failed_publish_does_not_raise():
+    class Broken(FakeRelay):
+        async def publish(self, message):
+            raise ConnectionError("down")
+
+    async def run():
+        bus = EventBus("redis", "redis://unused")
+        bus._relay = Broken()
+        await bus.publish(uuid4(), {"type": "created", "thread_id": "t1"})
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("backend, url", [("kafka", "kafka://x"), ("redis", ""), ("postgres", "")])
+def test_invalid_configuration(backend, url):
+    with pytest.raises(ValueError):
+        EventBus(backend, url)
@@ -0,0 +1,102 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from app.services import export
+from app.services.archive import ArchiveService
+from app.services.export import ExportService, decode_cursor
+from app.services.thread import ThreadService
+
+USER_ID = "5f0c6d8e-1b2a-4c3d-9e8f-0a1b2c3d4e5f"
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    monkeypatch.setattr(export, "THREAD_PAGE", 2)
+    monkeypatch.setattr(export, "MESSAGE_PAGE", 2)
+
+
+def _history(threads: int = 3, messages: int = 3) -> None:
+    service = ThreadService()
+
+    async def create():
+        for t in range(threads):
+            thread = await service.create_thread(USER_ID, "system", title=f"Thread {t}")
+            for m in range(messages):
+                await service.add_message(thread["id"], "user", f"pesan {t}.{m}")
+        # another user's thread is never exported
+        await service.create_thread("0d9e8f7a-6b5c-4d3e-8f1a-2b3c4d5e6f70", "system", title="Other")
+
+    asyncio.run(create())
+
+
+def _lines(position=None):
+    async def collect():
+        service = ExportService(ThreadService())
+        return [json.loads(line) async for line in service.lines(USER_ID, position)]
+
+    return asyncio.run(collect())
+
+
+def _content(line: dict) -> str:
+    return line["thread"]["title"] if line["type"] == "thread" else line["message"]["content"]
+
+
+def test_every_thread_then_its_messages(supabase, small_pages):
+    _history()
+    lines = _lines()
+
+    assert lines[-1] == {"type": "end", "threads": 3, "messages": 9}
+    assert [_content(line) for line in lines[:-1]] == [
+        text for t in range(3) for text in [f"Thread {t}"] + [f"pesan {t}.{m}" for m in range(3)]
+    ]
+
+
+def test_resuming_from_any_cursor_sends_the_rest(supabase, small_pages):
+    _history()
+    full = _lines()[:-1]
+
+    for i, line in enumerate(full):
+        rest = _lines(decode_cursor(line["cursor"]))
+        assert [_content(r) for r in rest if r["type"] != "end"] == [_content(r) for r in full[i + 1:]]
+
+
+def test_gzip_stream_holds_the_same_lines(supabase):
+    _history(threads=2)
+
+    async def collect(compress):
+        service = ExportService(ThreadService())
+        return b"".join([chunk async for chunk in service.stream(USER_ID, compress=compress)])
+
+    plain = asyncio.run(collect(False))
+    assert gzip.decompress(asyncio.run(collect(True))) == plain
+    assert plain.endswith(b"\n") and plain.count(b"\n") == 2 + 6 + 1
+
+
+def test_archived_threads_are_exported_from_their_blob(supabase):
+    _history(threads=1)
+    thread_id = next(iter(t for t in supabase.store.rows("threads").values() if t["user_id"] == USER_ID))["id"]
+    supabase.store.rows("threads")[thread_id]["updated_at"] = "2020-01-01T00:00:00"
+    asyncio.run(ArchiveService(after_days=30, interval=0, batch_size=10).run_once())
+
+    lines = _lines()
+
+    assert [_content(line) for line in lines if line["type"] == "message"] == ["pesan 0.0", "pesan 0.1", "pesan 0.2"]
+    assert supabase.store.rows("threads")[thread_id]["archived_at"] is not None
+
+
+def test_failure_ends_without_an_end_line(supabase, monkeypatch):
+    _history(threads=2)
+
+    async def failing(*args, **kwargs):
+        raise ConnectionError("database went away")
+
+    monkeypatch.setattr(ThreadService, "get_messages_page", failing)
+    lines = _lines()
+
+    assert lines[-1]["type"] == "error"
+    assert not [line for line in lines if line["type"] == "end"]
+    # the thread line before the failure can be resumed from
+    assert lines[0]["type"] == "thread"
@@ -0,0 +1,43 @@
+import base64
+import json
+
+import pytest
+
+from app.services.export import decode_cursor, encode_cursor
+
+THREAD_ID = "5f0c6d8e-1b2a-4c3d-9e8f-0a1b2c3d4e5f"
+MESSAGE_ID = "0d9e8f7a-6b5c-4d3e-8f1a-2b3c4d5e6f70"
+
+
+def _cursor(value) -> str:
+    raw = json.dumps(value).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+@pytest.mark.parametrize("position", [
+    ("2026-01-01T00:00:00+00:00", THREAD_ID, None, None),
+    ("2026-01-01T00:00:00.123456+00:00", THREAD_ID, "2026-01-01T00:05:00Z", MESSAGE_ID),
+])
+def test_round_trip(position):
+    cursor = encode_cursor(position)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == position
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode("ascii"),
+    _cursor({"thread": THREAD_ID}),
+    _cursor(["2026-01-01T00:00:00+00:00", THREAD_ID, None]),
+    _cursor(["2026-01-01T00:00:00+00:00", 7, None, None]),
+    _cursor(["2026-01-01T00:00:00+00:00", THREAD_ID, "2026-01-01T00:05:00Z", None]),
+    _cursor(["2026-01-01T00:00:00+00:00", THREAD_ID, None, MESSAGE_ID]),
+    _cursor(["yesterday", THREAD_ID, None, None]),
+    _cursor(["2026-01-01T00:00:00+00:00,id.gt.0", THREAD_ID, None, None]),
+    _cursor(["2026-01-01T00:00:00+00:00", "not-a-uuid", None, None]),
+    _cursor(["2026-01-01T00:00:00+00:00", THREAD_ID.upper(), None, None]),
+    _cursor(["2026-01-01T00:00:00+00:00", THREAD_ID, "2026-01-01T00:05:00Z", f"{MESSAGE_ID})"]),
+])
+def test_rejects_invalid_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
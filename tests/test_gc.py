@@ -0,0 +1,138 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.gc import GarbageCollector
+
+USER_ID = "5f0c6d8e-1b2a-4c3d-9e8f-0a1b2c3d4e5f"
+
+
+def _hours_ago(hours: float) -> str:
+    return (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+
+
+def _collector(**overrides) -> GarbageCollector:
+    options = {
+        "interval": 0,
+        "grace_hours": 24,
+        "empty_threads": "untitled",
+        "audio_retention_days": 0,
+        "batch_size": 100,
+        "requests_per_second": 0,
+    }
+    options.update(overrides)
+    return GarbageCollector(**options)
+
+
+def _thread(supabase, **values) -> str:
+    row = {"user_id": USER_ID, "system_instruction": "", "title": "Modal Usaha", **values}
+    return supabase.store.insert("threads", row)[0]["id"]
+
+
+def _recording(supabase, name: str, age_hours: float = 48) -> str:
+    """An old blob in the user's audio folder; returns the URL messages store"""
+    written = _hours_ago(age_hours)
+    supabase.blobs[f"audio/{USER_ID}/{name}.wav"] = {"data": b"RIFF", "created_at": written, "updated_at": written}
+    return f"{supabase.url}/storage/v1/object/public/audio/{USER_ID}/{name}.wav"
+
+
+def _voice_message(supabase, thread_id: str, audio_url: str) -> str:
+    row = {"thread_id": thread_id, "role": "user", "content": "[Audio]", "audio_url": audio_url}
+    return supabase.store.insert("messages", row)[0]["id"]
+
+
+def _stored(supabase):
+    return {key.rsplit("/", 1)[1] for key in supabase.blobs if key.startswith("audio/")}
+
+
+def test_recordings_of_every_thread_are_kept_past_max_rows(supabase):
+    # PostgREST returns at most max-rows rows: the references must be paged
+    supabase.store.max_rows = 5
+    for i in range(12):
+        _voice_message(supabase, _thread(supabase), _recording(supabase, f"live-{i}"))
+    _recording(supabase, "orphan")
+
+    counts = asyncio.run(_collector().run_once())
+
+    assert counts["audio_orphans"] == 1
+    assert _stored(supabase) == {f"live-{i}.wav" for i in range(12)}
+
+
+def test_recordings_of_every_message_are_kept_past_max_rows(supabase):
+    supabase.store.max_rows = 5
+    thread_id = _thread(supabase)
+    for i in range(12):
+        _voice_message(supabase, thread_id, _recording(supabase, f"live-{i}"))
+
+    assert asyncio.run(_collector().run_once())["audio_orphans"] == 0
+    assert len(_stored(supabase)) == 12
+
+
+def test_shared_recording_is_kept_while_any_message_uses_it(supabase):
+    url = _recording(supabase, "shared")
+    _voice_message(supabase, _thread(supabase), url)
+    supabase.store.insert("threads", {"user_id": USER_ID, "system_instruction": "", "title": "Gone"})
+
+    asyncio.run(_collector().run_once())
+    assert _stored(supabase) == {"shared.wav"}
+
+
+def test_young_orphans_are_left_alone(supabase):
+    _recording(supabase, "uploading", age_hours=1)
+    assert asyncio.run(_collector().run_once())["audio_orphans"] == 0
+    assert _stored(supabase) == {"uploading.wav"}
+
+
+def test_expired_recordings_lose_their_url(supabase):
+    thread_id = _thread(supabase)
+    old = _voice_message(supabase, thread_id, _recording(supabase, "old", age_hours=24 * 10))
+    recent = _voice_message(supabase, thread_id, _recording(supabase, "recent", age_hours=48))
+    updated_at = supabase.store.rows("threads")[thread_id]["updated_at"]
+
+    counts = asyncio.run(_collector(audio_retention_days=7).run_once())
+
+    messages = supabase.store.rows("messages")
+    assert counts["audio_expired"] == 1
+    assert messages[old]["audio_url"] is None
+    assert messages[recent]["audio_url"] is not None
+    assert _stored(supabase) == {"recent.wav"}
+    # cached copies of the thread are invalidated, but it keeps its place in the list
+    thread = supabase.store.rows("threads")[thread_id]
+    assert thread["audio_expired_at"] is not None
+    assert thread["updated_at"] == updated_at
+
+
+@pytest.mark.parametrize("policy, kept", [
+    ("untitled", {"titled", "recent", "used"}),
+    ("all", {"recent", "used"}),
+    ("off", {"untitled", "titled", "recent", "used"}),
+])
+def test_empty_threads(supabase, policy, kept):
+    old = _hours_ago(48)
+    _thread(supabase, title=None, name="untitled", updated_at=old)
+    _thread(supabase, name="titled", updated_at=old)
+    _thread(supabase, title=None, name="recent")
+    used = _thread(supabase, title=None, name="used", updated_at=old)
+    supabase.store.insert("messages", {"thread_id": used, "role": "user", "content": "halo"})
+
+    asyncio.run(_collector(empty_threads=policy).run_once())
+
+    assert {thread["name"] for thread in supabase.store.rows("threads").values()} == kept
+
+
+def test_missing_function_does_not_stop_the_cycle(supabase, monkeypatch):
+    rpc = supabase.client.rpc
+    monkeypatch.setattr(supabase.client, "rpc", lambda name, params: rpc(f"{name}_{uuid.uuid4().hex}", params))
+    _recording(supabase, "orphan")
+
+    counts = asyncio.run(_collector().run_once())
+
+    assert counts["empty_threads"] == 0
+    assert counts["audio_orphans"] == 1
+
+
+def test_invalid_policy_is_rejected():
+    with pytest.raises(ValueError):
+        _collector(empty_threads="some")
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import metrics
+from app.services.gemini import GeminiService, _cut_at_word
+from app.services.generation import get_profile
+
+WORD = "modal "  # one token per word in these streams
+
+
+class Call:
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def done(self):
+        return self.cancelled
+
+
+def _chunk(text: str, answer_tokens: int, finish: str = "STOP"):
+    usage = SimpleNamespace(
+        prompt_token_count=100,
+        candidates_token_count=answer_tokens,
+        total_token_count=100 + answer_tokens,
+        cached_content_token_count=0,
+    )
+    return SimpleNamespace(
+        usage_metadata=usage,
+        candidates=[SimpleNamespace(finish_reason=SimpleNamespace(name=finish))],
+        parts=[SimpleNamespace(text=text)] if text else [],
+    )
+
+
+def _service(chunks, call: Call) -> GeminiService:
+    async def response():
+        for chunk in chunks:
+            yield chunk
+
+    async def stream(model, contents):
+        return response(), call
+
+    service = GeminiService.__new__(GeminiService)
+    service.genai = SimpleNamespace(GenerativeModel=lambda **kwargs: None)
+    service._stream = stream
+    return service
+
+
+def _truncations(profile: str) -> float:
+    return metrics.LLM_TRUNCATED.labels("gemini", profile)._value.get()
+
+
+async def _answer(service, profile, usage):
+    chunks = service.chat_stream("halo", [], "", on_usage=usage.append, profile=profile)
+    return "".join([chunk async for chunk in chunks])
+
+
+def test_answer_is_cut_at_the_profile_cap_and_the_call_cancelled():
+    profile = get_profile("voice")  # 200 tokens
+    chunks = [_chunk(WORD * 60, 60 * (i + 1)) for i in range(10)]
+    call, usage = Call(), []
+    before = _truncations(profile.name)
+
+    answer = asyncio.run(_answer(_service(chunks, call), profile, usage))
+
+    assert call.cancelled
+    assert len(answer.split()) <= profile.max_output_tokens
+    assert answer.split() == ["modal"] * len(answer.split())
+    assert _truncations(profile.name) == before + 1
+    # the usage billed up to the cut
+    assert [u.completion_tokens for u in usage] == [240]
+
+
+def test_short_answer_is_untouched():
+    profile = get_profile("voice")
+    chunks = [_chunk(WORD * 10, 10), _chunk(WORD * 10, 20), _chunk("", 20)]
+    call, usage = Call(), []
+    before = _truncations(profile.name)
+
+    answer = asyncio.run(_answer(_service(chunks, call), profile, usage))
+
+    assert answer == WORD * 20
+    assert _truncations(profile.name) == before
+    assert [u.completion_tokens for u in usage] == [20]
+
+
+def test_provider_truncation_counts_once():
+    profile = get_profile("voice")
+    chunks = [_chunk(WORD * 10, 10), _chunk("", 10, finish="MAX_TOKENS"), _chunk("", 10, finish="MAX_TOKENS")]
+    before = _truncations(profile.name)
+    asyncio.run(_answer(_service(chunks, Call()), profile, []))
+    assert _truncations(profile.name) == before + 1
+
+
+def test_client_leaving_cancels_the_call():
+    profile = get_profile("voice")
+    chunks = [_chunk(WORD * 10, 10 * (i + 1)) for i in range(5)]
+    call, usage = Call(), []
+
+    async def scenario():
+        stream = _service(chunks, call).chat_stream("halo", [], "", on_usage=usage.append, profile=profile)
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert call.cancelled
+    assert [u.completion_tokens for u in usage] == [10]
+
+
+@pytest.mark.parametrize("text, chars, cut", [
+    ("pinjaman modal usaha", 100, "pinjaman modal usaha"),
+    ("pinjaman modal usaha", 11, "pinjaman"),
+    ("pinjaman modal usaha", 15, "pinjaman modal"),
+    ("pinjaman modal usaha", 14, "pinjaman modal"),
+    ("pinjaman", 4, ""),
+    ("pinjaman\nmodal", 10, "pinjaman"),
+])
+def test_cut_at_word(text, chars, cut):
+    assert _cut_at_word(text, chars) == cut
@@ -0,0 +1,103 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services import health
+from app.services.health import DependencyMonitor
+
+API_KEY = "AIza-secret-key"
+
+
+async def _ok():
+    pass
+
+
+async def _failing():
+    request = httpx.Request("GET", f"https://generativelanguage.googleapis.com/v1beta/models/x?key={API_KEY}")
+    raise httpx.HTTPStatusError("503 Service Unavailable", request=request, response=httpx.Response(503, request=request))
+
+
+def _monitor(**checks) -> DependencyMonitor:
+    monitor = DependencyMonitor(interval=60, timeout=1)
+    monitor.register("supabase", checks.pop("supabase", _ok), critical=True)
+    for name, check in checks.items():
+        monitor.register(name, check)
+    return monitor
+
+
+def test_probe_errors_keep_only_type_and_status():
+    monitor = _monitor(gemini=_failing)
+    asyncio.run(monitor.probe_all())
+    error = monitor.status["gemini"]["error"]
+    assert error == "HTTPStatusError: 503"
+    assert API_KEY not in repr(monitor.report())
+
+
+def test_gemini_key_is_sent_in_a_header(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(200, json={})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(health, "get_http_client", lambda: client)
+    monkeypatch.setattr(health, "get_settings", lambda: type("Settings", (), {
+        "gemini_api_endpoint": "", "gemini_api_key": API_KEY,
+    }))
+    asyncio.run(health.check_gemini())
+    assert seen[0].headers["x-goog-api-key"] == API_KEY
+    assert API_KEY not in str(seen[0].url)
+
+
+def test_provider_failure_does_not_fail_readiness():
+    monitor = _monitor(gemini=_failing, groq=_ok)
+    asyncio.run(monitor.probe_all())
+    assert monitor.healthy
+    assert monitor.degraded
+    assert monitor.report()["dependencies"]["gemini"]["critical"] is False
+
+
+def test_database_failure_fails_readiness():
+    monitor = _monitor(supabase=_failing, gemini=_ok)
+    asyncio.run(monitor.probe_all())
+    assert not monitor.healthy
+
+
+def test_unprobed_database_is_not_ready():
+    assert not _monitor().healthy
+
+
+@pytest.fixture
+def ready_app(monkeypatch):
+    import main
+
+    monitor = _monitor(gemini=_failing)
+    monkeypatch.setattr(main, "get_dependency_monitor", lambda: monitor)
+    monkeypatch.setattr(main.app.state, "ready", True, raising=False)
+    monkeypatch.setattr(main.app.state, "startup_error", None, raising=False)
+    return TestClient(main.app), monitor
+
+
+def test_ready_endpoint(ready_app):
+    client, monitor = ready_app
+    asyncio.run(monitor.probe_all())
+
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "degraded"
+    assert response.json()["dependencies"]["gemini"]["error"] == "HTTPStatusError: 503"
+
+    monitor.start_draining()
+    assert client.get("/ready").status_code == 503
+
+
+def test_ready_endpoint_without_database(ready_app):
+    client, monitor = ready_app
+    monitor.register("supabase", _failing, critical=True)
+    asyncio.run(monitor.probe_all())
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "unavailable"
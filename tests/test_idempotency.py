@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.idempotency import IdempotencyStore, fingerprint
+
+USER_ID = "5f0c6d8e-1b2a-4c3d-9e8f-0a1b2c3d4e5f"
+
+
+async def _answer(gate: asyncio.Event):
+    yield "data: 1\n\n"
+    await gate.wait()
+    yield "data: 2\n\n"
+
+
+async def _collect(stream):
+    return [event async for event in stream]
+
+
+def test_fingerprint_tells_requests_apart():
+    assert fingerprint("thread", "hi") == fingerprint("thread", "hi")
+    assert fingerprint("thread", "hi") != fingerprint("thread", "hello")
+    assert fingerprint("ab", "c") != fingerprint("a", "bc")
+    assert fingerprint(b"audio") != fingerprint(b"other audio")
+
+
+def test_without_a_key_nothing_is_kept():
+    async def scenario():
+        store = IdempotencyStore(max_entries=10, ttl=60)
+        assert store.begin(USER_ID, "chat", None, "fp") == (None, False)
+        gate = asyncio.Event()
+        gate.set()
+        assert await _collect(store.run(None, _answer(gate))) == ["data: 1\n\n", "data: 2\n\n"]
+        assert len(store._turns) == 0
+
+    asyncio.run(scenario())
+
+
+def test_retry_replays_a_finished_turn():
+    async def scenario():
+        store = IdempotencyStore(max_entries=10, ttl=60)
+        turn, replayed = store.begin(USER_ID, "chat", "key-1", "fp")
+        assert not replayed
+        gate = asyncio.Event()
+        gate.set()
+        first = await _collect(store.run(turn, _answer(gate)))
+
+        again, replayed = store.begin(USER_ID, "chat", "key-1", "fp")
+        assert replayed and again is turn
+        assert await _collect(again.replay()) == first == ["data: 1\n\n", "data: 2\n\n"]
+
+    asyncio.run(scenario())
+
+
+def test_retry_follows_a_running_turn():
+    async def scenario():
+        store = IdempotencyStore(max_entries=10, ttl=60)
+        turn, _ = store.begin(USER_ID, "chat", "key-1", "fp")
+        gate = asyncio.Event()
+        store.run(turn, _answer(gate))  # the original client went away
+        await asyncio.sleep(0)
+
+        retry, replayed = store.begin(USER_ID, "chat", "key-1", "fp")
+        assert replayed
+        following = asyncio.create_task(_collect(retry.replay()))
+        await asyncio.sleep(0)
+        assert not following.done()
+        gate.set()
+        assert await following == ["data: 1\n\n", "data: 2\n\n"]
+        assert turn.done
+
+    asyncio.run(scenario())
+
+
+def test_key_reused_for_another_request_conflicts():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    store.begin(USER_ID, "chat", "key-1", fingerprint("hi"))
+    with pytest.raises(HTTPException) as error:
+        store.begin(USER_ID, "chat", "key-1", fingerprint("hello"))
+    assert error.value.status_code == 422
+
+
+def test_keys_are_scoped_to_user_and_endpoint():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    store.begin(USER_ID, "chat", "key-1", "fp")
+    assert store.begin("other-user", "chat", "key-1", "other")[1] is False
+    assert store.begin(USER_ID, "stt", "key-1", "other")[1] is False
+
+
+def test_oldest_finished_key_is_evicted_beyond_max_entries():
+    async def scenario():
+        store = IdempotencyStore(max_entries=2, ttl=60)
+        gate = asyncio.Event()
+        gate.set()
+        for key in ("key-1", "key-2", "key-3"):
+            turn, _ = store.begin(USER_ID, "chat", key, "fp")
+            await _collect(store.run(turn, _answer(gate)))
+        assert store.begin(USER_ID, "chat", "key-1", "fp")[1] is False
+        assert store.begin(USER_ID, "chat", "key-3", "fp")[1] is True
+
+    asyncio.run(scenario())
+
+
+def test_running_turns_are_never_evicted():
+    async def scenario():
+        store = IdempotencyStore(max_entries=1, ttl=0)
+        running, _ = store.begin(USER_ID, "chat", "running", "fp")
+        store.run(running, _answer(asyncio.Event()))
+        gate = asyncio.Event()
+        gate.set()
+        for key in ("key-1", "key-2"):
+            turn, _ = store.begin(USER_ID, "chat", key, "fp")
+            await _collect(store.run(turn, _answer(gate)))
+
+        retry, replayed = store.begin(USER_ID, "chat", "running", "fp")
+        assert replayed and retry is running
+        await store.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failure_before_streaming_forgets_the_turn():
+    async def scenario():
+        store = IdempotencyStore(max_entries=10, ttl=60)
+        turn, _ = store.begin(USER_ID, "chat", "key-1", "fp")
+        with pytest.raises(HTTPException), store.preparing(turn):
+            raise HTTPException(status_code=404, detail="Thread not found")
+        # a retry waiting on the failed turn gets the error, a new one runs again
+        assert turn.done
+        assert await _collect(turn.replay()) == ['data: {"type": "error", "content": "Thread not found"}\n\n']
+        assert store.begin(USER_ID, "chat", "key-1", "fp")[1] is False
+
+    asyncio.run(scenario())
+
+
+def test_stop_cancels_running_turns():
+    async def scenario():
+        store = IdempotencyStore(max_entries=10, ttl=60)
+        turn, _ = store.begin(USER_ID, "chat", "key-1", "fp")
+        store.run(turn, _answer(asyncio.Event()))
+        await asyncio.sleep(0)
+        await store.stop()
+        assert turn.done
+        assert turn.events == ["data: 1\n\n"]
+
+    asyncio.run(scenario())
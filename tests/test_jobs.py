@@ -0,0 +1,156 @@
+import asyncio
+import io
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+
+from app.services import jobs
+from app.services.jobs import BatchJobService
+
+
+@pytest.fixture(autouse=True)
+def pipeline(monkeypatch):
+    """STT returns the uploaded bytes as text; b"broken" fails"""
+    async def preprocess(data, content_type=None, filename=None):
+        return data
+
+    async def transcribe(audio, stt_model=None, language=None, on_usage=None):
+        if audio == b"broken":
+            raise HTTPException(status_code=502, detail="STT failed")
+        return audio.decode()
+
+    async def complete(messages, llm_model=None, on_usage=None, profile=None):
+        for word in ("Jawaban", " untuk ", messages[-1]["content"].split("\n")[1]):
+            yield word
+
+    monkeypatch.setattr(jobs, "preprocess_audio", preprocess)
+    monkeypatch.setattr(jobs, "transcribe_cached", transcribe)
+    monkeypatch.setattr(jobs, "stream_llm_completion", complete)
+
+
+def upload(data: bytes, filename: str = "voice.wav", content_type: str = "audio/wav") -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=filename, headers=Headers({"content-type": content_type}))
+
+
+async def finish(service: BatchJobService) -> None:
+    await asyncio.wait_for(service._queue.join(), 5)
+
+
+def test_job_runs_to_completion(tmp_path):
+    async def run():
+        service = BatchJobService(tmp_path, concurrency=2, retention_days=0)
+        user = uuid4()
+        await service.start()
+        job = await service.create_job(user, [upload(b"halo"), upload(b"broken", "b.ogg", "audio/ogg")])
+        assert (job["status"], job["total"], job["pending"]) == ("processing", 2, 2)
+
+        await finish(service)
+        job = await service.get_job(job["id"], user)
+        assert (job["status"], job["completed"], job["failed"]) == ("completed", 2, 1)
+        first, second = await service.get_results(job["id"], user)
+        assert (first["transcript"], first["llm_text"]) == ("halo", "Jawaban untuk halo")
+        assert (second["filename"], second["status"], second["error"]) == ("b.ogg", "failed", "STT failed")
+        assert [page["index"] for page in await service.get_results(job["id"], user, offset=1, limit=5)] == [1]
+        await service.stop()
+
+    asyncio.run(run())
+
+
+def test_jobs_are_private(tmp_path):
+    async def run():
+        service = BatchJobService(tmp_path, concurrency=0, retention_days=0)
+        owner, other = uuid4(), uuid4()
+        job = await service.create_job(owner, [upload(b"halo")])
+        assert await service.get_job(job["id"], other) is None
+        assert await service.get_results(job["id"], other) is None
+        assert await service.get_user_jobs(other) == []
+        assert [listed["id"] for listed in await service.get_user_jobs(owner)] == [job["id"]]
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("files", [
+    [],
+    [upload(b"x", "notes.txt", "text/plain")],
+    [upload(b"x")] * (jobs.BATCH_MAX_FILES + 1),
+])
+def test_invalid_uploads_are_rejected(tmp_path, files):
+    service = BatchJobService(tmp_path, concurrency=0, retention_days=0)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(service.create_job(uuid4(), files))
+    assert error.value.status_code == 400
+    assert not any(tmp_path.iterdir())
+
+
+def test_unfinished_items_resume_after_restart(tmp_path):
+    user = uuid4()
+
+    async def submit():
+        service = BatchJobService(tmp_path, concurrency=0, retention_days=0)
+        return await service.create_job(user, [upload(b"satu"), upload(b"dua")])
+
+    job = asyncio.run(submit())
+
+    async def restart():
+        service = BatchJobService(tmp_path, concurrency=1, retention_days=0)
+        await service.start()
+        await finish(service)
+        status = await service.get_job(job["id"], user)
+        await service.stop()
+        return status
+
+    assert asyncio.run(restart())["status"] == "completed"
+
+
+def test_item_locked_by_another_process_is_skipped(tmp_path):
+    async def run():
+        service = BatchJobService(tmp_path, concurrency=0, retention_days=0)
+        user = uuid4()
+        job = await service.create_job(user, [upload(b"halo")])
+        lock = jobs._claim(tmp_path / job["id"] / "0.lock")
+        try:
+            await service._process_item(job["id"], 0)
+            assert (await service.get_job(job["id"], user))["pending"] == 1
+        finally:
+            lock.close()
+        await service._process_item(job["id"], 0)
+        assert (await service.get_job(job["id"], user))["status"] == "completed"
+
+    asyncio.run(run())
+
+
+def test_expired_jobs_are_deleted(tmp_path):
+    service = BatchJobService(tmp_path, concurrency=0, retention_days=7)
+    user = uuid4()
+    old = asyncio.run(service.create_job(user, [upload(b"lama")]))
+    new = asyncio.run(service.create_job(user, [upload(b"baru")]))
+    manifest_path = tmp_path / old["id"] / "job.json"
+    manifest = json.loads(manifest_path.read_text())
+    manifest["created_at"] = (datetime.utcnow() - timedelta(days=8)).isoformat()
+    manifest_path.write_text(json.dumps(manifest))
+    # an upload that never got its manifest
+    orphan = tmp_path / "orphan"
+    orphan.mkdir()
+    os.utime(orphan, (time.time() - 8 * 86400,) * 2)
+
+    assert service.cleanup() == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == [new["id"]]
+    assert BatchJobService(tmp_path, concurrency=0, retention_days=0).cleanup() == 0
+
+
+def test_oversized_file_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_UPLOAD_BYTES", 100)
+    service = BatchJobService(tmp_path, concurrency=0, retention_days=0)
+    # size unknown up front: caught while spooling, and the partial job removed
+    files = [upload(b"x" * 50), upload(b"x" * 101)]
+    files[1].size = None
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(service.create_job(uuid4(), files))
+    assert error.value.status_code == 413
+    assert not any(tmp_path.iterdir())
@@ -0,0 +1,86 @@
+import pytest
+
+from app.services.knowledge import DEFAULT_INSTRUCTION, KnowledgeBase, tokenize
+from app.settings import get_settings
+
+SOURCES = {
+    "core": "---\nalways: true\nkeywords: amartha ojk kantor\n---\nAnda adalah asisten Amartha. Diawasi OJK.",
+    "pinjaman": "---\norder: 1\ntitle: Pinjaman\nkeywords: pinjaman modal cicilan\n---\nPinjaman modal usaha untuk mitra.",
+    "celengan": "---\norder: 2\ntitle: Celengan\nkeywords: celengan investasi bunga\n---\nCelengan investasi dengan imbal hasil.",
+    "top_up": "---\norder: 3\ntitle: Top Up\nkeywords: top up saldo pocket\n---\nIsi saldo pocket lewat virtual account.",
+    "title": "---\nkind: prompt\n---\nTitle for: {message}",
+}
+
+
+@pytest.fixture
+def kb():
+    return KnowledgeBase(SOURCES, top_k=2, min_score=1.0)
+
+
+def names(sections):
+    return [section.name for section in sections]
+
+
+def test_tokenize_drops_stopwords_and_clitics():
+    assert tokenize("Berapa bunganya, kak?") == ["bunga"]
+    assert tokenize("Apakah pinjamannya bisa?") == ["pinjaman"]
+
+
+def test_topic_question_gets_its_section(kb):
+    assert names(kb.retrieve("mau ajukan pinjaman modal")) == ["pinjaman"]
+    assert names(kb.retrieve("cara isi saldo pocket")) == ["top_up"]
+
+
+def test_sections_keep_document_order(kb):
+    assert names(kb.retrieve("saldo pocket untuk celengan")) == ["celengan", "top_up"]
+
+
+def test_core_question_gets_no_sections(kb):
+    assert kb.retrieve("apakah amartha diawasi ojk") == []
+
+
+def test_unmatched_question_gets_everything(kb):
+    assert names(kb.retrieve("halo kak")) == ["pinjaman", "celengan", "top_up"]
+
+
+def test_follow_up_keeps_the_previous_topic(kb):
+    history = [
+        {"role": "user", "content": "mau tanya celengan"},
+        {"role": "model", "content": "Celengan adalah investasi."},
+    ]
+    assert names(kb.retrieve("minimalnya berapa", history)) == ["celengan"]
+
+
+def test_system_instruction(kb):
+    default = kb.system_instruction(DEFAULT_INSTRUCTION, "mau ajukan pinjaman modal")
+    assert default == kb.compose([kb.sections[0]])
+    assert "Celengan" not in default
+    # threads created before the marker stored the core verbatim
+    assert kb.system_instruction(kb.core, "mau ajukan pinjaman modal") == default
+    assert kb.system_instruction(None, "halo") == kb.full_text
+    assert kb.system_instruction("Jawab singkat saja.", "pinjaman") == "Jawab singkat saja."
+
+
+def test_version_is_a_content_hash():
+    assert KnowledgeBase(SOURCES, 2, 1.0).version == KnowledgeBase(dict(SOURCES), 2, 1.0).version
+    changed = dict(SOURCES, pinjaman=SOURCES["pinjaman"] + " Bunga rendah.")
+    assert KnowledgeBase(changed, 2, 1.0).version != KnowledgeBase(SOURCES, 2, 1.0).version
+
+
+@pytest.mark.parametrize("missing", ["core", "title"])
+def test_incomplete_sources_are_rejected(missing):
+    sources = {name: text for name, text in SOURCES.items() if name != missing}
+    with pytest.raises(ValueError):
+        KnowledgeBase(sources, 2, 1.0)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("berapa bunga celengan per tahun?", "celengan"),
+    ("syarat pengajuan pinjaman modal usaha", "pinjaman"),
+    ("bagaimana cara top up pocket?", "top_up"),
+    ("transaksi pulsa saya gagal, mau komplain", "eskalasi"),
+])
+def test_bundled_knowledge(question, expected):
+    settings = get_settings()
+    kb = KnowledgeBase.from_dir(settings.knowledge_dir, settings.kb_top_k, settings.kb_min_score)
+    assert expected in names(kb.retrieve(question))
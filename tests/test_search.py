@@ -0,0 +1,33 @@
+from app.services.search import InvertedIndex
+
+
+def _index(*documents: str) -> InvertedIndex:
+    index = InvertedIndex()
+    for document in documents:
+        index.add(document.split())
+    return index
+
+
+def test_every_query_term_must_match():
+    index = _index("modal usaha mikro", "modal kerja", "usaha warung")
+    assert [doc_id for doc_id, _ in index.search(["modal", "usaha"], limit=10)] == [0]
+    assert index.search(["modal", "pulsa"], limit=10) == []
+    assert index.search([], limit=10) == []
+
+
+def test_rarer_and_repeated_terms_rank_higher():
+    index = _index("celengan celengan celengan", "celengan pocket", "pocket saldo", "saldo")
+    hits = index.search(["celengan"], limit=10)
+    assert [doc_id for doc_id, _ in hits] == [0, 1]
+    assert hits[0][1] > hits[1][1] > 0
+
+
+def test_shorter_documents_rank_higher():
+    index = _index("pinjaman", "pinjaman modal usaha mikro untuk warung")
+    assert [doc_id for doc_id, _ in index.search(["pinjaman"], limit=10)] == [0, 1]
+
+
+def test_limit_and_duplicate_query_terms():
+    index = _index("saldo", "saldo pocket", "saldo celengan")
+    assert len(index.search(["saldo"], limit=2)) == 2
+    assert index.search(["saldo", "saldo"], limit=10) == index.search(["saldo"], limit=10)
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.singleflight import SingleFlight
+
+
+class Upstream:
+    """Blocking read that waits until the test lets it return"""
+
+    def __init__(self, result=None):
+        self.result = result if result is not None else {"id": "t1"}
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self, *args):
+        self.calls += 1
+        self.release.wait(timeout=5)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+async def _started(flight, upstream, count, key=("t1",)):
+    tasks = [asyncio.create_task(flight.call("get_thread", key, upstream)) for _ in range(count)]
+    await asyncio.sleep(0)  # every caller has joined or started the call
+    return tasks
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        tasks = await _started(flight, upstream, 5)
+        upstream.release.set()
+        results = await asyncio.gather(*tasks)
+        assert upstream.calls == 1
+        assert all(result == {"id": "t1"} for result in results)
+        # each caller may change its rows without touching the others'
+        assert len({id(result) for result in results}) == 5
+        assert not flight._calls
+
+    asyncio.run(scenario())
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        upstream.release.set()
+        await asyncio.gather(
+            flight.call("get_thread", ("t1",), upstream),
+            flight.call("get_thread", ("t2",), upstream),
+            flight.call("get_user_threads", ("t1",), upstream),
+        )
+        assert upstream.calls == 3
+
+    asyncio.run(scenario())
+
+
+def test_calls_after_completion_run_again():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        upstream.release.set()
+        await flight.call("get_thread", ("t1",), upstream)
+        await flight.call("get_thread", ("t1",), upstream)
+        assert upstream.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_forget_starts_a_fresh_call():
+    async def scenario():
+        flight, stale = SingleFlight(), Upstream({"title": "old"})
+        before = await _started(flight, stale, 1, key=("t1", "u1"))
+        flight.forget("get_thread", "t1")
+        fresh = Upstream({"title": "new"})
+        fresh.release.set()
+        after = await flight.call("get_thread", ("t1", "u1"), fresh)
+        stale.release.set()
+        assert after == {"title": "new"}
+        assert await before[0] == {"title": "old"}
+        assert (stale.calls, fresh.calls) == (1, 1)
+        assert not flight._calls
+
+    asyncio.run(scenario())
+
+
+def test_forget_matches_key_prefix_and_operation():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        tasks = []
+        for operation, key in [("get_thread", ("t1", "u1")), ("get_thread", ("t2", "u1")), ("get_messages", ("t1",))]:
+            tasks.append(asyncio.create_task(flight.call(operation, key, upstream)))
+        await asyncio.sleep(0)
+        flight.forget("get_thread", "t1")
+        assert set(flight._calls) == {("get_thread", ("t2", "u1")), ("get_messages", ("t1",))}
+        upstream.release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_caller_and_are_not_kept():
+    async def scenario():
+        flight, failing = SingleFlight(), Upstream(RuntimeError("upstream down"))
+        tasks = await _started(flight, failing, 3)
+        failing.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert failing.calls == 1
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        working = Upstream()
+        working.release.set()
+        assert await flight.call("get_thread", ("t1",), working) == {"id": "t1"}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_the_call():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        leaving, staying = await _started(flight, upstream, 2)
+        leaving.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        assert await staying == {"id": "t1"}
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+
+    asyncio.run(scenario())
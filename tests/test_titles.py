@@ -0,0 +1,30 @@
+import pytest
+
+from app.services.titles import FALLBACK_TITLE, MAX_TITLE_WORDS, extract_title
+
+
+@pytest.mark.parametrize("message, title", [
+    ("Bagaimana cara mengajukan pinjaman modal usaha?", "Pengajuan Pinjaman Modal Usaha"),
+    ("Berapa imbal hasil Celengan Pendidikan Anak?", "Imbal Hasil Celengan Pendidikan Anak"),
+    ("isi saldo lewat virtual account gagal terus", "Kendala Top Up Virtual Account"),
+    ("Apa bedanya Pocket dan AmarthaLink?", "Perbedaan Pocket AmarthaLink"),
+    ("siapa CEO Amartha sekarang", "CEO Amartha"),
+])
+def test_title_from_intent_and_products(message, title):
+    assert extract_title(message) == title
+
+
+def test_response_is_used_for_audio_only_messages():
+    assert extract_title("[Audio message]", "Cara top up Pocket") == "Cara Top Up Pocket"
+    assert extract_title("Syarat daftar agen?", "Cara top up Pocket") == "Pendaftaran Agen"
+
+
+def test_fallback_when_nothing_is_said():
+    assert extract_title("[Audio message]") == FALLBACK_TITLE
+    assert extract_title("halo") == FALLBACK_TITLE
+    assert extract_title("") == FALLBACK_TITLE
+
+
+def test_titles_are_short():
+    title = extract_title("Celengan, Pocket, AmarthaLink, AmarthaFin, Pulsa, Paket Data dan Majelis")
+    assert len(title.split()) <= MAX_TITLE_WORDS
@@ -0,0 +1,104 @@
+from array import array
+
+import pytest
+
+from app.services.vad import SAMPLE_WIDTH, VoiceActivitySegmenter, frame_rms, pcm_to_wav
+
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000 * SAMPLE_WIDTH
+
+
+def _audio(ms: int, amplitude: int = 0) -> bytes:
+    """Square wave whose RMS energy is `amplitude`"""
+    samples = SAMPLE_RATE * ms // 1000
+    return array("h", [amplitude if i % 2 else -amplitude for i in range(samples)]).tobytes()
+
+
+def _segmenter(**overrides) -> VoiceActivitySegmenter:
+    options = {
+        "sample_rate": SAMPLE_RATE,
+        "frame_ms": FRAME_MS,
+        "energy_threshold": 500,
+        "noise_ratio": 3.0,
+        "segment_silence_ms": 100,
+        "utterance_silence_ms": 300,
+        "max_segment_ms": 1000,
+        "pre_roll_ms": 40,
+    }
+    options.update(overrides)
+    return VoiceActivitySegmenter(**options)
+
+
+def _types(events):
+    return [event.type for event in events]
+
+
+def test_frame_rms():
+    assert frame_rms(b"") == 0.0
+    assert frame_rms(_audio(FRAME_MS, 1000)) == pytest.approx(1000)
+
+
+def test_speech_then_pause_ends_the_utterance():
+    segmenter = _segmenter()
+    audio = _audio(200) + _audio(400, 3000) + _audio(400)
+    events = segmenter.feed(audio)
+    assert _types(events) == ["segment", "end_of_utterance"]
+    # pre-roll + speech + the pause that closed the segment
+    assert len(events[0].pcm) == (2 + 20 + 5) * FRAME_BYTES
+    assert segmenter.flush() == []
+
+
+def test_short_pause_only_closes_the_segment():
+    segmenter = _segmenter()
+    events = segmenter.feed(_audio(300, 3000) + _audio(160) + _audio(300, 3000))
+    assert _types(events) == ["segment"]
+    assert _types(segmenter.flush()) == ["segment", "end_of_utterance"]
+
+
+def test_long_speech_is_split_at_max_segment():
+    segmenter = _segmenter()
+    events = segmenter.feed(_audio(1500, 3000))
+    assert _types(events) == ["segment"]
+    assert len(events[0].pcm) == 50 * FRAME_BYTES
+    tail = segmenter.flush()
+    assert _types(tail) == ["segment", "end_of_utterance"]
+    assert len(tail[0].pcm) == 25 * FRAME_BYTES
+
+
+def test_chunking_does_not_change_the_result():
+    audio = _audio(200) + _audio(400, 3000) + _audio(400)
+    whole = _segmenter().feed(audio)
+    segmenter = _segmenter()
+    pieces = []
+    for start in range(0, len(audio), 333):
+        pieces.extend(segmenter.feed(audio[start:start + 333]))
+    assert _types(pieces) == _types(whole)
+    assert [event.pcm for event in pieces] == [event.pcm for event in whole]
+
+
+def test_silence_and_steady_noise_are_not_speech():
+    segmenter = _segmenter()
+    # above the fixed threshold, but not three times the noise floor
+    assert segmenter.feed(_audio(400, 400) + _audio(400, 1000)) == []
+    assert segmenter.flush() == []
+
+
+def test_flush_keeps_a_partial_frame_of_speech():
+    segmenter = _segmenter()
+    segmenter.feed(_audio(100, 3000) + _audio(10, 3000))
+    events = segmenter.flush()
+    assert _types(events) == ["segment", "end_of_utterance"]
+    assert len(events[0].pcm) == 5 * FRAME_BYTES + FRAME_BYTES // 2
+
+
+@pytest.mark.parametrize("sample_rate", [0, 10])
+def test_rate_without_samples_per_frame_is_rejected(sample_rate):
+    with pytest.raises(ValueError):
+        _segmenter(sample_rate=sample_rate)
+
+
+def test_pcm_to_wav():
+    wav = pcm_to_wav(_audio(100, 3000), SAMPLE_RATE)
+    assert wav[:4] == b"RIFF" and wav[8:12] == b"WAVE"
+    assert len(wav) == 44 + 100 * SAMPLE_RATE // 1000 * SAMPLE_WIDTH
@@ -0,0 +1,31 @@
+import asyncio
+import json
+from uuid import uuid4
+
+from app.routers.voice import VoiceSession
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(json.loads(text))
+
+
+async def transcript(text: str) -> str:
+    return text
+
+
+def test_silent_utterance_ends_the_turn_with_an_error():
+    async def run():
+        websocket = FakeWebSocket()
+        session = VoiceSession(websocket, uuid4(), thread_service=None, sample_rate=16000,
+                               stt_model=None, llm_model=None)
+        tasks = [asyncio.create_task(transcript(" ")), asyncio.create_task(transcript(""))]
+        await session.run_turn(tasks, b"")
+        return websocket.sent, session
+
+    sent, session = asyncio.run(run())
+    assert sent == [{"type": "error", "content": "No speech detected"}]
+    assert session.thread_uuid is None and session.history == []